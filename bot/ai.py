@@ -1,56 +1,93 @@
-import asyncio
+import json
 import re
-from difflib import SequenceMatcher
-from typing import Optional
-from groq import Groq
-from bot.config import GROQ_API_KEY, SYSTEM_PROMPT, MODEL_NAME, MAX_TOKENS, TEMPERATURE, logger
+import time
+import zlib
+from functools import lru_cache
+from typing import Awaitable, Callable, Optional, Sequence
+import httpx
+from groq import AsyncGroq, DefaultAsyncHttpxClient, Groq
+from bot.config import (
+    GROQ_API_KEY,
+    SYSTEM_PROMPT,
+    MODEL_NAME,
+    MODEL_ROUTES,
+    FAST_MODEL_NAME,
+    LLM_SLO_P95_MS,
+    LLM_SLO_COOLDOWN_SECONDS,
+    MAX_TOKENS,
+    TEMPERATURE,
+    LLM_MAX_CONCURRENCY,
+    LLM_TIMEOUT_SECONDS,
+    PROMPT_TOKEN_BUDGET,
+    PROMPT_LAYOUT,
+    SUMMARY_MODEL,
+    STREAM_EARLY_STOP,
+    logger,
+)
+from bot.context_builder import message_tokens, pack_messages
+from bot.llm import EarlyStopStats, LLMGovernor, ModelRouter, PartialForwarder, PromptLayoutStats
 from bot.persona import build_persona_constitution, build_choreography_instruction
+from bot.similarity import reply_similarity
+from bot.text_analysis import analyze
 
 # ---------------- GROQ CLIENT ---------------- #
 
 client = Groq(api_key=GROQ_API_KEY)
 
+# Shared keep-alive connection pool for every async request; sized to the
+# governor so queued requests wait for a slot, not for a socket.
+async_client = AsyncGroq(
+    api_key=GROQ_API_KEY,
+    timeout=LLM_TIMEOUT_SECONDS,
+    http_client=DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONCURRENCY,
+            max_keepalive_connections=LLM_MAX_CONCURRENCY,
+        ),
+    ),
+)
+llm_governor = LLMGovernor(LLM_MAX_CONCURRENCY)
+early_stop_stats = EarlyStopStats()
+prompt_layout_stats = PromptLayoutStats()
+model_router = ModelRouter(
+    MODEL_ROUTES,
+    fallback=FAST_MODEL_NAME,
+    slo_p95_ms=LLM_SLO_P95_MS,
+    cooldown_s=LLM_SLO_COOLDOWN_SECONDS,
+)
+
+
+async def close_ai_clients():
+    """Close the async client's connection pool (application shutdown)."""
+    await async_client.close()
+
 
 # ---------------- AI RESPONSE ---------------- #
 
 
 def _get_response_style(latest_user_text: str, memory_messages: list[dict]) -> tuple[str, int, str]:
     """Choose short/medium/long reply style and token budget from user intent."""
-    text = (latest_user_text or "").strip()
-    lowered = text.lower()
-    words = re.findall(r"\b\w+\b", lowered)
-    word_count = len(words)
-    char_count = len(text)
-    question_count = text.count("?")
+    features = analyze(latest_user_text)
 
     # Fall back to medium when we do not have enough signal.
-    if not text:
+    if not features.text:
         return (
             "Reply in a medium length by default: 3-6 short sentences (around 80-160 words).",
             min(MAX_TOKENS, 320),
             "medium",
         )
 
-    short_intent_patterns = (
-        r"\b(short|brief|quick|concise|summary|summarize|tl;dr|tldr|one line|in short|just answer)\b"
-    )
-    long_intent_patterns = (
-        r"\b(long|detailed|detail|deep|in depth|step by step|comprehensive|elaborate|analy[sz]e|explain)\b"
-    )
-
-    asks_short = re.search(short_intent_patterns, lowered) is not None
-    asks_long = re.search(long_intent_patterns, lowered) is not None
-    is_very_short_prompt = word_count <= 8 and char_count <= 45
-    is_large_context_prompt = char_count >= 280 or question_count >= 3
+    is_very_short_prompt = features.word_count <= 8 and features.char_count <= 45
+    is_large_context_prompt = features.char_count >= 280 or features.question_count >= 3
 
-    if asks_short or is_very_short_prompt:
+    if features.asks_short or is_very_short_prompt:
         return (
             "Keep it short: 1-3 sentences, under 60 words, warm and clear.",
             min(MAX_TOKENS, 140),
             "short",
         )
 
-    if asks_long or is_large_context_prompt:
+    if features.asks_long or is_large_context_prompt:
         return (
             "Go deeper when useful: 5-9 sentences, clear structure, still concise (under 280 words).",
             min(MAX_TOKENS, 520),
@@ -73,7 +110,7 @@ def _target_word_limit(style_mode: str) -> int:
     return 160
 
 
-def _quality_scores(reply: str, style_mode: str, previous_assistant_text: str = "") -> dict:
+def _quality_scores(reply: str, style_mode: str, previous_replies: Sequence[str] = ()) -> dict:
     words = re.findall(r"\b\w+\b", reply or "")
     word_count = len(words)
     target = _target_word_limit(style_mode)
@@ -96,8 +133,8 @@ def _quality_scores(reply: str, style_mode: str, previous_assistant_text: str =
         brevity_fit = max(0.2, 1.0 - (overflow / max(20, target)))
 
     repetition_penalty = 0.0
-    if previous_assistant_text.strip() and reply.strip():
-        ratio = SequenceMatcher(None, previous_assistant_text.strip().lower(), reply.strip().lower()).ratio()
+    if previous_replies and reply.strip():
+        ratio = reply_similarity.max_similarity(reply, previous_replies)
         repetition_penalty = max(0.0, ratio - 0.65)
 
     overall = max(0.0, min(1.0, (0.35 * warmth) + (0.35 * clarity) + (0.30 * brevity_fit) - (0.40 * repetition_penalty)))
@@ -120,11 +157,27 @@ def _trim_to_word_limit(text: str, limit: int) -> str:
     return trimmed
 
 
+_SENTENCE_END_RE = re.compile(r"[.!?][\"')\]]*(?=\s|$)")
+
+
+def _cut_at_word_limit(text: str, limit: int) -> Optional[str]:
+    """Once ``text`` runs past ``limit`` words, return it cut at the last sentence end within the limit."""
+    words = list(re.finditer(r"\S+", text or ""))
+    if len(words) <= limit:
+        return None
+    window = text[: words[limit - 1].end()]
+    ends = [m.end() for m in _SENTENCE_END_RE.finditer(window)]
+    # Prefer a sentence boundary unless it would drop more than half of the allowance.
+    if ends and len(window[: ends[-1]].split()) >= limit // 2:
+        return window[: ends[-1]]
+    return _trim_to_word_limit(text, limit)
+
+
 def _apply_quality_refinement(
     reply: str,
     style_mode: str,
     latest_user_text: str,
-    previous_assistant_text: str = "",
+    previous_replies: Sequence[str] = (),
 ) -> tuple[str, dict]:
     refined = (reply or "").strip()
     target_limit = _target_word_limit(style_mode)
@@ -140,12 +193,12 @@ def _apply_quality_refinement(
     ):
         refined = f"I hear you. {refined}"
 
-    if previous_assistant_text.strip():
-        similarity = SequenceMatcher(None, previous_assistant_text.strip().lower(), refined.lower()).ratio()
+    if previous_replies:
+        similarity = reply_similarity.max_similarity(refined, previous_replies)
         if similarity > 0.82:
             refined = f"Thank you for sharing that. {refined}"
 
-    scores = _quality_scores(refined, style_mode, previous_assistant_text=previous_assistant_text)
+    scores = _quality_scores(refined, style_mode, previous_replies=previous_replies)
     logger.info(
         "Reply quality scores: warmth=%.2f clarity=%.2f brevity=%.2f repetition=%.2f overall=%.2f",
         scores["warmth"],
@@ -157,19 +210,42 @@ def _apply_quality_refinement(
     return refined, scores
 
 
-def _latest_assistant_reply(memory_messages: list[dict]) -> str:
+def _recent_assistant_replies(memory_messages: list[dict], limit: int) -> list[str]:
+    """The newest ``limit`` assistant replies, newest first."""
+    replies = []
     for item in reversed(memory_messages):
-        if item.get("role") == "assistant" and item.get("content"):
-            return str(item["content"])
-    return ""
+        if item.get("role") == "assistant" and str(item.get("content") or "").strip():
+            replies.append(str(item["content"]))
+            if len(replies) >= limit:
+                break
+    return replies
 
 
-def get_ai_reply(
+@lru_cache(maxsize=1)
+def _static_prefix() -> tuple[dict, ...]:
+    """System blocks shared by every reply, built once so the bytes never change."""
+    return (
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "system", "content": build_persona_constitution()},
+    )
+
+
+@lru_cache(maxsize=1)
+def _static_prefix_tokens() -> int:
+    return sum(message_tokens(m) for m in _static_prefix())
+
+
+def _build_reply_request(
     memory_messages: list[dict],
-    latest_user_text: str = "",
-    generation_metadata: Optional[dict] = None,
-) -> str:
-    """Generate a reply using the Groq LLM (synchronous — call via asyncio.to_thread)."""
+    latest_user_text: str,
+    generation_metadata: Optional[dict],
+) -> tuple[dict, str, dict]:
+    """Return the chat completion arguments, the style mode and prompt metadata.
+
+    The static prefix comes first, then per-turn guidance in a fixed order
+    (style, choreography, memory hints), then history packed newest-first into
+    what is left of PROMPT_TOKEN_BUDGET.
+    """
     style_instruction, token_budget, style_mode = _get_response_style(latest_user_text, memory_messages)
     generation_metadata = generation_metadata or {}
     ritual_hints = generation_metadata.get("ritual_hints", [])
@@ -180,49 +256,120 @@ def get_ai_reply(
         relational_hints=relational_hints,
     )
 
-    completion = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "system", "content": build_persona_constitution()},
-            {"role": "system", "content": style_instruction},
-            {"role": "system", "content": choreography_instruction},
-            *memory_messages,
-        ],
-        max_tokens=token_budget,
-        temperature=TEMPERATURE,
-    )
-    raw_reply = completion.choices[0].message.content or ""
-    previous_assistant = _latest_assistant_reply(memory_messages)
+    static_blocks = [dict(m) for m in _static_prefix()]
+    dynamic_blocks = [
+        {"role": "system", "content": style_instruction},
+        {"role": "system", "content": choreography_instruction},
+    ]
+    if PROMPT_LAYOUT == "stable":
+        system_blocks = static_blocks + dynamic_blocks
+    else:
+        system_blocks = dynamic_blocks + static_blocks
+    system_tokens = _static_prefix_tokens() + sum(message_tokens(m) for m in dynamic_blocks)
+    history, packing = pack_messages(memory_messages, max(0, PROMPT_TOKEN_BUDGET - system_tokens))
+    if packing["collapsed"] or packing["dropped"]:
+        logger.info(
+            "Prompt over budget: kept %d turns, collapsed %d, dropped %d",
+            packing["kept"],
+            packing["collapsed"],
+            packing["dropped"],
+        )
+
+    route = f"chat_{style_mode}"
+    request = {
+        "model": model_router.choose(route, MODEL_NAME),
+        "messages": [*system_blocks, *history],
+        "max_tokens": token_budget,
+        "temperature": TEMPERATURE,
+    }
+    prefix = system_blocks[0]["content"] + system_blocks[1]["content"]
+    meta = {
+        "route": route,
+        "prompt_tokens": system_tokens + packing["tokens"],
+        "prefix_key": zlib.crc32(prefix.encode("utf-8")),
+    }
+    return request, style_mode, meta
+
+
+def _record_reply_metrics(meta: dict, started: float, usage=None, first_token_ms: Optional[float] = None):
+    elapsed_ms = (time.monotonic() - started) * 1000
+    prompt_layout_stats.record(PROMPT_LAYOUT, meta["prefix_key"], elapsed_ms, usage)
+    if first_token_ms is None:
+        logger.info("LLM reply: prompt≈%d tokens, %.0fms", meta["prompt_tokens"], elapsed_ms)
+    else:
+        logger.info(
+            "LLM reply: prompt≈%d tokens, first token %.0fms, total %.0fms",
+            meta["prompt_tokens"],
+            first_token_ms,
+            elapsed_ms,
+        )
+
+
+def _finish_reply(raw_reply: str, style_mode: str, latest_user_text: str, memory_messages: list[dict]) -> str:
+    previous_replies = _recent_assistant_replies(memory_messages, reply_similarity.window)
     refined_reply, _scores = _apply_quality_refinement(
         raw_reply,
         style_mode=style_mode,
         latest_user_text=latest_user_text,
-        previous_assistant_text=previous_assistant,
+        previous_replies=previous_replies,
     )
+    # Fingerprint the reply now; it is the "previous reply" of the next turn.
+    reply_similarity.signature(refined_reply)
     return refined_reply
 
 
+def get_ai_reply(
+    memory_messages: list[dict],
+    latest_user_text: str = "",
+    generation_metadata: Optional[dict] = None,
+) -> str:
+    """Generate a reply using the Groq LLM (synchronous client)."""
+    request, style_mode, meta = _build_reply_request(memory_messages, latest_user_text, generation_metadata)
+    started = time.monotonic()
+    with model_router.track(meta["route"], request["model"]):
+        completion = client.chat.completions.create(**request)
+    _record_reply_metrics(meta, started, getattr(completion, "usage", None))
+    raw_reply = completion.choices[0].message.content or ""
+    return _finish_reply(raw_reply, style_mode, latest_user_text, memory_messages)
+
+
 async def get_ai_reply_async(
     memory_messages: list[dict],
     latest_user_text: str = "",
     generation_metadata: Optional[dict] = None,
 ) -> str:
-    """Async wrapper around get_ai_reply."""
-    return await asyncio.to_thread(get_ai_reply, memory_messages, latest_user_text, generation_metadata)
+    """Generate a reply on the shared async client, within the concurrency limit."""
+    request, style_mode, meta = _build_reply_request(memory_messages, latest_user_text, generation_metadata)
+    async with llm_governor.slot():
+        started = time.monotonic()
+        with model_router.track(meta["route"], request["model"]):
+            completion = await async_client.chat.completions.create(**request)
+    _record_reply_metrics(meta, started, getattr(completion, "usage", None))
+    raw_reply = completion.choices[0].message.content or ""
+    return _finish_reply(raw_reply, style_mode, latest_user_text, memory_messages)
 
 
-def generate_checkin_message(slot: str, first_name: str = "", recent_messages: Optional[list[dict]] = None) -> str:
-    """Generate a varied, human check-in message for scheduled outreach."""
-    name = (first_name or "").strip()
-    recent_messages = recent_messages or []
+_CHECKIN_SYSTEM_PROMPT = (
+    "You write caring check-in messages that feel personal and grounded. "
+    "Avoid repetitive openings and avoid sounding scripted."
+)
+
 
-    recent_user_bits = []
-    for item in reversed(recent_messages):
+def _recent_user_bits(recent_messages: Optional[list[dict]]) -> list[str]:
+    """The user's last two messages, newest first."""
+    bits = []
+    for item in reversed(recent_messages or []):
         if item.get("role") == "user" and item.get("content"):
-            recent_user_bits.append(item["content"].strip())
-        if len(recent_user_bits) >= 2:
+            bits.append(item["content"].strip())
+        if len(bits) >= 2:
             break
+    return bits
+
+
+def _build_checkin_request(slot: str, first_name: str = "", recent_messages: Optional[list[dict]] = None) -> dict:
+    """Return the chat completion arguments for one check-in message."""
+    name = (first_name or "").strip()
+    recent_user_bits = _recent_user_bits(recent_messages)
 
     memory_line = ""
     if recent_user_bits:
@@ -245,24 +392,254 @@ def generate_checkin_message(slot: str, first_name: str = "", recent_messages: O
     if memory_line:
         prompt += "\n" + memory_line
 
-    completion = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[
+    return {
+        "model": model_router.choose("checkin", MODEL_NAME),
+        "messages": [
+            {"role": "system", "content": _CHECKIN_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        "max_tokens": 120,
+        "temperature": 0.9,
+    }
+
+
+async def stream_ai_reply(
+    memory_messages: list[dict],
+    latest_user_text: str = "",
+    generation_metadata: Optional[dict] = None,
+    on_partial: Optional[Callable[[str], Awaitable[None]]] = None,
+    early_stop: bool = STREAM_EARLY_STOP,
+) -> str:
+    """Stream a reply, passing ``on_partial(raw_text_so_far)`` the text as tokens arrive.
+
+    ``on_partial`` runs outside the LLM slot, in its own task; while it is
+    busy, newer partials replace older ones. It has seen the final raw text
+    by the time this returns.
+
+    With ``early_stop`` the request is cancelled at a sentence boundary as soon
+    as the reply passes the style's word limit, since refinement would trim the
+    rest anyway. Quality refinement only applies to the finished text.
+    """
+    request, style_mode, meta = _build_reply_request(memory_messages, latest_user_text, generation_metadata)
+    word_limit = _target_word_limit(style_mode)
+    raw_reply = ""
+    tokens = 0
+    first_token_at = last_token_at = 0.0
+    stopped = False
+    usage = None
+    # Partials go to on_partial from another task, so Telegram never holds the slot.
+    forwarder = PartialForwarder(on_partial) if on_partial is not None else None
+    try:
+        async with llm_governor.slot():
+            started = time.monotonic()
+            try:
+                stream = await async_client.chat.completions.create(**request, stream=True)
+                async with stream:
+                    async for chunk in stream:
+                        # Groq reports usage on the final chunk (absent when we stop early).
+                        usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or usage
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if not delta:
+                            continue
+                        tokens += 1
+                        last_token_at = time.monotonic()
+                        if not first_token_at:
+                            first_token_at = last_token_at
+                            # The SLO is on time to first token: it is what the user waits for.
+                            model_router.record(meta["route"], request["model"], (first_token_at - started) * 1000)
+                        raw_reply += delta
+                        if early_stop and any(ch.isspace() for ch in delta):
+                            cut = _cut_at_word_limit(raw_reply, word_limit)
+                            if cut is not None:
+                                raw_reply = cut
+                                stopped = True
+                        if forwarder is not None:
+                            forwarder.push(raw_reply)
+                        if stopped:
+                            # Leaving the block closes the response, which cancels generation upstream.
+                            break
+            except Exception:
+                if not first_token_at:
+                    model_router.record(meta["route"], request["model"], (time.monotonic() - started) * 1000, ok=False)
+                raise
+            if not first_token_at:
+                model_router.record(meta["route"], request["model"], (time.monotonic() - started) * 1000)
+    except BaseException:
+        if forwarder is not None:
+            await forwarder.cancel()
+        raise
+    if forwarder is not None:
+        await forwarder.close()
+    _record_reply_metrics(meta, started, usage, (first_token_at - started) * 1000 if tokens else None)
+
+    tokens_saved = max(0, request["max_tokens"] - tokens) if stopped else 0
+    ms_per_token = (last_token_at - first_token_at) / max(1, tokens - 1) * 1000
+    early_stop_stats.record(stopped, tokens_saved, tokens_saved * ms_per_token)
+    if stopped:
+        logger.info(
+            "Early-stopped %s reply at %d words after %d tokens (~%d tokens, ~%.0fms saved)",
+            style_mode,
+            word_limit,
+            tokens,
+            tokens_saved,
+            tokens_saved * ms_per_token,
+        )
+    return _finish_reply(raw_reply, style_mode, latest_user_text, memory_messages)
+
+
+def generate_checkin_message(slot: str, first_name: str = "", recent_messages: Optional[list[dict]] = None) -> str:
+    """Generate a varied, human check-in message for scheduled outreach."""
+    request = _build_checkin_request(slot, first_name, recent_messages)
+    with model_router.track("checkin", request["model"]):
+        completion = client.chat.completions.create(**request)
+    return (completion.choices[0].message.content or "").strip()
+
+
+async def generate_checkin_message_async(slot: str, first_name: str = "", recent_messages: Optional[list[dict]] = None) -> str:
+    """Generate a check-in message on the shared async client, within the concurrency limit."""
+    request = _build_checkin_request(slot, first_name, recent_messages)
+    async with llm_governor.slot():
+        with model_router.track("checkin", request["model"]):
+            completion = await async_client.chat.completions.create(**request)
+    return (completion.choices[0].message.content or "").strip()
+
+
+# Output tokens allowed per user in a batched check-in call (message + JSON framing).
+CHECKIN_BATCH_TOKENS_PER_USER = 100
+
+
+def _build_checkin_batch_request(slot: str, names: list[str]) -> dict:
+    """Return the chat completion arguments for check-ins to several users at once.
+
+    Only each user's first name and the slot go into the shared prompt, never
+    their conversation history. Users are numbered from 1, so no account ids
+    reach the model, and each entry must echo its name back.
+    """
+    entries = [
+        {"id": index, "name": (name or "").strip() or "unknown"} for index, name in enumerate(names, start=1)
+    ]
+    prompt = (
+        f"Write one short check-in message for each of the {len(entries)} users below, "
+        "from a warm, emotionally intelligent companion.\n"
+        f"Time slot: {slot}.\n"
+        "Constraints for every message:\n"
+        "- 1 to 2 sentences, under 45 words.\n"
+        "- Sound human and natural, not robotic or templated.\n"
+        "- Vary wording between users; do not reuse openings.\n"
+        "- Gentle tone, no medical advice.\n"
+        "- No emojis.\n\n"
+        f"Users (JSON):\n{json.dumps(entries, ensure_ascii=False)}\n\n"
+        "Reply with only a JSON array, one object per user, in the same order, "
+        'copying each id and name: [{"id": 1, "name": "...", "message": "..."}, ...]'
+    )
+    return {
+        "model": model_router.choose("checkin_batch", MODEL_NAME),
+        "messages": [
+            {"role": "system", "content": _CHECKIN_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        "max_tokens": CHECKIN_BATCH_TOKENS_PER_USER * len(entries) + 50,
+        "temperature": 0.9,
+    }
+
+
+def parse_checkin_batch(content: str, names: list[str]) -> list[str]:
+    """Map a batched check-in reply back to one message per name, in order.
+
+    The reply must hold exactly one ``{"id": n, "name": ..., "message": ...}``
+    object per user, in id order. A short, long, reordered or unparseable
+    reply means the model lost track of who is who, so every user gets ``""``
+    and the caller's fallback text rather than a message that may belong to
+    someone else. Otherwise only entries with a bad id, a name that does not
+    echo the user's, or an empty message are blanked.
+    """
+    count = len(names)
+    blanks = [""] * count
+    text = content or ""
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end <= start:
+        return blanks
+    try:
+        items = json.loads(text[start : end + 1])
+    except ValueError:
+        return blanks
+    if not isinstance(items, list) or len(items) != count:
+        return blanks
+    ids = [
+        item.get("id") if isinstance(item, dict) and type(item.get("id")) is int else None
+        for item in items
+    ]
+    if any(item_id is not None and 1 <= item_id <= count and item_id != position
+           for position, item_id in enumerate(ids, start=1)):
+        return blanks
+    messages = []
+    for expected_id, (item, item_id, name) in enumerate(zip(items, ids, names), start=1):
+        expected_name = (name or "").strip() or "unknown"
+        echoed = item.get("name") if item_id == expected_id else None
+        if not isinstance(echoed, str) or echoed.strip().casefold() != expected_name.casefold():
+            messages.append("")
+            continue
+        message = item.get("message")
+        messages.append(_trim_to_word_limit(message.strip(), 60) if isinstance(message, str) else "")
+    return messages
+
+
+async def generate_checkin_messages_batch_async(slot: str, names: list[str]) -> list[str]:
+    """Generate check-ins for several users, by first name only, with one LLM call.
+
+    Returns one message per user, in order; ``""`` marks users whose entry
+    could not be trusted.
+    """
+    if not names:
+        return []
+    request = _build_checkin_batch_request(slot, names)
+    async with llm_governor.slot():
+        with model_router.track("checkin_batch", request["model"]):
+            completion = await async_client.chat.completions.create(**request)
+    messages = parse_checkin_batch(completion.choices[0].message.content or "", names)
+    missing = messages.count("")
+    if missing:
+        logger.warning("Batched %s check-in reply had %d unusable entries out of %d", slot, missing, len(names))
+    return messages
+
+
+# ---------------- ROLLING SUMMARIES ---------------- #
+
+# Upper bound on summary length, in words.
+SUMMARY_MAX_WORDS = 180
+
+
+def _build_summary_request(previous_summary: str, turns: list[dict]) -> dict:
+    transcript = "\n".join(
+        f"{item.get('role', 'user')}: {' '.join((item.get('content') or '').split())}" for item in turns
+    )
+    prompt = (
+        f"Existing summary:\n{previous_summary.strip() or '(none yet)'}\n\n"
+        f"Newer conversation turns:\n{transcript}\n\n"
+        "Rewrite the summary so it also covers the newer turns. Keep what matters for "
+        "continuity: the user's situation, feelings, people and events they mentioned, "
+        "what helped, and anything they asked us to remember or avoid. "
+        f"Write plain sentences in the third person, under {SUMMARY_MAX_WORDS} words."
+    )
+    return {
+        "model": SUMMARY_MODEL,
+        "messages": [
             {
                 "role": "system",
-                "content": (
-                    "You write caring check-in messages that feel personal and grounded. "
-                    "Avoid repetitive openings and avoid sounding scripted."
-                ),
+                "content": "You maintain concise, factual conversation summaries for a supportive companion.",
             },
             {"role": "user", "content": prompt},
         ],
-        max_tokens=120,
-        temperature=0.9,
-    )
-    return (completion.choices[0].message.content or "").strip()
+        "max_tokens": 320,
+        "temperature": 0.2,
+    }
 
 
-async def generate_checkin_message_async(slot: str, first_name: str = "", recent_messages: Optional[list[dict]] = None) -> str:
-    """Async wrapper around check-in generation."""
-    return await asyncio.to_thread(generate_checkin_message, slot, first_name, recent_messages)
+async def summarize_conversation_async(previous_summary: str, turns: list[dict]) -> str:
+    """Fold ``turns`` into ``previous_summary`` with a small, cheap model."""
+    request = _build_summary_request(previous_summary, turns)
+    async with llm_governor.slot():
+        with model_router.track("summary", request["model"]):
+            completion = await async_client.chat.completions.create(**request)
+    summary = (completion.choices[0].message.content or "").strip()
+    return _trim_to_word_limit(summary, SUMMARY_MAX_WORDS)
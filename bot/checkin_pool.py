@@ -0,0 +1,171 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from bot.ai import generate_checkin_message_async, generate_checkin_messages_batch_async
+from bot.config import (
+    CHECKIN_BATCH_SIZE,
+    CHECKIN_LLM_BATCH_SIZE,
+    CHECKIN_PREGEN_LEAD_MINUTES,
+    CHECKIN_SLOTS,
+    logger,
+)
+from bot.memory import (
+    get_pregenerated_user_ids,
+    get_recent_messages_bulk,
+    iter_due_checkin_users,
+    purge_expired_checkins,
+    run_db,
+    save_pregenerated_checkins,
+    take_pregenerated_checkins,
+)
+
+# Recent messages used to personalize each check-in.
+CHECKIN_CONTEXT_MESSAGES = 8
+
+
+def next_slot_window(now: datetime) -> tuple[str, datetime, datetime]:
+    """The next slot to begin after ``now``, with its start and end times."""
+    candidates = []
+    for slot, (start_hour, end_hour) in CHECKIN_SLOTS.items():
+        start = now.replace(hour=start_hour, minute=0, second=0, microsecond=0)
+        if start <= now:
+            start += timedelta(days=1)
+        length = timedelta(hours=(end_hour - start_hour) % 24)
+        candidates.append((start, slot, start + length))
+    start, slot, end = min(candidates)
+    return slot, start, end
+
+
+async def generate_checkins(slot: str, users: list[dict]) -> dict[int, str]:
+    """Generate check-ins for ``users``, one LLM call per ``CHECKIN_LLM_BATCH_SIZE`` users.
+
+    Batched calls are given first names only, so one user's history never
+    shares a prompt with another's. Returns a message per user id; ``""``
+    marks users whose entry was unusable or whose call failed.
+    """
+    chunks = [users[i : i + CHECKIN_LLM_BATCH_SIZE] for i in range(0, len(users), CHECKIN_LLM_BATCH_SIZE)]
+    results = await asyncio.gather(
+        *(
+            generate_checkin_messages_batch_async(slot, [u.get("first_name") or "" for u in chunk])
+            for chunk in chunks
+        ),
+        return_exceptions=True,
+    )
+    messages = {}
+    for chunk, result in zip(chunks, results):
+        if isinstance(result, BaseException):
+            logger.warning("Batched check-in generation failed for %d users: %s", len(chunk), result)
+            result = [""] * len(chunk)
+        for user, message in zip(chunk, result):
+            messages[user["user_id"]] = message
+    return messages
+
+
+async def _generate_each(slot: str, users: list[dict], recent_by_user: dict) -> dict[int, str]:
+    results = await asyncio.gather(
+        *(
+            generate_checkin_message_async(
+                slot=slot,
+                first_name=u.get("first_name") or "",
+                recent_messages=recent_by_user.get(u["user_id"], []),
+            )
+            for u in users
+        ),
+        return_exceptions=True,
+    )
+    return {u["user_id"]: "" if isinstance(r, BaseException) else r for u, r in zip(users, results)}
+
+
+class CheckinPool:
+    """Check-ins generated ahead of each slot, so the sweep only reads and sends.
+
+    ``fill`` runs in the background once the next slot is at most
+    ``lead_minutes`` away. It generates a message for every opted-in user due
+    in that slot who has none yet, from the same name and recent-context
+    inputs the sweep would use, and stores it in ``checkin_pool`` until the
+    slot ends. ``take`` hands pooled messages to the sweep; users without one
+    are generated inline as before.
+    """
+
+    def __init__(self, lead_minutes: int = CHECKIN_PREGEN_LEAD_MINUTES):
+        self.lead = timedelta(minutes=max(1, lead_minutes))
+        self._running = False
+        self.fills = 0
+        self.generated = 0
+        self.failed = 0
+        self.expired = 0
+        self.hits = 0
+        self.misses = 0
+        self.last_fill_ms = 0.0
+
+    async def fill(self, now: Optional[datetime] = None) -> int:
+        """Pre-generate the next slot's check-ins if it starts soon; returns messages stored."""
+        now = now or datetime.now()
+        slot, start, end = next_slot_window(now)
+        if start - now > self.lead:
+            return 0
+        if self._running:
+            logger.info("Check-in pre-generation already in progress; skipping")
+            return 0
+        self._running = True
+        started = time.monotonic()
+        stored = 0
+        try:
+            self.expired += await run_db(purge_expired_checkins, now.timestamp())
+            due_batches = iter_due_checkin_users(slot, CHECKIN_BATCH_SIZE)
+            while True:
+                batch = await run_db(next, due_batches, None)
+                if batch is None:
+                    break
+                pooled = await run_db(
+                    get_pregenerated_user_ids, [u["user_id"] for u in batch], slot, now.timestamp()
+                )
+                pending = [u for u in batch if u["user_id"] not in pooled]
+                if not pending:
+                    continue
+                if CHECKIN_LLM_BATCH_SIZE > 1:
+                    messages = await generate_checkins(slot, pending)
+                else:
+                    recent_by_user = await run_db(
+                        get_recent_messages_bulk,
+                        [u["user_id"] for u in pending],
+                        CHECKIN_CONTEXT_MESSAGES,
+                    )
+                    messages = await _generate_each(slot, pending, recent_by_user)
+                rows = [(user_id, slot, message, end.timestamp()) for user_id, message in messages.items() if message]
+                await run_db(save_pregenerated_checkins, rows)
+                stored += len(rows)
+                self.failed += len(messages) - len(rows)
+            self.fills += 1
+            self.generated += stored
+            self.last_fill_ms = (time.monotonic() - started) * 1000
+            if stored:
+                logger.info("Pre-generated %d %s check-ins in %.0fms", stored, slot, self.last_fill_ms)
+            return stored
+        finally:
+            self._running = False
+
+    async def take(self, user_ids: list[int], slot: str) -> dict[int, str]:
+        """Pooled messages for ``slot`` among ``user_ids`` (removed from the pool)."""
+        taken = await run_db(take_pregenerated_checkins, user_ids, slot)
+        self.hits += len(taken)
+        self.misses += len(user_ids) - len(taken)
+        return taken
+
+    def stats(self) -> dict:
+        lookups = max(1, self.hits + self.misses)
+        return {
+            "fills": self.fills,
+            "generated": self.generated,
+            "failed": self.failed,
+            "expired": self.expired,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3),
+            "last_fill_ms": round(self.last_fill_ms, 2),
+        }
+
+
+checkin_pool = CheckinPool()
@@ -0,0 +1,109 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable, Optional
+
+from bot.config import BURST_WINDOW_MS, logger
+
+# respond(texts, commit): generate and send one reply covering ``texts``; calls
+# ``commit()`` once the reply is about to become visible.
+Responder = Callable[[list[str], Callable[[], None]], Awaitable[None]]
+
+
+class _Burst:
+    __slots__ = ("texts", "task", "after", "generating", "committed")
+
+    def __init__(self, texts: list[str], after: Optional[asyncio.Task]):
+        self.texts = texts
+        self.after = after
+        self.task: Optional[asyncio.Task] = None
+        self.generating = False
+        self.committed = False
+
+
+class BurstCoalescer:
+    """Per-user debounce that turns a burst of messages into one reply.
+
+    Each message (already saved by the caller) restarts the user's window.
+    When ``window_ms`` passes without a newer message, one reply is generated
+    for all of the burst's texts. A newer message cancels a pending or
+    in-flight generation that has not yet shown anything and folds its text
+    into the burst; once a reply is committed (about to become visible), later
+    messages start a new burst that replies after it, so replies stay in order.
+
+    Replies run as tasks of their own, outside the update queue's workers and
+    the per-user executor: one user's replies are ordered by the chaining
+    above, and LLM concurrency is bounded by the governor, not the worker cap.
+    """
+
+    def __init__(self, window_ms: int = BURST_WINDOW_MS):
+        self.window = max(0, window_ms) / 1000
+        self._bursts: dict[Hashable, _Burst] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.messages = 0
+        self.coalesced = 0
+        self.cancelled_generations = 0
+        self.replies = 0
+        self.errors = 0
+
+    def add(self, key: Hashable, text: str, respond: Responder):
+        """Add ``text`` to ``key``'s burst and (re)start its debounce window."""
+        self.messages += 1
+        current = self._bursts.get(key)
+        if current is not None and not current.committed:
+            burst = _Burst(current.texts + [text], current.after)
+            if current.generating:
+                self.cancelled_generations += 1
+            current.task.cancel()
+            self.coalesced += 1
+        else:
+            burst = _Burst([text], current.task if current is not None else None)
+        self._bursts[key] = burst
+        burst.task = asyncio.create_task(self._run(key, burst, respond))
+        self._tasks.add(burst.task)
+        burst.task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key: Hashable, burst: _Burst, respond: Responder):
+        try:
+            await asyncio.sleep(self.window)
+            if burst.after is not None:
+                # The previous burst's reply is already going out; keep order.
+                await asyncio.wait([burst.after])
+            burst.generating = True
+            await respond(list(burst.texts), lambda: setattr(burst, "committed", True))
+            self.replies += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.errors += 1
+            logger.error("Burst reply failed for %s: %s", key, e)
+        finally:
+            if self._bursts.get(key) is burst:
+                del self._bursts[key]
+
+    async def drain(self, timeout: float):
+        """Wait (up to ``timeout`` seconds) for pending replies, then cancel the rest.
+
+        Nothing is left running afterwards, so shutdown can close the bot,
+        LLM clients and database underneath.
+        """
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        if pending:
+            logger.warning("Cancelling %d burst replies still running at shutdown", len(pending))
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": int(self.window * 1000),
+            "active_bursts": len(self._bursts),
+            "messages": self.messages,
+            "coalesced": self.coalesced,
+            "cancelled_generations": self.cancelled_generations,
+            "replies": self.replies,
+            "errors": self.errors,
+        }
+
+
+burst_coalescer = BurstCoalescer()
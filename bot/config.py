@@ -18,9 +18,31 @@ if not GROQ_API_KEY:
 # ---------------- MODEL SETTINGS ---------------- #
 
 MODEL_NAME = "llama-3.3-70b-versatile"
+FAST_MODEL_NAME = os.getenv("CALMNEST_FAST_MODEL", "llama-3.1-8b-instant")
 MAX_TOKENS = 4096
 TEMPERATURE = 0.6
 
+# Async LLM client: global cap on in-flight requests (excess requests queue)
+LLM_MAX_CONCURRENCY = int(os.getenv("CALMNEST_LLM_CONCURRENCY", "32"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("CALMNEST_LLM_TIMEOUT_S", "30"))
+
+# Model routing per call type; a route falls back to FAST_MODEL_NAME while its
+# p95 latency (time to first token when streamed) breaches the SLO.
+MODEL_ROUTES = {
+    "chat_short": os.getenv("CALMNEST_MODEL_SHORT", FAST_MODEL_NAME),
+    "chat_medium": os.getenv("CALMNEST_MODEL_MEDIUM", MODEL_NAME),
+    "chat_long": os.getenv("CALMNEST_MODEL_LONG", MODEL_NAME),
+    "checkin": os.getenv("CALMNEST_MODEL_CHECKIN", FAST_MODEL_NAME),
+}
+# Batched check-ins produce many messages per call, so they get their own latency pool.
+MODEL_ROUTES["checkin_batch"] = os.getenv("CALMNEST_MODEL_CHECKIN_BATCH", MODEL_ROUTES["checkin"])
+LLM_SLO_P95_MS = int(os.getenv("CALMNEST_LLM_SLO_P95_MS", "6000"))
+LLM_SLO_COOLDOWN_SECONDS = int(os.getenv("CALMNEST_LLM_SLO_COOLDOWN_S", "120"))
+
+# Estimated prompt tokens per reply (system prompts + memory + history);
+# the oldest turns beyond it are collapsed or dropped.
+PROMPT_TOKEN_BUDGET = int(os.getenv("CALMNEST_PROMPT_TOKENS", "3000"))
+
 SYSTEM_PROMPT = (
     "You are CalmNest, a calm, warm, and supportive mental wellbeing assistant. "
     "You listen without judgment. "
@@ -47,9 +69,30 @@ CHECKIN_MESSAGES = {
     "night":     "Hey 🌙 Winding down? Remember, it's okay to rest. I'm here if you need me.",
 }
 
+# Users handled per batch during a check-in sweep
+CHECKIN_BATCH_SIZE = int(os.getenv("CALMNEST_CHECKIN_BATCH_SIZE", "200"))
+# Check-ins generated per LLM call (1 = one call per user); batched calls see names only
+CHECKIN_LLM_BATCH_SIZE = max(1, min(40, int(os.getenv("CALMNEST_CHECKIN_LLM_BATCH", "1"))))
+# Pre-generate each user's next-slot check-in ahead of the slot start
+CHECKIN_PREGEN_LEAD_MINUTES = int(os.getenv("CALMNEST_CHECKIN_PREGEN_LEAD_MINUTES", "90"))
+CHECKIN_PREGEN_INTERVAL_MINUTES = int(os.getenv("CALMNEST_CHECKIN_PREGEN_INTERVAL_MINUTES", "15"))
+
 # Rate limiting
 RATE_LIMIT = "120/minute"
 
+# Webhook updates are queued and handled by this many background consumers
+UPDATE_QUEUE_SIZE = int(os.getenv("CALMNEST_UPDATE_QUEUE_SIZE", "1000"))
+UPDATE_WORKERS = int(os.getenv("CALMNEST_UPDATE_WORKERS", "16"))
+# Updates one user may have accepted but not yet handled; beyond this the webhook answers 503
+UPDATE_USER_BACKLOG = int(os.getenv("CALMNEST_UPDATE_USER_BACKLOG", "20"))
+UPDATE_DRAIN_TIMEOUT_SECONDS = float(os.getenv("CALMNEST_UPDATE_DRAIN_TIMEOUT_S", "25"))
+# Redelivered update_ids are dropped for this long (Telegram keeps undelivered updates 24h)
+UPDATE_DEDUP_TTL_SECONDS = int(os.getenv("CALMNEST_UPDATE_DEDUP_TTL_S", "86400"))
+UPDATE_DEDUP_MEMORY_SIZE = int(os.getenv("CALMNEST_UPDATE_DEDUP_SIZE", "10000"))
+# Messages from one user this close together get a single reply. Every reply then
+# waits this long after the last message, so it is opt-in (0 = reply to each).
+BURST_WINDOW_MS = int(os.getenv("CALMNEST_BURST_WINDOW_MS", "0"))
+
 # ---------------- LOGGING ---------------- #
 
 logging.basicConfig(
@@ -73,6 +116,10 @@ def _default_db_path() -> str:
 
 # Database
 DB_PATH = os.getenv("CALMNEST_DB_PATH") or _default_db_path()
+DB_POOL_SIZE = int(os.getenv("CALMNEST_DB_POOL_SIZE", "4"))
+DB_CACHE_SIZE_KB = int(os.getenv("CALMNEST_DB_CACHE_KB", "8192"))
+DB_MMAP_SIZE_MB = int(os.getenv("CALMNEST_DB_MMAP_MB", "64"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("CALMNEST_DB_STATEMENT_CACHE", "128"))
 
 
 def _as_bool(value: Optional[str], default: bool = False) -> bool:
@@ -82,6 +129,69 @@ def _as_bool(value: Optional[str], default: bool = False) -> bool:
     return value.strip().lower() in {"1", "true", "yes", "on"}
 
 
+# Reply prompt layout: "stable" keeps a byte-identical static prefix
+# (SYSTEM_PROMPT + persona constitution) ahead of per-turn guidance so provider
+# prefix caches can hit. This was already the order before the layout setting
+# existed; "dynamic_first" is a control arm that never shipped, so comparing the
+# two measures prefix ordering, not an improvement over the earlier prompt.
+PROMPT_LAYOUT = os.getenv("CALMNEST_PROMPT_LAYOUT", "stable").strip().lower()
+if PROMPT_LAYOUT not in {"stable", "dynamic_first"}:
+    logger.warning("Unknown CALMNEST_PROMPT_LAYOUT=%r; using 'stable'.", PROMPT_LAYOUT)
+    PROMPT_LAYOUT = "stable"
+
+# Streaming replies: send the first chunk early, then edit the message in place
+STREAM_REPLIES = _as_bool(os.getenv("CALMNEST_STREAM_REPLIES"), default=True)
+STREAM_FIRST_CHUNK_CHARS = int(os.getenv("CALMNEST_STREAM_FIRST_CHARS", "24"))
+STREAM_EDIT_INTERVAL_MS = int(os.getenv("CALMNEST_STREAM_EDIT_MS", "1000"))
+# Cancel a streamed reply at a sentence boundary once the style word limit is reached
+STREAM_EARLY_STOP = _as_bool(os.getenv("CALMNEST_STREAM_EARLY_STOP"), default=True)
+
+# Fill the check-in pool in the background so sweeps only read and send
+CHECKIN_PREGEN_ENABLED = _as_bool(os.getenv("CALMNEST_CHECKIN_PREGEN"), default=True)
+
+# Recent assistant replies a new reply is checked against for repetition
+REPETITION_WINDOW = int(os.getenv("CALMNEST_REPETITION_WINDOW", "5"))
+
+# Optional write-behind (group commit) for message persistence
+MESSAGE_WRITE_BEHIND = _as_bool(os.getenv("CALMNEST_WRITE_BEHIND"), default=False)
+WRITE_BEHIND_FLUSH_MS = int(os.getenv("CALMNEST_WRITE_BEHIND_FLUSH_MS", "20"))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("CALMNEST_WRITE_BEHIND_BATCH", "200"))
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("CALMNEST_WRITE_BEHIND_MAX_PENDING", "5000"))
+
+# In-process cache of each user's recent conversation window
+CONTEXT_CACHE_MAX_USERS = int(os.getenv("CALMNEST_CONTEXT_CACHE_USERS", "2000"))
+CONTEXT_CACHE_MAX_MB = int(os.getenv("CALMNEST_CONTEXT_CACHE_MB", "32"))
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CALMNEST_CONTEXT_CACHE_TTL_S", "900"))
+
+# Message retention (opt-in): archive rows beyond the per-user cap or older than the max age
+RETENTION_ENABLED = _as_bool(os.getenv("CALMNEST_RETENTION_ENABLED"), default=False)
+RETENTION_KEEP_MESSAGES = int(os.getenv("CALMNEST_RETENTION_KEEP_MESSAGES", "1000"))
+RETENTION_MAX_AGE_DAYS = int(os.getenv("CALMNEST_RETENTION_MAX_AGE_DAYS", "180"))
+RETENTION_BATCH_ROWS = int(os.getenv("CALMNEST_RETENTION_BATCH_ROWS", "5000"))
+RETENTION_INTERVAL_MINUTES = int(os.getenv("CALMNEST_RETENTION_INTERVAL_MINUTES", "360"))
+
+# Local FTS5 recall over message history: "fallback" (when Supermemory is off,
+# failing or empty), "primary" (instead of Supermemory), or "off".
+LOCAL_RECALL_MODE = os.getenv("CALMNEST_LOCAL_RECALL", "fallback").strip().lower()
+if LOCAL_RECALL_MODE not in {"fallback", "primary", "off"}:
+    logger.warning("Unknown CALMNEST_LOCAL_RECALL=%r; using 'fallback'.", LOCAL_RECALL_MODE)
+    LOCAL_RECALL_MODE = "fallback"
+
+# Offline vector recall: per-user memory-mapped embedding files next to the DB
+VECTOR_RECALL_ENABLED = _as_bool(os.getenv("CALMNEST_VECTOR_RECALL"), default=False)
+VECTOR_DIR = os.getenv("CALMNEST_VECTOR_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(DB_PATH)), "calmnest_vectors"
+)
+VECTOR_DIM = int(os.getenv("CALMNEST_VECTOR_DIM", "256"))
+
+# Rolling per-user conversation summaries: older turns are folded into a
+# summary by a background job; replies then see the summary plus recent turns
+SUMMARIES_ENABLED = _as_bool(os.getenv("CALMNEST_SUMMARIES"), default=False)
+SUMMARY_MODEL = os.getenv("CALMNEST_SUMMARY_MODEL", "llama-3.1-8b-instant")
+SUMMARY_RAW_TURNS = int(os.getenv("CALMNEST_SUMMARY_RAW_TURNS", "12"))
+SUMMARY_FOLD_TURNS = int(os.getenv("CALMNEST_SUMMARY_FOLD_TURNS", "20"))
+SUMMARY_INTERVAL_MINUTES = int(os.getenv("CALMNEST_SUMMARY_INTERVAL_MINUTES", "10"))
+
 # Optional Supermemory integration
 SUPERMEMORY_ENABLED = _as_bool(os.getenv("ENABLE_SUPERMEMORY"), default=False)
 SUPERMEMORY_API_KEY = os.getenv("SUPERMEMORY_API_KEY", "").strip()
@@ -0,0 +1,122 @@
+import re
+from functools import lru_cache
+
+# ---------------- TOKEN ESTIMATION ---------------- #
+
+# Chat framing added by the API around every message (role markers, separators).
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_PIECE_RE = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+
+@lru_cache(maxsize=16384)
+def estimate_tokens(text: str) -> int:
+    """Estimate BPE tokens for ``text`` (cached per distinct message content).
+
+    Modelled on Llama-3 style tokenizers: short words are one token, longer
+    words cost roughly one token per four letters, digits are grouped in threes,
+    and each punctuation mark or non-ASCII character counts on its own
+    (non-ASCII text is split into multi-byte pieces, so it costs more).
+    """
+    tokens = 0
+    for piece in _PIECE_RE.findall(text or ""):
+        first = piece[0]
+        if first.isascii() and first.isalpha():
+            tokens += 1 if len(piece) <= 6 else -(-len(piece) // 4)
+        elif first.isdigit():
+            tokens += -(-len(piece) // 3)
+        elif first.isascii():
+            tokens += 1
+        else:
+            tokens += max(1, len(piece.encode("utf-8")) // 2)
+    return tokens
+
+
+def message_tokens(message: dict) -> int:
+    return estimate_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+
+
+# ---------------- BUDGETED PACKING ---------------- #
+
+# Words kept from each collapsed older turn.
+_COLLAPSED_WORDS = 14
+
+
+def _truncate_to_tokens(text: str, budget: int) -> str:
+    words = (text or "").split()
+    kept: list[str] = []
+    used = 0
+    for word in words:
+        cost = estimate_tokens(word)
+        if used + cost > budget and kept:
+            break
+        kept.append(word)
+        used += cost
+    return " ".join(kept) + (" …" if len(kept) < len(words) else "")
+
+
+def pack_messages(messages: list[dict], budget: int) -> tuple[list[dict], dict]:
+    """Fit ``messages`` into ``budget`` tokens, keeping the newest turns.
+
+    Leading system messages (memory and profile hints) are kept as they are.
+    Conversation turns are taken newest first while they fit; older turns that
+    do not fit are collapsed into one short system note when there is room,
+    and dropped otherwise. The newest turn is always kept, truncated if needed.
+    Returns the packed list and a summary of what was done.
+    """
+    pinned_count = 0
+    while pinned_count < len(messages) and messages[pinned_count].get("role") == "system":
+        pinned_count += 1
+    pinned, turns = messages[:pinned_count], messages[pinned_count:]
+
+    remaining = budget - sum(message_tokens(m) for m in pinned)
+    kept: list[dict] = []
+    for index in range(len(turns) - 1, -1, -1):
+        cost = message_tokens(turns[index])
+        if cost <= remaining:
+            kept.append(turns[index])
+            remaining -= cost
+            continue
+        if not kept:
+            content = _truncate_to_tokens(turns[index].get("content") or "", max(0, remaining - MESSAGE_OVERHEAD_TOKENS - 1))
+            kept.append({**turns[index], "content": content})
+            remaining -= message_tokens(kept[-1])
+            index -= 1
+        overflow = turns[: index + 1]
+        break
+    else:
+        overflow = []
+    kept.reverse()
+
+    collapsed = 0
+    note = None
+    if overflow:
+        lines: list[str] = []
+        header = "Earlier in this conversation (condensed):"
+        used = estimate_tokens(header) + MESSAGE_OVERHEAD_TOKENS
+        for turn in reversed(overflow):
+            words = (turn.get("content") or "").split()
+            if not words:
+                continue
+            snippet = " ".join(words[:_COLLAPSED_WORDS]) + (" …" if len(words) > _COLLAPSED_WORDS else "")
+            line = f"- {turn.get('role', 'user')}: {snippet}"
+            cost = estimate_tokens(line) + 1
+            if used + cost > remaining:
+                break
+            lines.append(line)
+            used += cost
+        if lines:
+            lines.reverse()
+            collapsed = len(lines)
+            note = {"role": "system", "content": header + "\n" + "\n".join(lines)}
+            remaining -= used
+
+    packed = [*pinned, *([note] if note else []), *kept]
+    summary = {
+        "tokens": budget - remaining,
+        "budget": budget,
+        "kept": len(kept),
+        "collapsed": collapsed,
+        "dropped": len(overflow) - collapsed,
+    }
+    return packed, summary
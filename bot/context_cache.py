@@ -0,0 +1,234 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+# ---------------- RECENT MESSAGE CACHE ---------------- #
+
+# Rough per-message bookkeeping cost on top of the content string itself.
+_MESSAGE_OVERHEAD_BYTES = 232
+
+
+def _message_bytes(message: dict) -> int:
+    return sys.getsizeof(message.get("content") or "") + _MESSAGE_OVERHEAD_BYTES
+
+
+# Given {user_id: (marker, appended)} for cached windows, returns the ids whose
+# window still matches storage. ``marker`` is what the loader returned at fill
+# time; ``appended`` counts the writes applied in place since then.
+Validator = Callable[[dict[int, tuple[object, int]]], set[int]]
+
+
+class _Entry:
+    __slots__ = ("messages", "size", "expires_at", "marker", "appended")
+
+    def __init__(self, messages: list[dict], ttl: float, marker: object = None):
+        self.messages = messages
+        self.size = sum(_message_bytes(m) for m in messages)
+        self.expires_at = time.monotonic() + ttl
+        self.marker = marker
+        self.appended = 0
+
+
+class RecentMessageCache:
+    """LRU cache of each user's recent conversation window.
+
+    Bounded by user count, approximate memory and a TTL. Writes are applied to
+    cached windows in place (write-through), so a user's window is read from
+    SQLite at most once per TTL. A fill that races with a write for the same
+    user is discarded rather than cached stale.
+
+    Writes made by other processes never reach ``append``. Callers that share
+    the database pass a ``validate`` hook, which is asked on every hit whether
+    the window still matches storage; a window that does not is reloaded.
+    """
+
+    def __init__(self, window: int = 50, max_users: int = 2000, max_bytes: int = 32 * 1024 * 1024, ttl_seconds: float = 900):
+        self.window = max(1, window)
+        self.max_users = max(0, max_users)
+        self.max_bytes = max(0, max_bytes)
+        self.ttl = max(0.0, ttl_seconds)
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._filling: dict[int, int] = {}
+        self._dirty: set[int] = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_users > 0 and self.max_bytes > 0 and self.ttl > 0
+
+    def get(self, user_id: int, loader: Callable[[], object], validate: Optional[Validator] = None) -> list[dict]:
+        """Return a copy of the user's window, calling ``loader`` on a miss.
+
+        With ``validate``, ``loader`` returns ``(messages, marker)`` and a cached
+        window is served only while ``validate`` accepts it.
+        """
+        if not self.enabled:
+            return self._split(loader(), validate)[0]
+
+        with self._lock:
+            entry = self._live(user_id)
+            if entry is not None and validate is None:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return [dict(m) for m in entry.messages]
+            if entry is not None:
+                seen = (entry.marker, entry.appended)
+            else:
+                self.misses += 1
+                self._filling[user_id] = self._filling.get(user_id, 0) + 1
+
+        if entry is not None:
+            current = user_id in validate({user_id: seen})
+            with self._lock:
+                if self._unchanged(user_id, entry, seen):
+                    if current:
+                        self._entries.move_to_end(user_id)
+                        self.hits += 1
+                        return [dict(m) for m in entry.messages]
+                    self._drop(user_id)
+                    self.stale += 1
+                self.misses += 1
+                self._filling[user_id] = self._filling.get(user_id, 0) + 1
+
+        try:
+            messages, marker = self._split(loader(), validate)
+        except BaseException:
+            with self._lock:
+                self._end_fill(user_id)
+            raise
+
+        with self._lock:
+            stale = user_id in self._dirty
+            self._end_fill(user_id)
+            if not stale:
+                self._store(user_id, [dict(m) for m in messages[-self.window:]], marker)
+        return messages
+
+    def peek_many(self, user_ids: list[int], validate: Optional[Validator] = None) -> dict[int, list[dict]]:
+        """Return copies of the live cached windows among ``user_ids`` (no loading)."""
+        found: dict[int, list[dict]] = {}
+        if not self.enabled:
+            return found
+        entries: dict[int, _Entry] = {}
+        seen: dict[int, tuple[object, int]] = {}
+        with self._lock:
+            for user_id in user_ids:
+                entry = self._live(user_id)
+                if entry is None:
+                    self.misses += 1
+                    continue
+                entries[user_id] = entry
+                seen[user_id] = (entry.marker, entry.appended)
+                found[user_id] = [dict(m) for m in entry.messages]
+            if validate is None:
+                self.hits += len(found)
+                return found
+
+        current = validate(seen) if seen else set()
+        with self._lock:
+            for user_id, entry in entries.items():
+                if user_id in current and self._unchanged(user_id, entry, seen[user_id]):
+                    self.hits += 1
+                    continue
+                if user_id not in current and self._unchanged(user_id, entry, seen[user_id]):
+                    self._drop(user_id)
+                    self.stale += 1
+                self.misses += 1
+                del found[user_id]
+        return found
+
+    def append(self, user_id: int, message: dict):
+        """Apply a committed write to the cached window, if one is cached."""
+        with self._lock:
+            if user_id in self._filling:
+                self._dirty.add(user_id)
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            entry.messages.append(dict(message))
+            entry.appended += 1
+            entry.size += _message_bytes(message)
+            self._bytes += _message_bytes(message)
+            while len(entry.messages) > self.window:
+                removed = entry.messages.pop(0)
+                entry.size -= _message_bytes(removed)
+                self._bytes -= _message_bytes(removed)
+            self._evict()
+
+    def invalidate(self, user_id: int | None = None):
+        """Forget one user's window, or every window when ``user_id`` is None."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+                self._bytes = 0
+                self._dirty.update(self._filling)
+                return
+            if user_id in self._filling:
+                self._dirty.add(user_id)
+            self._drop(user_id)
+
+    def _live(self, user_id: int) -> Optional[_Entry]:
+        entry = self._entries.get(user_id)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self._drop(user_id)
+            self.expirations += 1
+            return None
+        return entry
+
+    def _unchanged(self, user_id: int, entry: _Entry, seen: tuple[object, int]) -> bool:
+        """True if ``entry`` is still cached and untouched since ``seen`` was read."""
+        return self._entries.get(user_id) is entry and (entry.marker, entry.appended) == seen
+
+    @staticmethod
+    def _split(loaded, validate: Optional[Validator]) -> tuple[list[dict], object]:
+        return loaded if validate is not None else (loaded, None)
+
+    def _end_fill(self, user_id: int):
+        remaining = self._filling.get(user_id, 1) - 1
+        if remaining > 0:
+            self._filling[user_id] = remaining
+        else:
+            self._filling.pop(user_id, None)
+            self._dirty.discard(user_id)
+
+    def _store(self, user_id: int, messages: list[dict], marker: object = None):
+        self._drop(user_id)
+        entry = _Entry(messages, self.ttl, marker)
+        self._entries[user_id] = entry
+        self._bytes += entry.size
+        self._evict()
+
+    def _drop(self, user_id: int):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_users or self._bytes > self.max_bytes):
+            _user_id, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "users": len(self._entries),
+                "bytes": self._bytes,
+                "max_users": self.max_users,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "stale": self.stale,
+            }
@@ -0,0 +1,382 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+logger = logging.getLogger("calmnest")
+
+# ---------------- CONNECTION POOL ---------------- #
+
+
+class ConnectionPool:
+    """Bounded pool of long-lived SQLite connections.
+
+    A thread checks out one connection and keeps it for the duration of the
+    outermost ``connection()`` block, so nested calls on the same thread share
+    it. Connections are returned to an idle stack (most recently used first)
+    instead of being closed, which keeps page cache and prepared statements warm.
+    """
+
+    def __init__(self, factory: Callable[[], sqlite3.Connection], size: int = 4, timeout: float = 30.0):
+        self.factory = factory
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._idle: list[sqlite3.Connection] = []
+        self._generation_of: dict[int, int] = {}
+        self._generation = 0
+        self._open = 0
+        self._in_use = 0
+        self._local = threading.local()
+        self.hits = 0
+        self.opened = 0
+        self.waits = 0
+        self.wait_ms_total = 0.0
+
+    def _acquire(self) -> sqlite3.Connection:
+        with self._cond:
+            started = None
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    self._in_use += 1
+                    self.hits += 1
+                    if started is not None:
+                        self.wait_ms_total += (time.monotonic() - started) * 1000
+                    return conn
+                if self._open < self.size:
+                    self._open += 1
+                    self._in_use += 1
+                    self.opened += 1
+                    generation = self._generation
+                    break
+                if started is None:
+                    self.waits += 1
+                    started = time.monotonic()
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self.wait_ms_total += (time.monotonic() - started) * 1000
+                    raise sqlite3.OperationalError("SQLite connection pool exhausted")
+                self._cond.wait(remaining)
+            if started is not None:
+                self.wait_ms_total += (time.monotonic() - started) * 1000
+
+        # Open outside the lock so a slow open does not block other releases.
+        try:
+            conn = self.factory()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._generation_of[id(conn)] = generation
+        return conn
+
+    def _release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            self._in_use -= 1
+            if self._generation_of.get(id(conn)) != self._generation:
+                # Pool was closed while this connection was checked out.
+                self._generation_of.pop(id(conn), None)
+                self._open -= 1
+                conn.close()
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Check out this thread's connection (re-entrant)."""
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            yield held
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._release(conn)
+
+    def close(self):
+        """Close idle connections; checked-out ones are closed on release."""
+        with self._cond:
+            self._generation += 1
+            idle, self._idle = self._idle, []
+            for conn in idle:
+                self._generation_of.pop(id(conn), None)
+                self._open -= 1
+            self._cond.notify_all()
+        for conn in idle:
+            conn.close()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self.size,
+                "open": self._open,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "hits": self.hits,
+                "opened": self.opened,
+                "waits": self.waits,
+                "wait_ms_total": round(self.wait_ms_total, 2),
+            }
+
+
+# ---------------- DB EXECUTOR ---------------- #
+
+
+class DBExecutor:
+    """Dedicated thread pool that runs blocking SQLite work for async callers.
+
+    Keeping storage calls off the event loop means a slow fsync or a
+    ``busy_timeout`` wait only delays the awaiting coroutine, never the whole
+    worker. Queue depth and wait/run latency are tracked for ``/metrics``.
+    """
+
+    def __init__(self, workers: int = 4):
+        self.workers = max(1, workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self.completed = 0
+        self.errors = 0
+        self.wait_ms_total = 0.0
+        self.run_ms_total = 0.0
+        self.max_wait_ms = 0.0
+        self.max_run_ms = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="calmnest-db",
+                )
+            return self._executor
+
+    def _dequeue_cancelled(self, future: Future):
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    async def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Run ``fn(*args, **kwargs)`` on a DB thread and await the result."""
+        submitted = time.monotonic()
+
+        def call():
+            started = time.monotonic()
+            wait_ms = (started - submitted) * 1000
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self.wait_ms_total += wait_ms
+                self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            failed = False
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                run_ms = (time.monotonic() - started) * 1000
+                with self._lock:
+                    self._running -= 1
+                    self.completed += 1
+                    self.errors += int(failed)
+                    self.run_ms_total += run_ms
+                    self.max_run_ms = max(self.max_run_ms, run_ms)
+
+        executor = self._get_executor()
+        with self._lock:
+            self._queued += 1
+        future = executor.submit(call)
+        future.add_done_callback(self._dequeue_cancelled)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        """Finish queued work and stop the threads; a later call starts new ones."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            completed = max(1, self.completed)
+            return {
+                "workers": self.workers,
+                "queue_depth": self._queued,
+                "running": self._running,
+                "completed": self.completed,
+                "errors": self.errors,
+                "avg_wait_ms": round(self.wait_ms_total / completed, 2),
+                "max_wait_ms": round(self.max_wait_ms, 2),
+                "avg_run_ms": round(self.run_ms_total / completed, 2),
+                "max_run_ms": round(self.max_run_ms, 2),
+            }
+
+
+# ---------------- WRITE-BEHIND QUEUE ---------------- #
+
+
+class WriteBehindQueue:
+    """Bounded in-memory buffer that persists rows in batches from a background thread.
+
+    ``write_batch(rows, publishing)`` must write ``rows`` in one transaction and
+    commit inside ``with publishing():`` so readers can tell whether a row is
+    still pending or already visible in the database (see ``read_consistent``).
+    When the buffer is full the producer flushes inline (caller-runs backpressure).
+    """
+
+    def __init__(
+        self,
+        write_batch: Callable[[list, Callable], None],
+        batch_size: int = 200,
+        interval_ms: int = 20,
+        max_pending: int = 5000,
+        name: str = "write-behind",
+    ):
+        self.write_batch = write_batch
+        self.batch_size = max(1, batch_size)
+        self.interval = max(0, interval_ms) / 1000
+        self.max_pending = max(self.batch_size, max_pending)
+        self.name = name
+        self._rows: list = []
+        self._first_at = 0.0
+        self._epoch = 0
+        self._cond = threading.Condition()
+        self._flush_mutex = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.flushed_rows = 0
+        self.batches = 0
+        self.backpressure_flushes = 0
+        self.errors = 0
+
+    def put(self, row):
+        with self._cond:
+            full = len(self._rows) >= self.max_pending
+        if full:
+            self.backpressure_flushes += 1
+            self.flush()
+        with self._cond:
+            if not self._rows:
+                self._first_at = time.monotonic()
+            self._rows.append(row)
+            if len(self._rows) >= self.batch_size:
+                self._cond.notify_all()
+        self._ensure_started()
+
+    @contextmanager
+    def _publishing(self, count: int) -> Iterator[None]:
+        with self._cond:
+            self._epoch += 1
+        try:
+            yield
+        except BaseException:
+            with self._cond:
+                self._epoch += 1
+                self._cond.notify_all()
+            raise
+        with self._cond:
+            del self._rows[:count]
+            if self._rows:
+                self._first_at = time.monotonic()
+            self._epoch += 1
+            self.flushed_rows += count
+            self.batches += 1
+            self._cond.notify_all()
+
+    def flush(self) -> int:
+        """Write every pending row now; returns the number of rows written."""
+        written = 0
+        with self._flush_mutex:
+            while True:
+                with self._cond:
+                    batch = self._rows[: self.batch_size]
+                if not batch:
+                    return written
+                try:
+                    self.write_batch(batch, lambda: self._publishing(len(batch)))
+                except Exception:
+                    self.errors += 1
+                    raise
+                written += len(batch)
+
+    def read_consistent(self, read: Callable[[], T], select: Callable[[object], bool]) -> tuple[T, list]:
+        """Return ``read()`` plus matching pending rows, with no row missing or seen twice."""
+        while True:
+            with self._cond:
+                while self._epoch % 2:
+                    self._cond.wait()
+                epoch = self._epoch
+                pending = [row for row in self._rows if select(row)]
+            result = read()
+            with self._cond:
+                if self._epoch == epoch:
+                    return result, pending
+
+    def _ensure_started(self):
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name=f"calmnest-{self.name}", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._rows and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                deadline = self._first_at + self.interval
+                while len(self._rows) < self.batch_size and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            try:
+                self.flush()
+            except Exception as exc:
+                logger.error("%s flush failed (%d rows pending): %s", self.name, len(self._rows), exc)
+                time.sleep(0.5)
+
+    def stop(self):
+        """Stop the background thread and flush what is left (application shutdown)."""
+        with self._cond:
+            self._stopping = True
+            thread = self._thread
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._cond:
+            batches = max(1, self.batches)
+            return {
+                "pending": len(self._rows),
+                "max_pending": self.max_pending,
+                "flushed_rows": self.flushed_rows,
+                "batches": self.batches,
+                "avg_batch_size": round(self.flushed_rows / batches, 2),
+                "backpressure_flushes": self.backpressure_flushes,
+                "errors": self.errors,
+            }
@@ -0,0 +1,83 @@
+import time
+from collections import OrderedDict
+
+from bot.config import UPDATE_DEDUP_MEMORY_SIZE, UPDATE_DEDUP_TTL_SECONDS, logger
+from bot.memory import claim_update_id, purge_processed_updates, release_update_id, run_db
+
+# Purge old rows from processed_updates once per this many claims.
+PURGE_EVERY = 500
+
+
+class UpdateDeduplicator:
+    """Drops Telegram updates whose ``update_id`` was already accepted.
+
+    Recently seen ids live in a bounded in-memory LRU, so most redeliveries are
+    refused without touching storage. New ids are claimed in the
+    ``processed_updates`` table, which is shared by every worker process and
+    survives restarts; whoever inserts the id first handles the update. Ids
+    expire from both after ``ttl_seconds``.
+    """
+
+    def __init__(self, ttl_seconds: int = UPDATE_DEDUP_TTL_SECONDS, max_size: int = UPDATE_DEDUP_MEMORY_SIZE):
+        self.ttl = max(1, ttl_seconds)
+        self.max_size = max(1, max_size)
+        self._seen: OrderedDict[int, float] = OrderedDict()
+        self._claims = 0
+        self.checked = 0
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.released = 0
+        self.purged = 0
+
+    def _evict(self, now: float):
+        cutoff = now - self.ttl
+        while self._seen and (len(self._seen) > self.max_size or next(iter(self._seen.values())) <= cutoff):
+            self._seen.popitem(last=False)
+
+    async def claim(self, update_id: int) -> bool:
+        """True if ``update_id`` is new and this caller should process it."""
+        now = time.time()
+        self.checked += 1
+        self._evict(now)
+        if update_id in self._seen:
+            self.memory_hits += 1
+            return False
+        # Remember before awaiting, so a concurrent redelivery is refused too.
+        self._seen[update_id] = now
+        self._evict(now)
+        try:
+            claimed = await run_db(claim_update_id, update_id, now, now - self.ttl)
+        except Exception as e:
+            # Fail open: a missed duplicate is better than a dropped message.
+            logger.error("Update dedup lookup failed for %d: %s", update_id, e)
+            return True
+        if not claimed:
+            self.db_hits += 1
+            logger.info("Dropping redelivered update %d", update_id)
+            return False
+        self._claims += 1
+        if self._claims % PURGE_EVERY == 0:
+            self.purged += await run_db(purge_processed_updates, now - self.ttl)
+        return True
+
+    async def release(self, update_id: int):
+        """Forget a claimed id whose update was not processed, so Telegram's retry is."""
+        self._seen.pop(update_id, None)
+        self.released += 1
+        await run_db(release_update_id, update_id)
+
+    def stats(self) -> dict:
+        duplicates = self.memory_hits + self.db_hits
+        return {
+            "tracked": len(self._seen),
+            "checked": self.checked,
+            "duplicates": duplicates,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "duplicate_rate": round(duplicates / max(1, self.checked), 3),
+            "released": self.released,
+            "purged": self.purged,
+        }
+
+
+update_dedup = UpdateDeduplicator()
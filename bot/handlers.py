@@ -1,28 +1,21 @@
-import re
+import asyncio
+import time
+from typing import Callable, Optional
 
-from telegram import Update
+from telegram import Message, Update
+from telegram.error import BadRequest, RetryAfter, TelegramError
 from telegram.ext import ContextTypes
-from bot.ai import get_ai_reply_async
-from bot.memory import register_user, set_checkin_enabled, get_checkin_enabled
+from bot.ai import get_ai_reply_async, stream_ai_reply
+from bot.memory import register_user, set_checkin_enabled, get_checkin_enabled, unit_of_work, run_db
 from bot.memory_provider import memory_provider
-from bot.config import logger
+from bot.text_analysis import analyze
+from bot.coalescer import burst_coalescer
+from bot.config import STREAM_REPLIES, STREAM_FIRST_CHUNK_CHARS, STREAM_EDIT_INTERVAL_MS, logger
 
 
 def _extract_preferred_name(text: str) -> str:
     """Extract a simple preferred name from explicit self-introduction text."""
-    lowered = (text or "").strip()
-    patterns = [
-        r"\bmy name is\s+([A-Za-z][A-Za-z'\-]{1,31})\b",
-        r"\bi am\s+([A-Za-z][A-Za-z'\-]{1,31})\b",
-        r"\bi'm\s+([A-Za-z][A-Za-z'\-]{1,31})\b",
-        r"\bcall me\s+([A-Za-z][A-Za-z'\-]{1,31})\b",
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, lowered, flags=re.IGNORECASE)
-        if match:
-            value = match.group(1).strip(" .,!?")
-            return value.capitalize()
-    return ""
+    return analyze(text).self_name
 
 
 # ---------------- /start COMMAND ---------------- #
@@ -31,7 +24,8 @@ def _extract_preferred_name(text: str) -> str:
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the /start command — greet user and register them."""
     user = update.message.from_user
-    register_user(
+    await run_db(
+        register_user,
         user.id,
         update.message.chat_id,
         first_name=user.first_name or "",
@@ -56,7 +50,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def checkin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /checkin on|off — toggle automatic check-in messages."""
     user = update.message.from_user
-    register_user(
+    await run_db(
+        register_user,
         user.id,
         update.message.chat_id,
         first_name=user.first_name or "",
@@ -65,7 +60,7 @@ async def checkin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     args = context.args
     if not args or args[0].lower() not in ("on", "off"):
-        enabled = get_checkin_enabled(user.id)
+        enabled = await run_db(get_checkin_enabled, user.id)
         status = "enabled ✅" if enabled else "disabled ❌"
         await update.message.reply_text(
             f"Check-ins are currently {status}\n\n"
@@ -76,7 +71,7 @@ async def checkin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     enable = args[0].lower() == "on"
-    set_checkin_enabled(user.id, enable)
+    await run_db(set_checkin_enabled, user.id, enable)
 
     if enable:
         await update.message.reply_text(
@@ -94,39 +89,189 @@ async def checkin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # ---------------- MESSAGE HANDLER ---------------- #
 
+FALLBACK_REPLY = "I'm here with you.\nLet's take a breath together."
+
+
+def _persist_user_turn(user_id: int, chat_id: int, first_name: str, username: str, text: str):
+    """Register the user and store their message in a single commit."""
+    with unit_of_work():
+        register_user(user_id, chat_id, first_name=first_name, username=username)
+        memory_provider.save_local(user_id, "user", text)
+
+
+class _StreamingReply:
+    """Shows a reply while it is generated: one early message, then throttled edits."""
+
+    def __init__(
+        self,
+        update: Update,
+        context: ContextTypes.DEFAULT_TYPE,
+        on_visible: Optional[Callable[[], None]] = None,
+    ):
+        self.update = update
+        self.bot = context.bot
+        self.on_visible = on_visible
+        self.interval = max(0, STREAM_EDIT_INTERVAL_MS) / 1000
+        self.started = time.monotonic()
+        self.sent: Optional[Message] = None
+        self.shown = ""
+        self.last_edit = 0.0
+        self.first_visible_ms: Optional[float] = None
+        self.edits = 0
+
+    async def update_text(self, text: str):
+        text = text.strip()
+        if not text or text == self.shown:
+            return
+        if self.sent is None and len(text) < STREAM_FIRST_CHUNK_CHARS:
+            return
+        if time.monotonic() - self.last_edit < self.interval:
+            return
+        # Partials are best-effort (a failed first send is retried on a later
+        # partial or by finish); the final send or edit carries the full reply.
+        try:
+            if self.sent is None:
+                self._mark_visible()
+                self.sent = await self.update.message.reply_text(text)
+                self.shown = text
+                self.first_visible_ms = (time.monotonic() - self.started) * 1000
+            else:
+                await self._edit(text)
+        except TelegramError as exc:
+            logger.debug("Skipped streaming update: %s", exc)
+        self.last_edit = time.monotonic()
+
+    async def finish(self, text: str):
+        if self.sent is None:
+            self._mark_visible()
+            await self.update.message.reply_text(text)
+            self.first_visible_ms = (time.monotonic() - self.started) * 1000
+            return
+        if text.strip() == self.shown:
+            return
+        try:
+            await self._edit(text)
+        except RetryAfter as exc:
+            await asyncio.sleep(exc.retry_after)
+            await self._edit(text)
+
+    def _mark_visible(self):
+        if self.on_visible is not None:
+            self.on_visible()
+
+    async def _edit(self, text: str):
+        try:
+            await self.bot.edit_message_text(
+                text=text,
+                chat_id=self.sent.chat_id,
+                message_id=self.sent.message_id,
+            )
+        except BadRequest as exc:
+            if "not modified" not in str(exc).lower():
+                raise
+        self.shown = text.strip()
+        self.edits += 1
+
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle incoming text messages — save, get AI reply, respond."""
+    """Handle incoming text messages — save, then reply (once per burst of messages)."""
     user = update.message.from_user
     user_text = update.message.text
+    chat_id = update.message.chat_id
     inferred_name = _extract_preferred_name(user_text)
     effective_name = inferred_name or (user.first_name or "")
 
-    # Ensure user is registered
-    register_user(
+    # Ensure user is registered; registration and the user turn share one commit.
+    await run_db(
+        _persist_user_turn,
         user.id,
-        update.message.chat_id,
-        first_name=effective_name,
-        username=user.username or "",
+        chat_id,
+        effective_name,
+        user.username or "",
+        user_text,
+    )
+    await memory_provider.index_remote_async(user.id, "user", user_text, chat_id=chat_id)
+
+    if burst_coalescer.window <= 0:
+        await _reply(update, context, [user_text], lambda: None)
+        return
+    # Every message is saved above; one reply covers messages sent in quick succession.
+    burst_coalescer.add(
+        user.id,
+        user_text,
+        lambda texts, commit: _reply(update, context, texts, commit),
     )
-    memory_provider.save(user.id, "user", user_text, chat_id=update.message.chat_id)
+
+
+async def _reply(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    texts: list[str],
+    commit: Callable[[], None],
+):
+    """Generate and send one reply to ``texts``, the user's latest (already saved) messages.
+
+    ``commit`` is called just before anything becomes visible or is stored;
+    until then a newer message may cancel this reply.
+    """
+    user = update.message.from_user
+    chat_id = update.message.chat_id
+    user_text = "\n".join(texts)
+    streaming: Optional[_StreamingReply] = None
 
     try:
-        memory = memory_provider.get_context(user.id, latest_user_text=user_text)
-        generation_metadata = memory_provider.build_generation_metadata(
+        memory = await memory_provider.get_context_async(user.id, latest_user_text=user_text)
+        generation_metadata = await memory_provider.build_generation_metadata_async(
             user.id,
             latest_user_text=user_text,
+            latest_texts=texts,
         )
-        reply = await get_ai_reply_async(
-            memory,
-            latest_user_text=user_text,
-            generation_metadata=generation_metadata,
-        )
-        memory_provider.save(user.id, "assistant", reply, chat_id=update.message.chat_id)
-        await update.message.reply_text(reply)
-        logger.info("Replied to user %d", user.id)
+        if STREAM_REPLIES:
+            streaming = _StreamingReply(update, context, on_visible=commit)
+            reply = await stream_ai_reply(
+                memory,
+                latest_user_text=user_text,
+                generation_metadata=generation_metadata,
+                on_partial=streaming.update_text,
+            )
+        else:
+            reply = await get_ai_reply_async(
+                memory,
+                latest_user_text=user_text,
+                generation_metadata=generation_metadata,
+            )
     except Exception as e:
         logger.error("AI error for user %d: %s", user.id, e)
-        await update.message.reply_text(
-            "I'm here with you.\nLet's take a breath together."
+        commit()
+        if streaming is not None and streaming.sent is not None:
+            # Replace the cut-off partial reply rather than leaving it above the fallback.
+            await streaming.finish(FALLBACK_REPLY)
+        else:
+            await update.message.reply_text(FALLBACK_REPLY)
+        return
+
+    commit()
+    # The reply is stored only once the user can see it; a failed send is not
+    # papered over with the fallback, since the reply itself was fine.
+    try:
+        if streaming is not None:
+            await streaming.finish(reply)
+        else:
+            await update.message.reply_text(reply)
+    except TelegramError as e:
+        logger.error("Could not deliver reply to user %d: %s", user.id, e)
+        return
+    try:
+        await memory_provider.save_async(user.id, "assistant", reply, chat_id=chat_id)
+    except Exception as e:
+        logger.error("Could not save reply for user %d: %s", user.id, e)
+    if streaming is not None:
+        logger.info(
+            "Replied to user %d (%d messages; first visible after %.0fms, %d edits)",
+            user.id,
+            len(texts),
+            streaming.first_visible_ms or 0.0,
+            streaming.edits,
         )
+    else:
+        logger.info("Replied to user %d (%d messages)", user.id, len(texts))
@@ -0,0 +1,376 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Awaitable, Callable, Iterator, Optional
+
+logger = logging.getLogger("calmnest")
+
+# ---------------- CONCURRENCY GOVERNOR ---------------- #
+
+
+class LLMGovernor:
+    """Global cap on in-flight LLM requests for the event loop.
+
+    Requests beyond ``limit`` wait in FIFO order on a semaphore instead of
+    opening more upstream connections. Queue depth, in-flight count and wait
+    time are tracked for ``/metrics``.
+    """
+
+    def __init__(self, limit: int = 32):
+        self.limit = max(1, limit)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._in_flight = 0
+        self.max_waiting = 0
+        self.completed = 0
+        self.errors = 0
+        self.wait_ms_total = 0.0
+        self.max_wait_ms = 0.0
+        self.run_ms_total = 0.0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        # A semaphore belongs to one loop; tests and restarts may bring a new one.
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.limit)
+            self._loop = loop
+        return self._semaphore
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold one of the ``limit`` request slots for the duration of the block."""
+        semaphore = self._get_semaphore()
+        queued = time.monotonic()
+        with self._lock:
+            self._waiting += 1
+            self.max_waiting = max(self.max_waiting, self._waiting)
+        try:
+            await semaphore.acquire()
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+        started = time.monotonic()
+        wait_ms = (started - queued) * 1000
+        with self._lock:
+            self._in_flight += 1
+            self.wait_ms_total += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+        failed = False
+        try:
+            yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            semaphore.release()
+            with self._lock:
+                self._in_flight -= 1
+                self.completed += 1
+                self.errors += int(failed)
+                self.run_ms_total += (time.monotonic() - started) * 1000
+
+    def stats(self) -> dict:
+        with self._lock:
+            completed = max(1, self.completed)
+            return {
+                "limit": self.limit,
+                "queue_depth": self._waiting,
+                "max_queue_depth": self.max_waiting,
+                "in_flight": self._in_flight,
+                "completed": self.completed,
+                "errors": self.errors,
+                "avg_wait_ms": round(self.wait_ms_total / completed, 2),
+                "max_wait_ms": round(self.max_wait_ms, 2),
+                "avg_run_ms": round(self.run_ms_total / completed, 2),
+            }
+
+
+# ---------------- STREAM PARTIALS ---------------- #
+
+
+class PartialForwarder:
+    """Hands streamed partial text to a callback from a task of its own.
+
+    The stream loop only calls ``push``, which never waits, so a slow callback
+    (Telegram sends, edits, flood waits) does not hold an LLM slot. Partials
+    that arrive while the callback is busy collapse into the newest one.
+    """
+
+    def __init__(self, callback: Callable[[str], Awaitable[None]]):
+        self.callback = callback
+        self._latest: Optional[str] = None
+        self._ready = asyncio.Event()
+        self._closed = False
+        self._task = asyncio.create_task(self._run())
+
+    def push(self, text: str):
+        self._latest = text
+        self._ready.set()
+
+    async def _run(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            text, self._latest = self._latest, None
+            if text is not None:
+                await self.callback(text)
+            if self._closed and self._latest is None:
+                return
+
+    async def close(self):
+        """Deliver the newest pending partial, then stop (re-raising callback errors)."""
+        self._closed = True
+        self._ready.set()
+        await self._task
+
+    async def cancel(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+# ---------------- EARLY STOP ACCOUNTING ---------------- #
+
+
+class EarlyStopStats:
+    """Counts streamed generations cut short at the word limit and what that saved.
+
+    Saved tokens are the unused part of ``max_tokens``; saved time is that
+    count multiplied by the stream's observed per-token interval, so both are
+    upper-bound estimates.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.streams = 0
+        self.early_stops = 0
+        self.tokens_saved = 0
+        self.ms_saved = 0.0
+
+    def record(self, stopped: bool, tokens_saved: int = 0, ms_saved: float = 0.0):
+        with self._lock:
+            self.streams += 1
+            if stopped:
+                self.early_stops += 1
+                self.tokens_saved += tokens_saved
+                self.ms_saved += ms_saved
+
+    def stats(self) -> dict:
+        with self._lock:
+            stops = max(1, self.early_stops)
+            return {
+                "streams": self.streams,
+                "early_stops": self.early_stops,
+                "tokens_saved": self.tokens_saved,
+                "ms_saved": round(self.ms_saved, 1),
+                "avg_tokens_saved": round(self.tokens_saved / stops, 1),
+                "avg_ms_saved": round(self.ms_saved / stops, 1),
+            }
+
+
+# ---------------- PROMPT LAYOUT ACCOUNTING ---------------- #
+
+# Distinct prefixes remembered per layout (enough to spot a drifting prefix).
+_MAX_TRACKED_PREFIXES = 64
+
+
+def _number(value) -> Optional[float]:
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+class PromptLayoutStats:
+    """Per-layout prompt size, upstream prompt time and latency, for A/B comparison.
+
+    ``prompt_tokens`` and ``prompt_time`` come from the provider's usage block
+    when it is returned; ``cached_tokens`` is only counted if the provider
+    reports prefix-cache hits.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._layouts: dict[str, dict] = {}
+
+    def record(self, layout: str, prefix_key: int, latency_ms: float, usage=None):
+        prompt_tokens = _number(getattr(usage, "prompt_tokens", None))
+        prompt_time = _number(getattr(usage, "prompt_time", None))
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = _number(getattr(details, "cached_tokens", None))
+        with self._lock:
+            entry = self._layouts.setdefault(
+                layout,
+                {
+                    "requests": 0,
+                    "prefixes": set(),
+                    "latency_ms": 0.0,
+                    "usage_reports": 0,
+                    "prompt_tokens": 0.0,
+                    "prompt_time_ms": 0.0,
+                    "cached_tokens": 0.0,
+                },
+            )
+            entry["requests"] += 1
+            entry["latency_ms"] += latency_ms
+            if len(entry["prefixes"]) < _MAX_TRACKED_PREFIXES:
+                entry["prefixes"].add(prefix_key)
+            if prompt_tokens is not None:
+                entry["usage_reports"] += 1
+                entry["prompt_tokens"] += prompt_tokens
+                entry["prompt_time_ms"] += (prompt_time or 0.0) * 1000
+                entry["cached_tokens"] += cached_tokens or 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = {}
+            for layout, entry in self._layouts.items():
+                requests = max(1, entry["requests"])
+                reports = max(1, entry["usage_reports"])
+                result[layout] = {
+                    "requests": entry["requests"],
+                    "distinct_prefixes": len(entry["prefixes"]),
+                    "avg_latency_ms": round(entry["latency_ms"] / requests, 1),
+                    "avg_prompt_tokens": round(entry["prompt_tokens"] / reports, 1),
+                    "avg_prompt_time_ms": round(entry["prompt_time_ms"] / reports, 2),
+                    "cached_tokens": int(entry["cached_tokens"]),
+                }
+            return result
+
+
+# ---------------- MODEL ROUTER ---------------- #
+
+# Upper bounds (ms) of the per-route latency histogram buckets.
+LATENCY_BUCKETS_MS = (250, 500, 1000, 2000, 4000, 8000, 16000)
+
+
+class _ModelLatency:
+    __slots__ = ("samples", "histogram", "count", "errors", "p95_ms", "degraded_until")
+
+    def __init__(self, window: int):
+        self.samples: deque[float] = deque(maxlen=window)
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.p95_ms = 0.0
+        self.degraded_until = 0.0
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ModelRouter:
+    """Chooses a model per call type and sheds load from slow models.
+
+    Each route (``chat_short``, ``checkin``, ...) maps to a model. Latency of
+    every call (failures included) is kept in a sliding window per route and
+    model, since routes ask for very different amounts of output; streamed
+    calls report their time to first token. When a route's p95 on its model
+    exceeds ``slo_p95_ms`` the route uses ``fallback`` for ``cooldown_s``,
+    after which it gets a fresh window and the model is tried again.
+    """
+
+    def __init__(
+        self,
+        routes: dict[str, str],
+        fallback: str,
+        slo_p95_ms: float = 6000,
+        cooldown_s: float = 120,
+        window: int = 200,
+        min_samples: int = 20,
+    ):
+        self.routes = dict(routes)
+        self.fallback = fallback
+        self.slo_p95_ms = slo_p95_ms
+        self.cooldown_s = cooldown_s
+        self.window = max(1, window)
+        self.min_samples = max(1, min_samples)
+        self._lock = threading.Lock()
+        self._pools: dict[tuple[str, str], _ModelLatency] = {}
+        self._decisions: dict[str, int] = {}
+        self.downgrades = 0
+
+    def _pool(self, route: str, model: str) -> _ModelLatency:
+        entry = self._pools.get((route, model))
+        if entry is None:
+            entry = self._pools[(route, model)] = _ModelLatency(self.window)
+        return entry
+
+    def choose(self, route: str, default: Optional[str] = None) -> str:
+        """Return the model to use for ``route`` right now."""
+        model = self.routes.get(route) or default or self.fallback
+        with self._lock:
+            entry = self._pool(route, model)
+            if model != self.fallback and entry.degraded_until:
+                if time.monotonic() < entry.degraded_until:
+                    model = self.fallback
+                else:
+                    # Cooldown over: judge the model on fresh samples only.
+                    entry.degraded_until = 0.0
+                    entry.samples.clear()
+                    entry.p95_ms = 0.0
+            key = f"{route}->{model}"
+            self._decisions[key] = self._decisions.get(key, 0) + 1
+        return model
+
+    def record(self, route: str, model: str, latency_ms: float, ok: bool = True):
+        with self._lock:
+            entry = self._pool(route, model)
+            entry.count += 1
+            entry.errors += int(not ok)
+            entry.samples.append(latency_ms)
+            bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if latency_ms <= bound), len(LATENCY_BUCKETS_MS))
+            entry.histogram[bucket] += 1
+            if len(entry.samples) < self.min_samples:
+                return
+            entry.p95_ms = _percentile(list(entry.samples), 0.95)
+            if model != self.fallback and not entry.degraded_until and entry.p95_ms > self.slo_p95_ms:
+                entry.degraded_until = time.monotonic() + self.cooldown_s
+                self.downgrades += 1
+                logger.warning(
+                    "Route %s on %s: p95 %.0fms breaches the %.0fms SLO; routing to %s for %ds",
+                    route,
+                    model,
+                    entry.p95_ms,
+                    self.slo_p95_ms,
+                    self.fallback,
+                    self.cooldown_s,
+                )
+
+    @contextmanager
+    def track(self, route: str, model: str) -> Iterator[None]:
+        """Record the latency of the enclosed call against ``route`` on ``model``."""
+        started = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.record(route, model, (time.monotonic() - started) * 1000, ok=False)
+            raise
+        self.record(route, model, (time.monotonic() - started) * 1000)
+
+    def stats(self) -> dict:
+        labels = [f"le_{bound}" for bound in LATENCY_BUCKETS_MS] + ["inf"]
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "routes": dict(self.routes),
+                "fallback": self.fallback,
+                "slo_p95_ms": self.slo_p95_ms,
+                "downgrades": self.downgrades,
+                "decisions": dict(self._decisions),
+                "latency": {
+                    f"{route}->{model}": {
+                        "count": entry.count,
+                        "errors": entry.errors,
+                        "p50_ms": round(_percentile(list(entry.samples), 0.5), 1) if entry.samples else 0.0,
+                        "p95_ms": round(entry.p95_ms, 1),
+                        "degraded": entry.degraded_until > now,
+                        "histogram": dict(zip(labels, entry.histogram)),
+                    }
+                    for (route, model), entry in self._pools.items()
+                },
+            }
@@ -1,25 +1,188 @@
 import sqlite3
+import threading
 import time
 import json
-from bot.config import DB_PATH, logger
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, TypeVar
+from bot.config import (
+    DB_PATH,
+    DB_POOL_SIZE,
+    DB_CACHE_SIZE_KB,
+    DB_MMAP_SIZE_MB,
+    DB_STATEMENT_CACHE_SIZE,
+    MESSAGE_WRITE_BEHIND,
+    WRITE_BEHIND_FLUSH_MS,
+    WRITE_BEHIND_BATCH_SIZE,
+    WRITE_BEHIND_MAX_PENDING,
+    CONTEXT_CACHE_MAX_USERS,
+    CONTEXT_CACHE_MAX_MB,
+    CONTEXT_CACHE_TTL_SECONDS,
+    logger,
+)
+from bot.context_cache import RecentMessageCache
+from bot.db import ConnectionPool, DBExecutor, WriteBehindQueue
+
+T = TypeVar("T")
+
+# Size of the per-user conversation window handed to the model.
+RECENT_MESSAGE_LIMIT = 50
 
 # ---------------- DATABASE SETUP ---------------- #
 
 
 def _get_connection() -> sqlite3.Connection:
-    """Get a SQLite connection with WAL mode for better concurrency."""
-    conn = sqlite3.connect(DB_PATH, timeout=30)
+    """Open a new tuned SQLite connection (WAL mode for better concurrency)."""
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=30,
+        check_same_thread=False,
+        cached_statements=DB_STATEMENT_CACHE_SIZE,
+    )
     conn.execute("PRAGMA journal_mode=WAL")
     conn.execute("PRAGMA busy_timeout=30000")
     conn.execute("PRAGMA foreign_keys=ON")
+    # WAL + NORMAL only fsyncs at checkpoints; committed data survives app crashes.
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{max(0, DB_CACHE_SIZE_KB)}")
+    conn.execute(f"PRAGMA mmap_size={max(0, DB_MMAP_SIZE_MB) * 1024 * 1024}")
+    conn.execute("PRAGMA temp_store=MEMORY")
     conn.row_factory = sqlite3.Row
     return conn
 
 
+# Threads outside the executor that also check out connections: the write-behind
+# writer and the retention job (asyncio.to_thread). init_db and the vector
+# backfill only run at startup or from the CLI, when nothing else competes.
+_BACKGROUND_CONNECTIONS = 2
+
+_pool = ConnectionPool(_get_connection, size=DB_POOL_SIZE + _BACKGROUND_CONNECTIONS)
+# One DB thread per executor connection; the extra pool slots keep background
+# work from making executor jobs wait on the pool.
+_executor = DBExecutor(workers=DB_POOL_SIZE)
+
+
+def _connection():
+    """Check out a pooled connection; nested calls on one thread share it."""
+    return _pool.connection()
+
+
+async def run_db(fn: Callable[..., T], *args, **kwargs) -> T:
+    """Await a blocking storage call on the dedicated DB executor."""
+    return await _executor.run(fn, *args, **kwargs)
+
+
+def close_db():
+    """Drain the DB executor, flush buffered messages and close pooled connections."""
+    _executor.shutdown()
+    _message_writer.stop()
+    _pool.close()
+    logger.info("Database connections closed")
+
+
+def get_db_pool_stats() -> dict:
+    """Return connection pool counters (hits, waits, open connections)."""
+    return _pool.stats()
+
+
+def get_db_executor_stats() -> dict:
+    """Return DB executor queue depth and latency counters."""
+    return _executor.stats()
+
+
+def get_context_cache_stats() -> dict:
+    """Return recent-message cache hit/miss counters and size."""
+    return _recent_cache.stats()
+
+
+def get_write_behind_stats() -> dict:
+    """Return write-behind queue counters (pending rows, batch sizes, backpressure)."""
+    return {"enabled": MESSAGE_WRITE_BEHIND, **_message_writer.stats()}
+
+
+# ---------------- UNIT OF WORK ---------------- #
+
+_uow_state = threading.local()
+
+
+def _in_unit_of_work() -> bool:
+    return getattr(_uow_state, "callbacks", None) is not None
+
+
+def _commit(conn: sqlite3.Connection):
+    """Commit now, or defer to the enclosing unit of work."""
+    if not _in_unit_of_work():
+        conn.commit()
+
+
+def _run_callbacks(callbacks: list[tuple[Callable[[], None], bool]]):
+    failure: Optional[Exception] = None
+    for callback, required in callbacks:
+        try:
+            callback()
+        except Exception as exc:
+            logger.warning("Post-commit callback failed: %s", exc)
+            if required and failure is None:
+                failure = exc
+    if failure is not None:
+        raise failure
+
+
+@contextmanager
+def unit_of_work() -> Iterator[sqlite3.Connection]:
+    """Group every write in the block into one transaction and one commit.
+
+    Memory functions called inside the block share this thread's connection and
+    skip their own commits. The write lock is taken up front (BEGIN IMMEDIATE) so
+    read-modify-write steps cannot fail half-way on a lock upgrade. Nested blocks
+    join the outermost one. Work registered with ``on_commit`` runs after commit.
+    """
+    if _in_unit_of_work():
+        with _connection() as conn:
+            yield conn
+        return
+
+    with _connection() as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        _uow_state.callbacks = []
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            callbacks, _uow_state.callbacks = _uow_state.callbacks, None
+    _run_callbacks(callbacks)
+
+
+def on_commit(callback: Callable[[], None], required: bool = False):
+    """Run ``callback`` once the current unit of work commits (or now, if none).
+
+    Failures are logged; a ``required`` callback's failure is also raised to the
+    caller once every callback has run (the commit itself stands).
+    """
+    if _in_unit_of_work():
+        _uow_state.callbacks.append((callback, required))
+        return
+    _run_callbacks([(callback, required)])
+
+
 def init_db():
     """Create tables if they don't exist."""
-    conn = _get_connection()
-    try:
+    with _connection() as conn:
+        # Incremental auto-vacuum lets retention hand freed pages back to the OS.
+        # Switching modes needs a VACUUM, which is only free on a brand-new file.
+        is_new = conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0
+        if is_new and conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+        # Older databases indexed the raw slot, which skipped users whose slot is NULL.
+        old_index = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND name = 'idx_users_checkin_due'"
+        ).fetchone()
+        if old_index and "coalesce" not in (old_index[0] or "").lower():
+            conn.execute("DROP INDEX idx_users_checkin_due")
         conn.executescript("""
             CREATE TABLE IF NOT EXISTS users (
                 user_id    INTEGER PRIMARY KEY,
@@ -43,6 +206,11 @@ def init_db():
             CREATE INDEX IF NOT EXISTS idx_messages_user
                 ON messages(user_id, created_at DESC);
 
+            -- Check-in sweeps only walk opted-in users, keyed by their last slot.
+            CREATE INDEX IF NOT EXISTS idx_users_checkin_due
+                ON users(coalesce(last_checkin_slot, ''), user_id)
+                WHERE checkin_enabled = 1;
+
             CREATE TABLE IF NOT EXISTS relational_memory (
                 user_id INTEGER PRIMARY KEY,
                 preferred_name TEXT DEFAULT '',
@@ -63,6 +231,49 @@ def init_db():
                 updated_at REAL NOT NULL,
                 FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
             );
+
+            -- Messages moved out of the hot table by retention, zlib-compressed per batch.
+            CREATE TABLE IF NOT EXISTS messages_archive (
+                id              INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id         INTEGER NOT NULL,
+                first_created_at REAL NOT NULL,
+                last_created_at REAL NOT NULL,
+                row_count       INTEGER NOT NULL,
+                payload         BLOB NOT NULL,
+                archived_at     REAL NOT NULL
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_messages_archive_user
+                ON messages_archive(user_id, first_created_at);
+
+            -- Rolling summary of each user's older turns, up to covered_until.
+            CREATE TABLE IF NOT EXISTS conversation_summaries (
+                user_id       INTEGER PRIMARY KEY,
+                summary       TEXT NOT NULL DEFAULT '',
+                covered_until REAL NOT NULL DEFAULT 0,
+                folded_count  INTEGER NOT NULL DEFAULT 0,
+                updated_at    REAL NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+            );
+
+            -- Check-in pre-generated for a user's next slot, valid until expires_at.
+            CREATE TABLE IF NOT EXISTS checkin_pool (
+                user_id    INTEGER PRIMARY KEY,
+                slot       TEXT NOT NULL,
+                message    TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+            );
+
+            -- Telegram update_ids already accepted by a webhook, for dropping redeliveries.
+            CREATE TABLE IF NOT EXISTS processed_updates (
+                update_id INTEGER PRIMARY KEY,
+                seen_at   REAL NOT NULL
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_processed_updates_seen
+                ON processed_updates(seen_at);
         """)
 
         # Lightweight forward-compatible migration for older DBs.
@@ -75,10 +286,55 @@ def init_db():
         if "username" not in user_cols:
             conn.execute("ALTER TABLE users ADD COLUMN username TEXT DEFAULT ''")
 
+        _init_fts(conn)
         conn.commit()
         logger.info("Database initialized at %s", DB_PATH)
-    finally:
-        conn.close()
+
+
+def _init_fts(conn: sqlite3.Connection):
+    """Create the FTS5 recall index over messages and keep it in sync via triggers.
+
+    The index is contentless (text lives only in ``messages``). Each row also
+    indexes a ``user_key`` token, so per-user searches intersect posting lists
+    instead of filtering every match.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+    ).fetchone()
+    try:
+        conn.executescript("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                user_key,
+                body,
+                content='',
+                tokenize='porter unicode61'
+            );
+
+            CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+                INSERT INTO messages_fts (rowid, user_key, body)
+                VALUES (new.id, 'u' || replace(new.user_id, '-', 'n'), new.content);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, user_key, body)
+                VALUES ('delete', old.id, 'u' || replace(old.user_id, '-', 'n'), old.content);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF user_id, content ON messages BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, user_key, body)
+                VALUES ('delete', old.id, 'u' || replace(old.user_id, '-', 'n'), old.content);
+                INSERT INTO messages_fts (rowid, user_key, body)
+                VALUES (new.id, 'u' || replace(new.user_id, '-', 'n'), new.content);
+            END;
+        """)
+    except sqlite3.OperationalError as exc:
+        logger.warning("SQLite FTS5 unavailable; local recall disabled: %s", exc)
+        return
+    if not exists:
+        conn.execute("""
+            INSERT INTO messages_fts (rowid, user_key, body)
+            SELECT id, 'u' || replace(user_id, '-', 'n'), content FROM messages
+        """)
 
 
 # ---------------- USER MANAGEMENT ---------------- #
@@ -86,8 +342,7 @@ def init_db():
 
 def register_user(user_id: int, chat_id: int, first_name: str = "", username: str = ""):
     """Register a user and keep profile fields fresh."""
-    conn = _get_connection()
-    try:
+    with _connection() as conn:
         conn.execute(
             """
             INSERT INTO users (user_id, chat_id, first_name, username, created_at)
@@ -122,16 +377,13 @@ def register_user(user_id: int, chat_id: int, first_name: str = "", username: st
             """,
             (user_id, now),
         )
-        conn.commit()
+        _commit(conn)
         logger.info("Registered user %d (chat_id=%d)", user_id, chat_id)
-    finally:
-        conn.close()
 
 
 def get_user_profile(user_id: int) -> dict:
     """Return persisted user profile fields used for personalization."""
-    conn = _get_connection()
-    try:
+    with _connection() as conn:
         row = conn.execute(
             """
             SELECT user_id, chat_id, first_name, username
@@ -148,40 +400,31 @@ def get_user_profile(user_id: int) -> dict:
             "first_name": row["first_name"] or "",
             "username": row["username"] or "",
         }
-    finally:
-        conn.close()
 
 
 def set_checkin_enabled(user_id: int, enabled: bool):
     """Enable or disable check-ins for a user."""
-    conn = _get_connection()
-    try:
+    with _connection() as conn:
         conn.execute(
             "UPDATE users SET checkin_enabled = ? WHERE user_id = ?",
             (1 if enabled else 0, user_id),
         )
-        conn.commit()
-    finally:
-        conn.close()
+        _commit(conn)
 
 
 def get_checkin_enabled(user_id: int) -> bool:
     """Check if a user has check-ins enabled."""
-    conn = _get_connection()
-    try:
+    with _connection() as conn:
         row = conn.execute(
             "SELECT checkin_enabled FROM users WHERE user_id = ?",
             (user_id,),
         ).fetchone()
         return bool(row["checkin_enabled"]) if row else False
-    finally:
-        conn.close()
 
 
 def get_all_checkin_users() -> list[dict]:
     """Get all users with check-ins enabled."""
-    conn = _get_connection()
-    try:
+    with _connection() as conn:
         rows = conn.execute(
             """
             SELECT user_id, chat_id, first_name, username, last_checkin_slot
@@ -190,49 +433,302 @@ def get_all_checkin_users() -> list[dict]:
             """
         ).fetchall()
         return [dict(row) for row in rows]
-    finally:
-        conn.close()
+
+
+def iter_due_checkin_users(slot: str, chunk_size: int = 200) -> Iterator[list[dict]]:
+    """Yield opted-in users not yet pinged in ``slot``, ``chunk_size`` at a time.
+
+    Walks ``idx_users_checkin_due`` one last-slot group at a time (skipping the
+    group equal to ``slot``) with keyset pagination on user_id, so only due users
+    are read and no connection is held between chunks. A NULL last slot counts
+    as ``''`` (never pinged).
+    """
+    chunk_size = max(1, chunk_size)
+    group = _next_checkin_slot_group(None)
+    while group is not None:
+        if group != slot:
+            after = None
+            while True:
+                chunk = _read_checkin_group_chunk(group, after, chunk_size)
+                if chunk:
+                    yield chunk
+                if len(chunk) < chunk_size:
+                    break
+                after = chunk[-1]["user_id"]
+        group = _next_checkin_slot_group(group)
+
+
+def _next_checkin_slot_group(current: Optional[str]) -> Optional[str]:
+    with _connection() as conn:
+        if current is None:
+            row = conn.execute(
+                """
+                SELECT coalesce(last_checkin_slot, '') AS slot FROM users
+                WHERE checkin_enabled = 1
+                ORDER BY coalesce(last_checkin_slot, '')
+                LIMIT 1
+                """
+            ).fetchone()
+        else:
+            row = conn.execute(
+                """
+                SELECT coalesce(last_checkin_slot, '') AS slot FROM users
+                WHERE checkin_enabled = 1 AND coalesce(last_checkin_slot, '') > ?
+                ORDER BY coalesce(last_checkin_slot, '')
+                LIMIT 1
+                """,
+                (current,),
+            ).fetchone()
+        return row["slot"] if row else None
+
+
+def _read_checkin_group_chunk(group: str, after: Optional[int], limit: int) -> list[dict]:
+    with _connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT user_id, chat_id, first_name, username, last_checkin_slot
+            FROM users
+            WHERE checkin_enabled = 1
+              AND coalesce(last_checkin_slot, '') = ?
+              AND user_id > coalesce(?, -9223372036854775808)
+            ORDER BY user_id
+            LIMIT ?
+            """,
+            (group, after, limit),
+        ).fetchall()
+        return [dict(row) for row in rows]
 
 
 def update_last_checkin_slot(user_id: int, slot: str):
     """Update the last check-in slot for anti-spam."""
-    conn = _get_connection()
-    try:
+    with _connection() as conn:
         conn.execute(
             "UPDATE users SET last_checkin_slot = ? WHERE user_id = ?",
             (slot, user_id),
         )
-        conn.commit()
-    finally:
-        conn.close()
+        _commit(conn)
+
+
+def update_last_checkin_slot_bulk(user_ids: list[int], slot: str):
+    """Record the check-in slot for many users in one commit."""
+    if not user_ids:
+        return
+    with _connection() as conn:
+        conn.executemany(
+            "UPDATE users SET last_checkin_slot = ? WHERE user_id = ?",
+            [(slot, user_id) for user_id in user_ids],
+        )
+        _commit(conn)
+
+
+# ---------------- CHECK-IN POOL ---------------- #
+
+
+def save_pregenerated_checkins(rows: list[tuple[int, str, str, float]]):
+    """Store ``(user_id, slot, message, expires_at)`` rows, replacing older entries."""
+    if not rows:
+        return
+    now = time.time()
+    with _connection() as conn:
+        conn.executemany(
+            """
+            INSERT INTO checkin_pool (user_id, slot, message, created_at, expires_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                slot = excluded.slot,
+                message = excluded.message,
+                created_at = excluded.created_at,
+                expires_at = excluded.expires_at
+            """,
+            [(user_id, slot, message, now, expires_at) for user_id, slot, message, expires_at in rows],
+        )
+        _commit(conn)
+
+
+def _read_pregenerated_checkins(conn: sqlite3.Connection, user_ids: list[int], slot: str, now: float) -> dict[int, str]:
+    """Unexpired entries for ``slot`` that are still current.
+
+    An entry is stale once the user has written since it was generated: it
+    was based on context that no longer reflects how they are doing.
+    """
+    placeholders = ",".join("?" for _ in user_ids)
+    rows = conn.execute(
+        f"""
+        SELECT p.user_id, p.message FROM checkin_pool p
+        WHERE p.user_id IN ({placeholders}) AND p.slot = ? AND p.expires_at > ?
+          AND NOT EXISTS (
+              SELECT 1 FROM messages m
+              WHERE m.user_id = p.user_id AND m.role = 'user' AND m.created_at >= p.created_at
+          )
+        """,
+        (*user_ids, slot, now),
+    ).fetchall()
+    return {row["user_id"]: row["message"] for row in rows}
+
+
+def get_pregenerated_user_ids(user_ids: list[int], slot: str, now: Optional[float] = None) -> set[int]:
+    """Users among ``user_ids`` that already have a current check-in for ``slot``."""
+    now = time.time() if now is None else now
+    found: set[int] = set()
+    with _connection() as conn:
+        for start in range(0, len(user_ids), _BULK_CHUNK_SIZE):
+            found.update(_read_pregenerated_checkins(conn, user_ids[start:start + _BULK_CHUNK_SIZE], slot, now))
+    return found
+
+
+def take_pregenerated_checkins(user_ids: list[int], slot: str, now: Optional[float] = None) -> dict[int, str]:
+    """Remove and return current pre-generated check-ins for ``slot``, by user id.
+
+    Stale entries (the user has written since) are discarded, not returned.
+    """
+    now = time.time() if now is None else now
+    taken: dict[int, str] = {}
+    with _connection() as conn:
+        for start in range(0, len(user_ids), _BULK_CHUNK_SIZE):
+            taken.update(_read_pregenerated_checkins(conn, user_ids[start:start + _BULK_CHUNK_SIZE], slot, now))
+        # Taken and stale entries both go; expired ones are left to the purge.
+        conn.executemany(
+            "DELETE FROM checkin_pool WHERE user_id = ? AND slot = ? AND expires_at > ?",
+            [(user_id, slot, now) for user_id in user_ids],
+        )
+        _commit(conn)
+    return taken
+
+
+def purge_expired_checkins(now: Optional[float] = None) -> int:
+    """Delete expired pool entries; returns rows removed."""
+    now = time.time() if now is None else now
+    with _connection() as conn:
+        deleted = conn.execute("DELETE FROM checkin_pool WHERE expires_at <= ?", (now,)).rowcount
+        _commit(conn)
+    return deleted
+
+
+# ---------------- PROCESSED UPDATES ---------------- #
+
+
+def claim_update_id(update_id: int, now: float, seen_after: float) -> bool:
+    """Record ``update_id`` as seen; False if it was already seen after ``seen_after``.
+
+    A single upsert, so concurrent workers sharing the database cannot both
+    claim the same update; entries older than ``seen_after`` are reclaimed.
+    """
+    with _connection() as conn:
+        claimed = conn.execute(
+            """
+            INSERT INTO processed_updates (update_id, seen_at) VALUES (?, ?)
+            ON CONFLICT(update_id) DO UPDATE SET seen_at = excluded.seen_at
+            WHERE processed_updates.seen_at <= ?
+            """,
+            (update_id, now, seen_after),
+        ).rowcount
+        _commit(conn)
+    return claimed > 0
+
+
+def release_update_id(update_id: int):
+    """Forget ``update_id`` so a redelivery of it is processed."""
+    with _connection() as conn:
+        conn.execute("DELETE FROM processed_updates WHERE update_id = ?", (update_id,))
+        _commit(conn)
+
+
+def purge_processed_updates(before: float) -> int:
+    """Delete update ids seen before ``before``; returns rows removed."""
+    with _connection() as conn:
+        deleted = conn.execute("DELETE FROM processed_updates WHERE seen_at < ?", (before,)).rowcount
+        _commit(conn)
+    return deleted
 
 
 # ---------------- MESSAGE MEMORY ---------------- #
 
 
-def save_message(user_id: int, role: str, content: str):
-    """Save a message to the database."""
-    conn = _get_connection()
-    try:
+def save_message(user_id: int, role: str, content: str) -> float:
+    """Save a message to the database (buffered when write-behind is enabled).
+
+    Returns the message's ``created_at``, which together with ``user_id``
+    identifies the row.
+    """
+    row = (user_id, role, content, time.time())
+    if MESSAGE_WRITE_BEHIND:
+        # Buffer only once the surrounding unit of work (if any) has committed.
+        on_commit(lambda: _buffer_message(row), required=True)
+        return row[3]
+
+    with _connection() as conn:
         conn.execute(
             "INSERT INTO messages (user_id, role, content, created_at) VALUES (?, ?, ?, ?)",
-            (user_id, role, content, time.time()),
+            row,
         )
         if role == "user":
-            now = time.time()
-            conn.execute(
-                """
-                INSERT INTO user_ritual_state (user_id, user_message_count, updated_at)
-                VALUES (?, 1, ?)
-                ON CONFLICT(user_id) DO UPDATE SET
-                    user_message_count = user_ritual_state.user_message_count + 1,
-                    updated_at = excluded.updated_at
-                """,
-                (user_id, now),
+            _bump_user_message_counts(conn, {user_id: 1})
+        _commit(conn)
+    on_commit(lambda: _recent_cache.append(user_id, {"role": role, "content": content}))
+    return row[3]
+
+
+def _buffer_message(row: tuple):
+    """Queue a committed message for write-behind, then add it to the cached window.
+
+    ``put`` fails only when the buffer is full and the inline flush fails; the
+    error propagates and the cache is left alone, so nothing shows a message
+    that will never be stored.
+    """
+    _message_writer.put(row)
+    user_id, role, content, _created_at = row
+    _recent_cache.append(user_id, {"role": role, "content": content})
+
+
+def _bump_user_message_counts(conn: sqlite3.Connection, counts: dict[int, int]):
+    now = time.time()
+    conn.executemany(
+        """
+        INSERT INTO user_ritual_state (user_id, user_message_count, updated_at)
+        VALUES (?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            user_message_count = user_ritual_state.user_message_count + excluded.user_message_count,
+            updated_at = excluded.updated_at
+        """,
+        [(user_id, count, now) for user_id, count in counts.items()],
+    )
+
+
+def _write_message_batch(rows: list[tuple], publishing):
+    """Persist buffered messages with one executemany and one commit."""
+    counts: dict[int, int] = {}
+    for user_id, role, _content, _created_at in rows:
+        if role == "user":
+            counts[user_id] = counts.get(user_id, 0) + 1
+
+    with _connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO messages (user_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                rows,
             )
-        conn.commit()
-    finally:
-        conn.close()
+            if counts:
+                _bump_user_message_counts(conn, counts)
+            with publishing():
+                conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+_message_writer = WriteBehindQueue(
+    _write_message_batch,
+    batch_size=WRITE_BEHIND_BATCH_SIZE,
+    interval_ms=WRITE_BEHIND_FLUSH_MS,
+    max_pending=WRITE_BEHIND_MAX_PENDING,
+    name="message-writer",
+)
+
+
+def flush_pending_messages() -> int:
+    """Write any buffered messages now; returns the number of rows written."""
+    return _message_writer.flush()
 
 
 def _safe_load_list(raw: str) -> list[str]:
@@ -263,8 +759,7 @@ def _merge_unique(existing: list[str], new_items: list[str], limit: int = 10) ->
 
 def get_relational_memory(user_id: int) -> dict:
     """Return structured relational memory for long-term personalization."""
-    conn = _get_connection()
-    try:
+    with _connection() as conn:
         row = conn.execute(
             """
             SELECT preferred_name, stressors, wins, coping_preferences, boundaries, life_themes
@@ -290,8 +785,6 @@ def get_relational_memory(user_id: int) -> dict:
             "boundaries": _safe_load_list(row["boundaries"]),
             "life_themes": _safe_load_list(row["life_themes"]),
         }
-    finally:
-        conn.close()
 
 
 def update_relational_memory(
@@ -312,8 +805,7 @@ def update_relational_memory(
     merged_boundaries = _merge_unique(existing["boundaries"], boundaries or [])
     merged_themes = _merge_unique(existing["life_themes"], life_themes or [], limit=8)
 
-    conn = _get_connection()
-    try:
+    with _connection() as conn:
         now = time.time()
         conn.execute(
             """
@@ -348,16 +840,31 @@ def update_relational_memory(
                 now,
             ),
         )
-        conn.commit()
-    finally:
-        conn.close()
+        _commit(conn)
 
 
 def get_ritual_state(user_id: int) -> dict:
     """Return continuity state used for weekly reflections and milestone acknowledgments."""
-    conn = _get_connection()
-    try:
-        row = conn.execute(
+    row, pending = _message_writer.read_consistent(
+        lambda: _read_ritual_row(user_id),
+        lambda item: item[0] == user_id and item[1] == "user",
+    )
+    if not row:
+        return {
+            "user_message_count": len(pending),
+            "last_weekly_reflection_at": 0.0,
+            "last_milestone_ack_at": 0.0,
+        }
+    return {
+        "user_message_count": int(row["user_message_count"] or 0) + len(pending),
+        "last_weekly_reflection_at": float(row["last_weekly_reflection_at"] or 0.0),
+        "last_milestone_ack_at": float(row["last_milestone_ack_at"] or 0.0),
+    }
+
+
+def _read_ritual_row(user_id: int) -> Optional[sqlite3.Row]:
+    with _connection() as conn:
+        return conn.execute(
             """
             SELECT user_message_count, last_weekly_reflection_at, last_milestone_ack_at
             FROM user_ritual_state
@@ -365,25 +872,11 @@ def get_ritual_state(user_id: int) -> dict:
             """,
             (user_id,),
         ).fetchone()
-        if not row:
-            return {
-                "user_message_count": 0,
-                "last_weekly_reflection_at": 0.0,
-                "last_milestone_ack_at": 0.0,
-            }
-        return {
-            "user_message_count": int(row["user_message_count"] or 0),
-            "last_weekly_reflection_at": float(row["last_weekly_reflection_at"] or 0.0),
-            "last_milestone_ack_at": float(row["last_milestone_ack_at"] or 0.0),
-        }
-    finally:
-        conn.close()
 
 
 def mark_weekly_reflection(user_id: int):
     """Mark that a weekly reflection ritual was suggested."""
-    conn = _get_connection()
-    try:
+    with _connection() as conn:
         now = time.time()
         conn.execute(
             """
@@ -395,15 +888,12 @@ def mark_weekly_reflection(user_id: int):
             """,
             (user_id, now, now),
         )
-        conn.commit()
-    finally:
-        conn.close()
+        _commit(conn)
 
 
 def mark_milestone_ack(user_id: int):
     """Mark that a milestone acknowledgment was suggested."""
-    conn = _get_connection()
-    try:
+    with _connection() as conn:
         now = time.time()
         conn.execute(
             """
@@ -415,29 +905,249 @@ def mark_milestone_ack(user_id: int):
             """,
             (user_id, now, now),
         )
-        conn.commit()
-    finally:
-        conn.close()
+        _commit(conn)
+
+
+_recent_cache = RecentMessageCache(
+    window=RECENT_MESSAGE_LIMIT,
+    max_users=CONTEXT_CACHE_MAX_USERS,
+    max_bytes=CONTEXT_CACHE_MAX_MB * 1024 * 1024,
+    ttl_seconds=CONTEXT_CACHE_TTL_SECONDS,
+)
+
+
+# Another process's write-behind buffer can commit a row this long after its
+# created_at; the staleness check looks back this far for rows it has not seen.
+_REMOTE_WRITE_SLACK_SECONDS = 60.0
 
 
 def get_recent_messages(user_id: int) -> list[dict]:
-    """Get ALL messages for a user (oldest first)."""
-    conn = _get_connection()
-    try:
+    """Get the latest RECENT_MESSAGE_LIMIT messages for a user (oldest first)."""
+    return _recent_cache.get(user_id, lambda: _load_recent_messages(user_id), _unchanged_windows)
+
+
+def invalidate_recent_messages(user_id: Optional[int] = None):
+    """Drop cached windows after out-of-band changes to the messages table."""
+    _recent_cache.invalidate(user_id)
+
+
+def _load_recent_messages(user_id: int) -> tuple[list[dict], tuple]:
+    """Read a window plus the marker ``_unchanged_windows`` checks it against.
+
+    The marker is the newest stored id and created_at, and how many buffered
+    rows were folded in; those rows get ids above it once they are flushed.
+    """
+    (stored, newest_id, newest_at), pending = _message_writer.read_consistent(
+        lambda: _read_recent_messages(user_id),
+        lambda item: item[0] == user_id,
+    )
+    buffered = [{"role": role, "content": content} for _uid, role, content, _ts in pending]
+    marker = (newest_id, newest_at - _REMOTE_WRITE_SLACK_SECONDS, len(pending))
+    return (stored + buffered)[-RECENT_MESSAGE_LIMIT:], marker
+
+
+def _read_recent_messages(user_id: int) -> tuple[list[dict], int, float]:
+    with _connection() as conn:
         rows = conn.execute(
             """
-            SELECT role, content
+            SELECT id, role, content, created_at
             FROM (
-                SELECT role, content, created_at
+                SELECT id, role, content, created_at
                 FROM messages
                 WHERE user_id = ?
                 ORDER BY created_at DESC
-                LIMIT 50
-            ) 
+                LIMIT ?
+            )
             ORDER BY created_at ASC
             """,
+            (user_id, RECENT_MESSAGE_LIMIT),
+        ).fetchall()
+    messages = [{"role": row["role"], "content": row["content"]} for row in rows]
+    newest_id = max((row["id"] for row in rows), default=0)
+    newest_at = max((row["created_at"] for row in rows), default=0.0)
+    return messages, newest_id, newest_at
+
+
+def _unchanged_windows(seen: dict[int, tuple[tuple, int]]) -> set[int]:
+    """Ids of users whose cached window still matches storage.
+
+    Every row stored or buffered after a window was filled must be one this
+    process appended to it. Anything more was written elsewhere (another
+    worker), so the window is reloaded. Each check is a short range seek on
+    ``idx_messages_user``.
+    """
+    def count_new() -> dict[int, int]:
+        with _connection() as conn:
+            return {
+                user_id: conn.execute(
+                    "SELECT COUNT(*) FROM messages WHERE user_id = ? AND created_at > ? AND id > ?",
+                    (user_id, since, newest_id),
+                ).fetchone()[0]
+                for user_id, ((newest_id, since, _buffered), _appended) in seen.items()
+            }
+
+    stored, pending = _message_writer.read_consistent(count_new, lambda item: item[0] in seen)
+    for user_id, *_rest in pending:
+        stored[user_id] += 1
+    return {
+        user_id
+        for user_id, ((_newest_id, _since, buffered), appended) in seen.items()
+        if stored[user_id] == buffered + appended
+    }
+
+
+# Stay well below SQLite's bound-parameter limit.
+_BULK_CHUNK_SIZE = 500
+
+
+def get_recent_messages_bulk(user_ids: list[int], limit: int = RECENT_MESSAGE_LIMIT) -> dict[int, list[dict]]:
+    """Get the latest ``limit`` messages for many users at once (oldest first per user).
+
+    Cached windows are reused; the rest are fetched with a single windowed query
+    per chunk of ids instead of one query per user.
+    """
+    limit = max(1, min(limit, RECENT_MESSAGE_LIMIT))
+    cached = _recent_cache.peek_many(user_ids, _unchanged_windows)
+    result = {user_id: window[-limit:] for user_id, window in cached.items()}
+    missing = [user_id for user_id in dict.fromkeys(user_ids) if user_id not in result]
+    for start in range(0, len(missing), _BULK_CHUNK_SIZE):
+        chunk = missing[start:start + _BULK_CHUNK_SIZE]
+        wanted = set(chunk)
+        stored, pending = _message_writer.read_consistent(
+            lambda: _read_recent_messages_bulk(chunk, limit),
+            lambda item: item[0] in wanted,
+        )
+        for user_id, role, content, _ts in pending:
+            stored[user_id].append({"role": role, "content": content})
+        for user_id, messages in stored.items():
+            result[user_id] = messages[-limit:]
+    return result
+
+
+def _read_recent_messages_bulk(user_ids: list[int], limit: int) -> dict[int, list[dict]]:
+    messages: dict[int, list[dict]] = {user_id: [] for user_id in user_ids}
+    placeholders = ",".join("?" for _ in user_ids)
+    with _connection() as conn:
+        rows = conn.execute(
+            f"""
+            SELECT user_id, role, content
+            FROM (
+                SELECT
+                    user_id,
+                    role,
+                    content,
+                    created_at,
+                    ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY created_at DESC) AS rn
+                FROM messages
+                WHERE user_id IN ({placeholders})
+            )
+            WHERE rn <= ?
+            ORDER BY user_id, created_at ASC
+            """,
+            (*user_ids, limit),
+        ).fetchall()
+    for row in rows:
+        messages[row["user_id"]].append({"role": row["role"], "content": row["content"]})
+    return messages
+
+
+# ---------------- CONVERSATION SUMMARIES ---------------- #
+
+
+def get_conversation_summary(user_id: int) -> dict:
+    """Get a user's rolling summary (empty summary if none yet)."""
+    with _connection() as conn:
+        row = conn.execute(
+            """
+            SELECT summary, covered_until, folded_count, updated_at
+            FROM conversation_summaries
+            WHERE user_id = ?
+            """,
             (user_id,),
+        ).fetchone()
+    if not row:
+        return {"summary": "", "covered_until": 0.0, "folded_count": 0, "updated_at": 0.0}
+    return {
+        "summary": row["summary"] or "",
+        "covered_until": float(row["covered_until"] or 0),
+        "folded_count": int(row["folded_count"] or 0),
+        "updated_at": float(row["updated_at"] or 0),
+    }
+
+
+def save_conversation_summary(user_id: int, summary: str, covered_until: float, folded: int):
+    """Store a new rolling summary covering messages up to ``covered_until``."""
+    with _connection() as conn:
+        conn.execute(
+            """
+            INSERT INTO conversation_summaries (user_id, summary, covered_until, folded_count, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                summary = excluded.summary,
+                covered_until = excluded.covered_until,
+                folded_count = conversation_summaries.folded_count + excluded.folded_count,
+                updated_at = excluded.updated_at
+            """,
+            (user_id, summary, covered_until, folded, time.time()),
+        )
+        _commit(conn)
+
+
+def count_messages_after(user_id: int, after: float) -> int:
+    """Count a user's stored messages newer than ``after``."""
+    with _connection() as conn:
+        row = conn.execute(
+            "SELECT COUNT(*) FROM messages WHERE user_id = ? AND created_at > ?",
+            (user_id, after),
+        ).fetchone()
+    return int(row[0])
+
+
+def get_messages_after(user_id: int, after: float, limit: int) -> list[dict]:
+    """Get up to ``limit`` of a user's messages newer than ``after`` (oldest first)."""
+    with _connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT role, content, created_at
+            FROM messages
+            WHERE user_id = ? AND created_at > ?
+            ORDER BY created_at ASC
+            LIMIT ?
+            """,
+            (user_id, after, limit),
+        ).fetchall()
+    return [{"role": row["role"], "content": row["content"], "created_at": row["created_at"]} for row in rows]
+
+
+def get_summary_candidates(min_unsummarized: int, limit: int = 100, active_since: float = 0.0) -> list[int]:
+    """Users with a message after ``active_since`` and ``min_unsummarized`` newer than their summary.
+
+    Walks ``users`` once and probes ``idx_messages_user`` for each: an EXISTS
+    seek past ``active_since``, then a count of unsummarized rows for users
+    that pass it. Every user row is visited, but message rows are only read
+    for active users.
+    """
+    with _connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT user_id FROM (
+                SELECT
+                    u.user_id,
+                    (
+                        SELECT COUNT(*) FROM messages AS m
+                        WHERE m.user_id = u.user_id AND m.created_at > coalesce(s.covered_until, 0)
+                    ) AS pending
+                FROM users AS u
+                LEFT JOIN conversation_summaries AS s ON s.user_id = u.user_id
+                WHERE EXISTS (
+                    SELECT 1 FROM messages AS m
+                    WHERE m.user_id = u.user_id AND m.created_at > ?
+                )
+            )
+            WHERE pending >= ?
+            ORDER BY pending DESC
+            LIMIT ?
+            """,
+            (active_since, min_unsummarized, limit),
         ).fetchall()
-        return [{"role": row["role"], "content": row["content"]} for row in rows]
-    finally:
-        conn.close()
+    return [row["user_id"] for row in rows]
@@ -1,4 +1,11 @@
-from bot.config import SUPERMEMORY_ENABLED, logger
+from bot.config import (
+    SUPERMEMORY_ENABLED,
+    LOCAL_RECALL_MODE,
+    VECTOR_RECALL_ENABLED,
+    SUMMARIES_ENABLED,
+    SUMMARY_RAW_TURNS,
+    logger,
+)
 from bot.memory import (
     get_recent_messages,
     save_message,
@@ -8,10 +15,19 @@ from bot.memory import (
     get_ritual_state,
     mark_weekly_reflection,
     mark_milestone_ack,
+    get_conversation_summary,
+    count_messages_after,
+    unit_of_work,
+    on_commit,
+    run_db,
 )
+from bot.recall import local_recall
+from bot.vector_store import vector_store, vector_recall
+from bot.text_analysis import analyze
 from bot.supermemory import SupermemoryClient, SupermemoryError
-from typing import Optional
-import re
+from typing import Optional, Sequence
+import asyncio
+from itertools import zip_longest
 import time
 
 
@@ -23,6 +39,9 @@ class MemoryProvider:
         self.super_failures = 0
         self.super_failure_limit = 3
         self.super_client = SupermemoryClient() if self.super_enabled else None
+        self.recall_mode = LOCAL_RECALL_MODE
+        self.vector_enabled = VECTOR_RECALL_ENABLED
+        self.summaries_enabled = SUMMARIES_ENABLED
 
     def _record_failure(self, exc: Exception):
         self.super_failures += 1
@@ -32,11 +51,25 @@ class MemoryProvider:
             logger.warning("Supermemory disabled after repeated failures; falling back to SQLite only.")
 
     def save(self, user_id: int, role: str, content: str, chat_id: Optional[int] = None):
+        with unit_of_work():
+            self.save_local(user_id, role, content)
+            # Never hold the SQLite write lock across a network call.
+            on_commit(lambda: self.index_remote(user_id, role, content, chat_id))
+
+    async def save_async(self, user_id: int, role: str, content: str, chat_id: Optional[int] = None):
+        """Non-blocking save: SQLite on the DB executor, Supermemory on a worker thread."""
+        await run_db(self.save_local, user_id, role, content)
+        await self.index_remote_async(user_id, role, content, chat_id)
+
+    def save_local(self, user_id: int, role: str, content: str):
+        """Persist a message and extracted relational facts to SQLite in one commit."""
         # SQLite remains source-of-truth fallback.
-        save_message(user_id, role, content)
+        extracted = self._extract_relational_facts(content) if role == "user" else {}
+        with unit_of_work():
+            created_at = save_message(user_id, role, content)
+            if self.vector_enabled:
+                on_commit(lambda: self._index_vector(user_id, created_at, content))
 
-        if role == "user":
-            extracted = self._extract_relational_facts(content)
             if any(extracted.values()):
                 update_relational_memory(
                     user_id=user_id,
@@ -48,6 +81,13 @@ class MemoryProvider:
                     life_themes=extracted["life_themes"],
                 )
 
+    def _index_vector(self, user_id: int, created_at: float, content: str):
+        try:
+            vector_store.add(user_id, created_at, content)
+        except OSError as exc:
+            logger.warning("Vector index append failed for user %d: %s", user_id, exc)
+
+    def index_remote(self, user_id: int, role: str, content: str, chat_id: Optional[int] = None):
         if not self.super_enabled or not self.super_client:
             return
 
@@ -57,106 +97,68 @@ class MemoryProvider:
         except SupermemoryError as exc:
             self._record_failure(exc)
 
+    async def index_remote_async(self, user_id: int, role: str, content: str, chat_id: Optional[int] = None):
+        if not self.super_enabled or not self.super_client:
+            return
+        await asyncio.to_thread(self.index_remote, user_id, role, content, chat_id)
+
     def _extract_relational_facts(self, content: str) -> dict:
         """Extract lightweight structured relationship facts from user text."""
-        text = (content or "").strip()
-        lowered = text.lower()
-
-        preferred_name = ""
-        name_patterns = [
-            r"\bmy name is\s+([A-Za-z][A-Za-z'\-]{1,31})\b",
-            r"\bcall me\s+([A-Za-z][A-Za-z'\-]{1,31})\b",
-        ]
-        for pattern in name_patterns:
-            match = re.search(pattern, text, flags=re.IGNORECASE)
-            if match:
-                preferred_name = match.group(1).strip(" .,!?").capitalize()
-                break
-
-        stressors = []
-        stress_match = re.search(
-            r"\b(stressed|worried|anxious|overwhelmed)\s+(about|by)\s+([^.!?]{4,80})",
-            lowered,
-        )
-        if stress_match:
-            stressors.append(stress_match.group(3).strip(" .,!?"))
-
-        wins = []
-        win_match = re.search(
-            r"\b(i managed to|i finally|i did|i'm proud that|i am proud that)\s+([^.!?]{4,90})",
-            lowered,
-        )
-        if win_match:
-            wins.append(win_match.group(2).strip(" .,!?"))
-
-        coping_preferences = []
-        coping_match = re.search(
-            r"\b(it helps when i|i feel better when i|i calm down when i|i like to)\s+([^.!?]{4,90})",
-            lowered,
-        )
-        if coping_match:
-            coping_preferences.append(coping_match.group(2).strip(" .,!?"))
-
-        boundaries = []
-        boundary_match = re.search(
-            r"\b(please don't|do not|don't|i don't want)\s+([^.!?]{4,90})",
-            lowered,
-        )
-        if boundary_match:
-            boundaries.append(boundary_match.group(2).strip(" .,!?"))
-
-        life_themes = []
-        theme_keywords = {
-            "work": ["work", "job", "office", "boss"],
-            "family": ["family", "parents", "mother", "father", "home"],
-            "relationships": ["relationship", "partner", "boyfriend", "girlfriend", "marriage"],
-            "sleep": ["sleep", "insomnia", "rest", "tired"],
-            "health": ["health", "body", "exercise", "diet"],
-            "studies": ["study", "exam", "school", "college", "university"],
-            "finances": ["money", "finance", "debt", "rent", "bills"],
-        }
-        for theme, keywords in theme_keywords.items():
-            if any(word in lowered for word in keywords):
-                life_themes.append(theme)
-
+        features = analyze(content)
         return {
-            "preferred_name": preferred_name,
-            "stressors": stressors,
-            "wins": wins,
-            "coping_preferences": coping_preferences,
-            "boundaries": boundaries,
-            "life_themes": life_themes,
+            "preferred_name": features.stated_name,
+            "stressors": [features.stressor] if features.stressor is not None else [],
+            "wins": [features.win] if features.win is not None else [],
+            "coping_preferences": [features.coping_preference] if features.coping_preference is not None else [],
+            "boundaries": [features.boundary] if features.boundary is not None else [],
+            "life_themes": list(features.life_themes),
         }
 
-    def build_generation_metadata(self, user_id: int, latest_user_text: str) -> dict:
-        """Build metadata for persona continuity, rituals, and emotional guidance."""
+    def build_generation_metadata(
+        self, user_id: int, latest_user_text: str, latest_texts: Sequence[str] = ()
+    ) -> dict:
+        """Build metadata for persona continuity, rituals, and emotional guidance.
+
+        ``latest_texts`` are the individual messages being answered now (a
+        burst); none of them is offered as "last time you said".
+        """
         relational = get_relational_memory(user_id)
         ritual_state = get_ritual_state(user_id)
         now = time.time()
 
         ritual_hints = []
         week_seconds = 7 * 24 * 60 * 60
-        if now - ritual_state["last_weekly_reflection_at"] >= week_seconds:
+        due_weekly = now - ritual_state["last_weekly_reflection_at"] >= week_seconds
+        if due_weekly:
             ritual_hints.append(
                 "Offer a soft weekly reflection question (what felt heavy, what felt helpful this week)."
             )
-            mark_weekly_reflection(user_id)
 
         count = ritual_state["user_message_count"]
-        if count > 0 and count % 25 == 0 and now - ritual_state["last_milestone_ack_at"] > 12 * 60 * 60:
+        due_milestone = (
+            count > 0 and count % 25 == 0 and now - ritual_state["last_milestone_ack_at"] > 12 * 60 * 60
+        )
+        if due_milestone:
             ritual_hints.append(
                 "Add a brief milestone acknowledgment about the user's consistency in showing up."
             )
-            mark_milestone_ack(user_id)
+
+        if due_weekly or due_milestone:
+            with unit_of_work():
+                if due_weekly:
+                    mark_weekly_reflection(user_id)
+                if due_milestone:
+                    mark_milestone_ack(user_id)
 
         recent_user_texts = [
             m.get("content", "")
             for m in reversed(get_recent_messages(user_id))
             if m.get("role") == "user" and m.get("content")
         ]
+        current = {(text or "").strip() for text in (latest_user_text, *latest_texts)}
         follow_up_hint = ""
         for prior in recent_user_texts:
-            if prior.strip() and prior.strip() != (latest_user_text or "").strip():
+            if prior.strip() and prior.strip() not in current:
                 follow_up_hint = f"If relevant, gently reference continuity using: 'Last time you said {prior[:120]}'."
                 break
         if follow_up_hint:
@@ -185,10 +187,32 @@ class MemoryProvider:
             "ritual_hints": ritual_hints,
         }
 
+    async def build_generation_metadata_async(
+        self, user_id: int, latest_user_text: str, latest_texts: Sequence[str] = ()
+    ) -> dict:
+        return await run_db(self.build_generation_metadata, user_id, latest_user_text, latest_texts)
+
     def get_context(self, user_id: int, latest_user_text: str) -> list[dict]:
+        local_messages, hints, recalled = self._local_context(user_id, latest_user_text)
+        snippets = self._search_remote(user_id, latest_user_text) if self._use_remote() else None
+        return self._merge_context(user_id, local_messages, hints, snippets, recalled)
+
+    async def get_context_async(self, user_id: int, latest_user_text: str) -> list[dict]:
+        """Non-blocking get_context: SQLite reads and the remote search run off the event loop."""
+        local_messages, hints, recalled = await run_db(self._local_context, user_id, latest_user_text)
+        snippets = None
+        if self._use_remote():
+            snippets = await asyncio.to_thread(self._search_remote, user_id, latest_user_text)
+        return self._merge_context(user_id, local_messages, hints, snippets, recalled)
+
+    def _use_remote(self) -> bool:
+        return bool(self.super_enabled and self.super_client and self.recall_mode != "primary")
+
+    def _local_context(self, user_id: int, latest_user_text: str) -> tuple[list[dict], list[dict], list[str]]:
+        """Return recent turns, system hints (profile, summary) and recalled snippets."""
         local_messages = get_recent_messages(user_id)
-        local_count = len(local_messages)
         profile = get_user_profile(user_id)
+        recalled = self._local_recall(user_id, latest_user_text)
 
         profile_hint = None
         first_name = (profile.get("first_name") or "").strip()
@@ -207,24 +231,82 @@ class MemoryProvider:
                 ),
             }
 
+        summary_hint = None
+        if self.summaries_enabled:
+            local_messages, summary_hint = self._apply_summary(user_id, local_messages)
+        hints = [hint for hint in (profile_hint, summary_hint) if hint]
+        return local_messages, hints, recalled
+
+    def _apply_summary(self, user_id: int, local_messages: list[dict]) -> tuple[list[dict], Optional[dict]]:
+        """Swap turns already covered by the rolling summary for the summary itself."""
+        summary = get_conversation_summary(user_id)
+        if not summary["summary"]:
+            return local_messages, None
+        # Everything newer than the summary stays verbatim, and never fewer than the raw-turn floor.
+        keep = max(SUMMARY_RAW_TURNS, count_messages_after(user_id, summary["covered_until"]))
+        summary_hint = {
+            "role": "system",
+            "content": "Summary of earlier conversation with this user:\n" + summary["summary"],
+        }
+        return local_messages[-keep:], summary_hint
+
+    def _local_recall(self, user_id: int, latest_user_text: str, limit: int = 5) -> list[str]:
+        """Keyword (FTS5) and vector recall, interleaved and de-duplicated."""
+        if self.recall_mode == "off":
+            return []
+        keyword = local_recall.search(user_id, latest_user_text, limit=limit)
+        semantic: list[str] = []
+        if self.vector_enabled:
+            try:
+                semantic = vector_recall(vector_store, user_id, latest_user_text, limit=limit)
+            except (OSError, ValueError) as exc:
+                logger.warning("Vector recall failed for user %d: %s", user_id, exc)
+
+        merged: list[str] = []
+        for pair in zip_longest(keyword, semantic):
+            for snippet in pair:
+                if snippet and snippet not in merged:
+                    merged.append(snippet)
+        return merged[:limit]
+
+    def _search_remote(self, user_id: int, latest_user_text: str) -> Optional[list[str]]:
+        """Return Supermemory snippets, or None when disabled or the call failed."""
         if not self.super_enabled or not self.super_client:
-            logger.info("Context for user %d: sqlite_only=%d", user_id, local_count)
-            return ([profile_hint] if profile_hint else []) + local_messages
+            return None
 
         try:
             snippets = self.super_client.search_context(user_id=user_id, query_text=latest_user_text)
             self.super_failures = 0
+            return snippets
         except SupermemoryError as exc:
             self._record_failure(exc)
-            logger.info("Context for user %d: sqlite_only=%d (supermemory failed)", user_id, local_count)
-            return ([profile_hint] if profile_hint else []) + local_messages
+            logger.info("Supermemory search failed for user %d; using local context only", user_id)
+            return None
 
-        if not snippets:
-            logger.info("Context for user %d: sqlite_only=%d, supermemory=0", user_id, local_count)
-            return ([profile_hint] if profile_hint else []) + local_messages
+    def _merge_context(
+        self,
+        user_id: int,
+        local_messages: list[dict],
+        hints: list[dict],
+        snippets: Optional[list[str]],
+        recalled: Optional[list[str]] = None,
+    ) -> list[dict]:
+        local_count = len(local_messages)
+        remote_count = min(len(snippets or []), 5)
+        # Local recall covers for Supermemory when it is off, failing or empty.
+        chosen = snippets if remote_count else (recalled or [])
+        logger.info(
+            "Context for user %d: sqlite_only=%d, supermemory=%s, local_recall=%d",
+            user_id,
+            local_count,
+            remote_count if snippets is not None else "off",
+            0 if remote_count else min(len(chosen), 5),
+        )
+        if not chosen:
+            return [*hints, *local_messages]
 
         # Keep injected context concise to avoid excessive token usage.
-        joined = "\n".join(f"- {s}" for s in snippets[:5])
+        joined = "\n".join(f"- {s}" for s in chosen[:5])
         memory_hint = {
             "role": "system",
             "content": (
@@ -233,16 +315,7 @@ class MemoryProvider:
                 f"{joined}"
             ),
         }
-        logger.info(
-            "Context for user %d: sqlite_only=%d, supermemory=%d",
-            user_id,
-            local_count,
-            min(len(snippets), 5),
-        )
-        prefix = [memory_hint]
-        if profile_hint:
-            prefix.append(profile_hint)
-        return [*prefix, *local_messages]
+        return [memory_hint, *hints, *local_messages]
 
 
 memory_provider = MemoryProvider()
@@ -1,6 +1,7 @@
-import re
 from dataclasses import dataclass
 
+from bot.text_analysis import analyze
+
 
 VOICE_PILLARS = [
     "Be calm, grounded, and emotionally present.",
@@ -49,45 +50,12 @@ def build_persona_constitution() -> str:
 
 def infer_emotional_state(text: str) -> str:
     """Classify user's current emotional state using lightweight rules."""
-    lowered = (text or "").strip().lower()
-    if not lowered:
-        return "neutral"
-
-    overwhelmed_patterns = r"\b(overwhelmed|too much|can't handle|burned out|exhausted)\b"
-    lonely_patterns = r"\b(lonely|alone|no one|isolated|left out)\b"
-    hopeful_patterns = r"\b(hopeful|better|progress|improving|finally|proud|grateful)\b"
-    numb_patterns = r"\b(numb|empty|nothing|flat|detached)\b"
-    anxious_patterns = r"\b(anxious|anxiety|panic|worried|scared|afraid)\b"
-    sad_patterns = r"\b(sad|down|low|hurt|crying|heartbroken)\b"
-    angry_patterns = r"\b(angry|frustrated|mad|annoyed|furious)\b"
-
-    if re.search(overwhelmed_patterns, lowered):
-        return "overwhelmed"
-    if re.search(lonely_patterns, lowered):
-        return "lonely"
-    if re.search(hopeful_patterns, lowered):
-        return "hopeful"
-    if re.search(numb_patterns, lowered):
-        return "numb"
-    if re.search(anxious_patterns, lowered):
-        return "anxious"
-    if re.search(sad_patterns, lowered):
-        return "sad"
-    if re.search(angry_patterns, lowered):
-        return "angry"
-    return "neutral"
+    return analyze(text).emotional_state
 
 
 def infer_response_intent(text: str) -> str:
     """Infer user intent to drive response choreography."""
-    lowered = (text or "").strip().lower()
-    if re.search(r"\b(what should i do|help me|next step|plan|how do i|advice)\b", lowered):
-        return "concrete_next_step"
-    if re.search(r"\b(i feel|i am|i'm|it feels|i've been|vent)\b", lowered):
-        return "validation_first"
-    if "?" in lowered:
-        return "reflective_summary"
-    return "gentle_reframe"
+    return analyze(text).response_intent
 
 
 def build_emotional_plan(text: str) -> EmotionalPlan:
@@ -0,0 +1,122 @@
+import re
+import sqlite3
+import threading
+import time
+
+from bot.config import logger
+from bot.memory import RECENT_MESSAGE_LIMIT, _connection
+
+# ---------------- LOCAL RECALL (FTS5) ---------------- #
+
+# Common words that only add noise to a recall query.
+_STOPWORDS = frozenset(
+    """
+    a about after again all am an and any are as at be because been before being
+    but by can could did do does doing don't for from had has have having he her
+    here hers him his how i i'm if in into is it it's its just me more most my
+    no not now of off on once only or other our out over own same she should so
+    some still such than that the their them then there these they this those
+    through to too under until up very was we were what when where which while
+    who why will with would you your yours yeah ok okay really feel feeling
+    """.split()
+)
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+# Longest snippet injected into the prompt.
+_SNIPPET_CHARS = 240
+# Most distinct terms used for one query.
+_MAX_TERMS = 12
+
+
+def _user_key(user_id: int) -> str:
+    return "u" + str(user_id).replace("-", "n")
+
+
+def build_match_query(user_id: int, text: str) -> str:
+    """Turn free text into a user-scoped FTS5 MATCH expression ('' if no usable terms)."""
+    terms = []
+    for word in _WORD_RE.findall((text or "").lower()):
+        word = word.strip("'")
+        if len(word) < 3 or word in _STOPWORDS or word in terms:
+            continue
+        terms.append(word)
+        if len(terms) >= _MAX_TERMS:
+            break
+    if not terms:
+        return ""
+    alternatives = " OR ".join(f'"{term}"' for term in terms)
+    return f'user_key:{_user_key(user_id)} AND body:({alternatives})'
+
+
+class LocalRecall:
+    """BM25-ranked full-text recall over a user's older messages."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.hits = 0
+        self.errors = 0
+        self.total_ms = 0.0
+
+    def search(self, user_id: int, query_text: str, limit: int = 5) -> list[str]:
+        """Return up to ``limit`` snippets from messages older than the recent window."""
+        match = build_match_query(user_id, query_text)
+        if not match:
+            return []
+
+        started = time.perf_counter()
+        try:
+            with _connection() as conn:
+                rows = conn.execute(
+                    """
+                    SELECT m.role, m.content
+                    FROM messages_fts
+                    JOIN messages AS m ON m.id = messages_fts.rowid
+                    WHERE messages_fts MATCH ?
+                      AND m.user_id = ?
+                      AND m.id < coalesce((
+                          SELECT min(id) FROM (
+                              SELECT id FROM messages
+                              WHERE user_id = ?
+                              ORDER BY created_at DESC
+                              LIMIT ?
+                          )
+                      ), 0)
+                    ORDER BY bm25(messages_fts, 0.0, 1.0)
+                    LIMIT ?
+                    """,
+                    (match, user_id, user_id, RECENT_MESSAGE_LIMIT, limit),
+                ).fetchall()
+        except sqlite3.OperationalError as exc:
+            with self._lock:
+                self.errors += 1
+            logger.warning("Local recall failed for user %d: %s", user_id, exc)
+            return []
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        snippets = []
+        for row in rows:
+            content = " ".join((row["content"] or "").split())
+            if len(content) > _SNIPPET_CHARS:
+                content = content[: _SNIPPET_CHARS - 1].rstrip() + "…"
+            snippets.append(f"[{row['role']}] {content}")
+
+        with self._lock:
+            self.queries += 1
+            self.hits += int(bool(snippets))
+            self.total_ms += elapsed_ms
+        logger.debug("Local recall for user %d returned %d in %.2fms", user_id, len(snippets), elapsed_ms)
+        return snippets
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queries": self.queries,
+                "hits": self.hits,
+                "errors": self.errors,
+                "avg_ms": round(self.total_ms / self.queries, 3) if self.queries else 0.0,
+            }
+
+
+local_recall = LocalRecall()
@@ -0,0 +1,221 @@
+import json
+import threading
+import time
+import zlib
+from typing import Optional
+
+from bot.config import (
+    RETENTION_KEEP_MESSAGES,
+    RETENTION_MAX_AGE_DAYS,
+    RETENTION_BATCH_ROWS,
+    logger,
+)
+from bot.memory import RECENT_MESSAGE_LIMIT, _connection, unit_of_work
+from bot.vector_store import VectorStore, vector_store
+
+# Users examined per archival query.
+_USER_CHUNK_SIZE = 100
+# Free pages released per retention run.
+_VACUUM_PAGES = 2000
+
+
+def _pack(rows: list[tuple[str, str, float]]) -> bytes:
+    return zlib.compress(json.dumps(rows, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def _unpack(payload: bytes) -> list[list]:
+    return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+
+class RetentionEngine:
+    """Moves old messages from the hot ``messages`` table into ``messages_archive``.
+
+    A message is archived when it falls outside the newest ``keep_messages`` rows
+    for its user, or when it is older than ``max_age_days``. The newest
+    RECENT_MESSAGE_LIMIT rows per user are never archived, so conversation
+    context and cached windows are unaffected. Each batch is one short
+    transaction, after which the archived rows' vectors are pruned; a run
+    ends with an incremental vacuum and a WAL checkpoint.
+    """
+
+    def __init__(
+        self,
+        keep_messages: int = RETENTION_KEEP_MESSAGES,
+        max_age_days: int = RETENTION_MAX_AGE_DAYS,
+        batch_rows: int = RETENTION_BATCH_ROWS,
+        vectors: VectorStore = vector_store,
+    ):
+        self.keep_messages = max(RECENT_MESSAGE_LIMIT, keep_messages)
+        self.max_age_seconds = max_age_days * 24 * 60 * 60 if max_age_days > 0 else None
+        self.batch_rows = max(1, batch_rows)
+        self.vectors = vectors
+        self._run_lock = threading.Lock()
+        self.runs = 0
+        self.archived_rows = 0
+        self.archive_batches = 0
+        self.pruned_vectors = 0
+        self.vacuumed_pages = 0
+        self.last_run_ms = 0.0
+        self.last_run_at = 0.0
+        self.last_checkpoint: Optional[dict] = None
+
+    def run(self) -> int:
+        """Archive due messages and compact the database; returns rows archived."""
+        if not self._run_lock.acquire(blocking=False):
+            logger.info("Retention run already in progress; skipping")
+            return 0
+        try:
+            started = time.monotonic()
+            archived = 0
+            user_ids = self._candidate_users()
+            for start in range(0, len(user_ids), _USER_CHUNK_SIZE):
+                archived += self._archive_users(user_ids[start:start + _USER_CHUNK_SIZE])
+            self._reclaim()
+
+            self.runs += 1
+            self.archived_rows += archived
+            self.last_run_ms = (time.monotonic() - started) * 1000
+            self.last_run_at = time.time()
+            logger.info(
+                "Retention archived %d messages for %d users in %.0fms",
+                archived,
+                len(user_ids),
+                self.last_run_ms,
+            )
+            return archived
+        finally:
+            self._run_lock.release()
+
+    def _candidate_users(self) -> list[int]:
+        # With an age limit anyone beyond the protected window may have old rows.
+        threshold = RECENT_MESSAGE_LIMIT if self.max_age_seconds else self.keep_messages
+        with _connection() as conn:
+            rows = conn.execute(
+                """
+                SELECT user_id
+                FROM messages
+                GROUP BY user_id
+                HAVING COUNT(*) > ?
+                """,
+                (threshold,),
+            ).fetchall()
+            return [row["user_id"] for row in rows]
+
+    def _archive_users(self, user_ids: list[int]) -> int:
+        cutoff = time.time() - self.max_age_seconds if self.max_age_seconds else float("-inf")
+        placeholders = ",".join("?" for _ in user_ids)
+        archived = 0
+        while True:
+            with unit_of_work() as conn:
+                rows = conn.execute(
+                    f"""
+                    SELECT id, user_id, role, content, created_at
+                    FROM (
+                        SELECT
+                            id,
+                            user_id,
+                            role,
+                            content,
+                            created_at,
+                            ROW_NUMBER() OVER (
+                                PARTITION BY user_id ORDER BY created_at DESC, id DESC
+                            ) AS rn
+                        FROM messages
+                        WHERE user_id IN ({placeholders})
+                    )
+                    WHERE rn > ? OR (rn > ? AND created_at < ?)
+                    ORDER BY user_id, created_at, id
+                    LIMIT ?
+                    """,
+                    (*user_ids, self.keep_messages, RECENT_MESSAGE_LIMIT, cutoff, self.batch_rows),
+                ).fetchall()
+                if not rows:
+                    return archived
+
+                by_user: dict[int, list] = {}
+                for row in rows:
+                    by_user.setdefault(row["user_id"], []).append(
+                        (row["role"], row["content"], row["created_at"])
+                    )
+                now = time.time()
+                conn.executemany(
+                    """
+                    INSERT INTO messages_archive (
+                        user_id, first_created_at, last_created_at, row_count, payload, archived_at
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    [
+                        (user_id, items[0][2], items[-1][2], len(items), _pack(items), now)
+                        for user_id, items in by_user.items()
+                    ],
+                )
+                conn.executemany(
+                    "DELETE FROM messages WHERE id = ?",
+                    [(row["id"],) for row in rows],
+                )
+            # Archived rows leave vector recall too, once they have left ``messages``.
+            for user_id, items in by_user.items():
+                self._prune_vectors(user_id, [created_at for _role, _content, created_at in items])
+            archived += len(rows)
+            self.archive_batches += 1
+            if len(rows) < self.batch_rows:
+                return archived
+
+    def _prune_vectors(self, user_id: int, created_ats: list[float]):
+        try:
+            self.pruned_vectors += self.vectors.prune(user_id, created_ats)
+        except OSError as exc:
+            logger.warning("Failed to prune vectors for user %d: %s", user_id, exc)
+
+    def _reclaim(self):
+        with _connection() as conn:
+            auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+            if auto_vacuum == 2:
+                before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                if before:
+                    conn.execute(f"PRAGMA incremental_vacuum({_VACUUM_PAGES})").fetchall()
+                    after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                    self.vacuumed_pages += max(0, before - after)
+            busy, log_pages, checkpointed = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+            self.last_checkpoint = {
+                "busy": bool(busy),
+                "log_pages": log_pages,
+                "checkpointed_pages": checkpointed,
+            }
+
+    def stats(self) -> dict:
+        return {
+            "keep_messages": self.keep_messages,
+            "max_age_days": round(self.max_age_seconds / 86400) if self.max_age_seconds else 0,
+            "runs": self.runs,
+            "archived_rows": self.archived_rows,
+            "archive_batches": self.archive_batches,
+            "pruned_vectors": self.pruned_vectors,
+            "vacuumed_pages": self.vacuumed_pages,
+            "last_run_ms": round(self.last_run_ms, 2),
+            "last_run_at": self.last_run_at,
+            "last_checkpoint": self.last_checkpoint,
+        }
+
+
+def read_archived_messages(user_id: int) -> list[dict]:
+    """Return a user's archived messages (oldest first)."""
+    with _connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT payload
+            FROM messages_archive
+            WHERE user_id = ?
+            ORDER BY first_created_at, id
+            """,
+            (user_id,),
+        ).fetchall()
+    messages = []
+    for row in rows:
+        for role, content, created_at in _unpack(row["payload"]):
+            messages.append({"role": role, "content": content, "created_at": created_at})
+    return messages
+
+
+retention = RetentionEngine()
@@ -1,8 +1,28 @@
+import asyncio
 from datetime import datetime
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from bot.ai import generate_checkin_message_async
-from bot.memory import get_all_checkin_users, update_last_checkin_slot, get_recent_messages
-from bot.config import CHECKIN_SLOTS, logger
+from bot.checkin_pool import CHECKIN_CONTEXT_MESSAGES, checkin_pool, generate_checkins
+from bot.memory import (
+    iter_due_checkin_users,
+    update_last_checkin_slot_bulk,
+    get_recent_messages_bulk,
+    run_db,
+)
+from bot.config import (
+    CHECKIN_SLOTS,
+    CHECKIN_BATCH_SIZE,
+    CHECKIN_LLM_BATCH_SIZE,
+    CHECKIN_PREGEN_ENABLED,
+    CHECKIN_PREGEN_INTERVAL_MINUTES,
+    RETENTION_ENABLED,
+    RETENTION_INTERVAL_MINUTES,
+    SUMMARIES_ENABLED,
+    SUMMARY_INTERVAL_MINUTES,
+    logger,
+)
+from bot.retention import retention
+from bot.summarizer import summarizer
 
 
 # ---------------- TIME SLOT DETECTION ---------------- #
@@ -27,58 +47,124 @@ def get_current_slot() -> str:
 
 # ---------------- CHECK-IN TASK ---------------- #
 
+FALLBACK_BY_SLOT = {
+    "morning": "Good morning. How are you feeling as your day begins?",
+    "afternoon": "Checking in for a moment. How is your afternoon going so far?",
+    "evening": "How has your day been? If you want to talk, I am here.",
+    "night": "Winding down can be a lot. How are you feeling tonight?",
+}
+
+
+def _fallback_message(slot: str) -> str:
+    return FALLBACK_BY_SLOT.get(slot, FALLBACK_BY_SLOT["evening"])
+
 
 async def send_checkins(bot):
     """Send check-in messages to all opted-in users (once per slot)."""
     slot = get_current_slot()
 
-    users = get_all_checkin_users()
+    # Stream only users not yet pinged in this slot (anti-spam), chunk by chunk.
+    due_batches = iter_due_checkin_users(slot, CHECKIN_BATCH_SIZE)
     sent_count = 0
 
-    fallback_by_slot = {
-        "morning": "Good morning. How are you feeling as your day begins?",
-        "afternoon": "Checking in for a moment. How is your afternoon going so far?",
-        "evening": "How has your day been? If you want to talk, I am here.",
-        "night": "Winding down can be a lot. How are you feeling tonight?",
-    }
-
-    for user in users:
-        # Anti-spam: skip if already pinged in this slot
-        if user["last_checkin_slot"] == slot:
-            continue
-
-        try:
-            recent = get_recent_messages(user["user_id"])
-            recent_tail = recent[-8:]
-            message = await generate_checkin_message_async(
-                slot=slot,
-                first_name=user.get("first_name") or "",
-                recent_messages=recent_tail,
-            )
-            if not message:
-                message = fallback_by_slot.get(slot, fallback_by_slot["evening"])
-
-            await bot.send_message(chat_id=user["chat_id"], text=message)
-            update_last_checkin_slot(user["user_id"], slot)
-            sent_count += 1
-            logger.info("Sent %s check-in to user %d", slot, user["user_id"])
-        except Exception as e:
+    while True:
+        batch = await run_db(next, due_batches, None)
+        if batch is None:
+            break
+        pooled = {}
+        if CHECKIN_PREGEN_ENABLED:
             try:
-                fallback = fallback_by_slot.get(slot, fallback_by_slot["evening"])
-                await bot.send_message(chat_id=user["chat_id"], text=fallback)
-                update_last_checkin_slot(user["user_id"], slot)
-                sent_count += 1
-                logger.warning("Sent fallback %s check-in to user %d", slot, user["user_id"])
-            except Exception:
-                pass
-            logger.warning(
-                "Failed to send check-in to user %d: %s", user["user_id"], e
-            )
+                pooled = await checkin_pool.take([u["user_id"] for u in batch], slot)
+            except Exception as e:
+                logger.warning("Failed to read pre-generated check-ins for %d users: %s", len(batch), e)
+        pending = [u for u in batch if u["user_id"] not in pooled]
+
+        messages = dict(pooled)
+        recent_by_user = {}
+        if pending and CHECKIN_LLM_BATCH_SIZE > 1:
+            # Blank entries (unusable or failed) get the fallback text below.
+            messages.update(await generate_checkins(slot, pending))
+        elif pending:
+            try:
+                recent_by_user = await run_db(
+                    get_recent_messages_bulk,
+                    [u["user_id"] for u in pending],
+                    CHECKIN_CONTEXT_MESSAGES,
+                )
+            except Exception as e:
+                logger.warning("Failed to load check-in context for %d users: %s", len(pending), e)
+
+        sent_ids = []
+        try:
+            for user in batch:
+                try:
+                    message = messages.get(user["user_id"])
+                    if message is None:
+                        recent_tail = recent_by_user.get(user["user_id"], [])
+                        message = await generate_checkin_message_async(
+                            slot=slot,
+                            first_name=user.get("first_name") or "",
+                            recent_messages=recent_tail,
+                        )
+                    if not message:
+                        message = _fallback_message(slot)
+
+                    await bot.send_message(chat_id=user["chat_id"], text=message)
+                    sent_ids.append(user["user_id"])
+                    logger.info("Sent %s check-in to user %d", slot, user["user_id"])
+                except Exception as e:
+                    try:
+                        await bot.send_message(chat_id=user["chat_id"], text=_fallback_message(slot))
+                        sent_ids.append(user["user_id"])
+                        logger.warning("Sent fallback %s check-in to user %d", slot, user["user_id"])
+                    except Exception:
+                        pass
+                    logger.warning(
+                        "Failed to send check-in to user %d: %s", user["user_id"], e
+                    )
+        finally:
+            # One slot write per batch instead of one per user.
+            await run_db(update_last_checkin_slot_bulk, sent_ids, slot)
+            sent_count += len(sent_ids)
 
     if sent_count > 0:
         logger.info("Sent %d %s check-ins", sent_count, slot)
 
 
+# ---------------- CHECK-IN PRE-GENERATION TASK ---------------- #
+
+
+async def run_checkin_pregeneration():
+    """Fill the check-in pool for the upcoming slot."""
+    try:
+        await checkin_pool.fill()
+    except Exception as e:
+        logger.warning("Check-in pre-generation failed: %s", e)
+
+
+# ---------------- RETENTION TASK ---------------- #
+
+
+async def run_retention():
+    """Archive old messages and compact the database off the event loop."""
+    try:
+        # A plain worker thread keeps the DB executor free for request traffic.
+        await asyncio.to_thread(retention.run)
+    except Exception as e:
+        logger.warning("Retention run failed: %s", e)
+
+
+# ---------------- SUMMARY TASK ---------------- #
+
+
+async def run_summaries():
+    """Fold piled-up turns into each user's rolling summary."""
+    try:
+        await summarizer.run()
+    except Exception as e:
+        logger.warning("Summary run failed: %s", e)
+
+
 # ---------------- SCHEDULER SETUP ---------------- #
 
 
@@ -96,5 +182,32 @@ def create_scheduler(bot) -> AsyncIOScheduler:
         replace_existing=True,
     )
 
+    if CHECKIN_PREGEN_ENABLED:
+        scheduler.add_job(
+            run_checkin_pregeneration,
+            "interval",
+            minutes=max(1, CHECKIN_PREGEN_INTERVAL_MINUTES),
+            id="checkin_pregen_job",
+            replace_existing=True,
+        )
+
+    if RETENTION_ENABLED:
+        scheduler.add_job(
+            run_retention,
+            "interval",
+            minutes=max(1, RETENTION_INTERVAL_MINUTES),
+            id="retention_job",
+            replace_existing=True,
+        )
+
+    if SUMMARIES_ENABLED:
+        scheduler.add_job(
+            run_summaries,
+            "interval",
+            minutes=max(1, SUMMARY_INTERVAL_MINUTES),
+            id="summary_job",
+            replace_existing=True,
+        )
+
     logger.info("Check-in scheduler created (runs every 30 minutes)")
     return scheduler
@@ -0,0 +1,112 @@
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+import numpy as np
+
+from bot.config import REPETITION_WINDOW
+
+# ---------------- MINHASH FINGERPRINTS ---------------- #
+
+# Character shingle width; short enough to catch rephrased openings.
+SHINGLE_CHARS = 5
+NUM_HASHES = 64
+
+_SPACE_RE = re.compile(r"\s+")
+_rng = np.random.default_rng(0xCA1)
+# Multiply-shift hash family: h(x) = (a * x + b) >> 32 over wrapping uint64.
+_HASH_A = _rng.integers(1, 2**63, size=NUM_HASHES, dtype=np.uint64) | np.uint64(1)
+_HASH_B = _rng.integers(0, 2**63, size=NUM_HASHES, dtype=np.uint64)
+
+
+def _normalize(text: str) -> str:
+    return _SPACE_RE.sub(" ", (text or "").strip().lower())
+
+
+def _shingle_hashes(text: str) -> np.ndarray:
+    count = max(1, len(text) - SHINGLE_CHARS + 1)
+    hashes = {zlib.crc32(text[i : i + SHINGLE_CHARS].encode("utf-8")) for i in range(count)}
+    return np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+
+
+def minhash(text: str) -> Optional[np.ndarray]:
+    """MinHash signature of ``text``'s character shingles, or None for empty text."""
+    normalized = _normalize(text)
+    if not normalized:
+        return None
+    shingles = _shingle_hashes(normalized)
+    # One vectorized pass: (NUM_HASHES, shingles) then min per hash function.
+    return ((np.outer(_HASH_A, shingles) + _HASH_B[:, None]) >> np.uint64(32)).min(axis=1)
+
+
+def signature_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Dice coefficient of two signatures' shingle sets.
+
+    MinHash estimates the Jaccard index J; Dice (2J / (1 + J)) is reported
+    because, like ``difflib``'s ratio, it is twice the overlap over the total.
+    """
+    jaccard = float(np.count_nonzero(a == b)) / NUM_HASHES
+    return 2 * jaccard / (1 + jaccard)
+
+
+# ---------------- REPLY SIMILARITY ---------------- #
+
+
+class ReplySimilarity:
+    """Near-duplicate detection for replies against a user's recent replies.
+
+    Signatures are cached by reply text in a bounded LRU, so each assistant
+    reply is fingerprinted once (when it is generated) and later turns only
+    compare 64-value signatures, whatever the reply length.
+    """
+
+    def __init__(self, window: int = REPETITION_WINDOW, cache_size: int = 4096):
+        self.window = max(1, window)
+        self.cache_size = max(1, cache_size)
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[str, Optional[np.ndarray]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.comparisons = 0
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        key = _normalize(text)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+        signature = minhash(key)
+        with self._lock:
+            self._cache[key] = signature
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return signature
+
+    def similarity(self, text: str, other: str) -> float:
+        a, b = self.signature(text), self.signature(other)
+        if a is None or b is None:
+            return 0.0
+        with self._lock:
+            self.comparisons += 1
+        return signature_similarity(a, b)
+
+    def max_similarity(self, text: str, previous: Iterable[str]) -> float:
+        """Highest similarity between ``text`` and any of ``previous``."""
+        return max((self.similarity(text, other) for other in previous), default=0.0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = max(1, self.hits + self.misses)
+            return {
+                "window": self.window,
+                "cached_signatures": len(self._cache),
+                "hit_rate": round(self.hits / lookups, 3),
+                "comparisons": self.comparisons,
+            }
+
+
+reply_similarity = ReplySimilarity()
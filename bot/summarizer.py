@@ -0,0 +1,117 @@
+import time
+
+from bot.ai import summarize_conversation_async
+from bot.config import SUMMARY_FOLD_TURNS, SUMMARY_RAW_TURNS, logger
+from bot.memory import (
+    count_messages_after,
+    get_conversation_summary,
+    get_messages_after,
+    get_summary_candidates,
+    run_db,
+    save_conversation_summary,
+)
+
+# Users folded per background run.
+_USERS_PER_RUN = 50
+
+
+class RollingSummarizer:
+    """Folds each user's oldest unsummarized turns into a rolling summary.
+
+    The newest ``raw_turns`` messages always stay out of the summary, since
+    replies send them verbatim. A user is folded once at least ``fold_turns``
+    older turns have piled up; each fold covers at most ``2 * fold_turns``
+    turns so one call stays small, and a backlog drains over later runs.
+
+    After the first run, only users who wrote since the previous run started
+    are looked up, plus users whose backlog was not drained yet or whose
+    last fold failed.
+    """
+
+    def __init__(self, raw_turns: int = SUMMARY_RAW_TURNS, fold_turns: int = SUMMARY_FOLD_TURNS):
+        self.raw_turns = max(1, raw_turns)
+        self.fold_turns = max(1, fold_turns)
+        self._running = False
+        self._active_since = 0.0
+        self._backlog: set[int] = set()
+        self.runs = 0
+        self.summaries_written = 0
+        self.folded_turns = 0
+        self.errors = 0
+        self.last_run_ms = 0.0
+
+    async def run(self) -> int:
+        """Fold every due user (up to a per-run cap); returns summaries written."""
+        if self._running:
+            logger.info("Summary run already in progress; skipping")
+            return 0
+        self._running = True
+        started = time.monotonic()
+        run_started_at = time.time()
+        written = 0
+        try:
+            candidates = await run_db(
+                get_summary_candidates, self.raw_turns + self.fold_turns, _USERS_PER_RUN, self._active_since
+            )
+            if len(candidates) < _USERS_PER_RUN:
+                # Everyone active so far was seen; otherwise look at the same window again.
+                self._active_since = run_started_at
+            user_ids = list(dict.fromkeys([*candidates, *sorted(self._backlog)]))
+            self._backlog.clear()
+            for user_id in user_ids:
+                try:
+                    written += int(await self.fold(user_id) > 0)
+                except Exception as e:
+                    self.errors += 1
+                    # _active_since has moved on, so only the backlog brings them back.
+                    self._backlog.add(user_id)
+                    logger.warning("Summary fold failed for user %d: %s", user_id, e)
+            self.runs += 1
+            self.last_run_ms = (time.monotonic() - started) * 1000
+            if written:
+                logger.info("Updated %d conversation summaries in %.0fms", written, self.last_run_ms)
+            return written
+        finally:
+            self._running = False
+
+    async def fold(self, user_id: int) -> int:
+        """Fold one user's due turns into their summary; returns turns folded."""
+        current = await run_db(get_conversation_summary, user_id)
+        unsummarized = await run_db(count_messages_after, user_id, current["covered_until"])
+        foldable = unsummarized - self.raw_turns
+        if foldable < self.fold_turns:
+            return 0
+
+        turns = await run_db(
+            get_messages_after,
+            user_id,
+            current["covered_until"],
+            min(foldable, 2 * self.fold_turns),
+        )
+        if not turns:
+            return 0
+        summary = await summarize_conversation_async(current["summary"], turns)
+        if not summary:
+            self._backlog.add(user_id)
+            return 0
+        await run_db(save_conversation_summary, user_id, summary, turns[-1]["created_at"], len(turns))
+        if foldable - len(turns) >= self.fold_turns:
+            self._backlog.add(user_id)
+        self.summaries_written += 1
+        self.folded_turns += len(turns)
+        return len(turns)
+
+    def stats(self) -> dict:
+        return {
+            "raw_turns": self.raw_turns,
+            "fold_turns": self.fold_turns,
+            "runs": self.runs,
+            "summaries_written": self.summaries_written,
+            "folded_turns": self.folded_turns,
+            "errors": self.errors,
+            "backlog": len(self._backlog),
+            "last_run_ms": round(self.last_run_ms, 2),
+        }
+
+
+summarizer = RollingSummarizer()
@@ -0,0 +1,221 @@
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable, Optional
+
+# ---------------- KEYWORD TABLES ---------------- #
+
+# Whole-word keywords, checked in this priority order by ``emotional_state``.
+EMOTIONAL_STATE_KEYWORDS = {
+    "overwhelmed": ("overwhelmed", "too much", "can't handle", "burned out", "exhausted"),
+    "lonely": ("lonely", "alone", "no one", "isolated", "left out"),
+    "hopeful": ("hopeful", "better", "progress", "improving", "finally", "proud", "grateful"),
+    "numb": ("numb", "empty", "nothing", "flat", "detached"),
+    "anxious": ("anxious", "anxiety", "panic", "worried", "scared", "afraid"),
+    "sad": ("sad", "down", "low", "hurt", "crying", "heartbroken"),
+    "angry": ("angry", "frustrated", "mad", "annoyed", "furious"),
+}
+
+RESPONSE_INTENT_KEYWORDS = {
+    "concrete_next_step": ("what should i do", "help me", "next step", "plan", "how do i", "advice"),
+    "validation_first": ("i feel", "i am", "i'm", "it feels", "i've been", "vent"),
+}
+
+LENGTH_INTENT_KEYWORDS = {
+    "short": (
+        "short", "brief", "quick", "concise", "summary", "summarize", "tl;dr", "tldr", "one line",
+        "in short", "just answer",
+    ),
+    "long": (
+        "long", "detailed", "detail", "deep", "in depth", "step by step", "comprehensive", "elaborate",
+        "analyze", "analyse", "explain",
+    ),
+}
+
+# Life themes match anywhere in the text, including inside longer words.
+LIFE_THEME_KEYWORDS = {
+    "work": ("work", "job", "office", "boss"),
+    "family": ("family", "parents", "mother", "father", "home"),
+    "relationships": ("relationship", "partner", "boyfriend", "girlfriend", "marriage"),
+    "sleep": ("sleep", "insomnia", "rest", "tired"),
+    "health": ("health", "body", "exercise", "diet"),
+    "studies": ("study", "exam", "school", "college", "university"),
+    "finances": ("money", "finance", "debt", "rent", "bills"),
+}
+
+# ---------------- COMPILED MATCHERS ---------------- #
+
+_WORD_RE = re.compile(r"\w+")
+
+_THEME_BY_KEYWORD = {keyword: theme for theme, keywords in LIFE_THEME_KEYWORDS.items() for keyword in keywords}
+# Zero-width so overlapping keywords ("parents": parents + rent) are all seen.
+_THEME_RE = re.compile("(?=(" + "|".join(map(re.escape, _THEME_BY_KEYWORD)) + "))")
+
+
+def _keyword_index() -> tuple[dict, list]:
+    """Split the whole-word keywords into single-word and multi-word entries.
+
+    A single-word keyword matches exactly when it equals one of the text's
+    ``\\w+`` tokens. A multi-word keyword ("too much", "can't") is checked
+    with its own pattern, only when all of its words occur in the text.
+    """
+    words: dict[str, list] = {}
+    phrases = []
+    tables = (
+        ("state", EMOTIONAL_STATE_KEYWORDS),
+        ("intent", RESPONSE_INTENT_KEYWORDS),
+        ("length", LENGTH_INTENT_KEYWORDS),
+    )
+    for kind, table in tables:
+        for label, keywords in table.items():
+            for keyword in keywords:
+                parts = _WORD_RE.findall(keyword)
+                if parts == [keyword]:
+                    words.setdefault(keyword, []).append((kind, label))
+                else:
+                    pattern = re.compile(rf"\b{re.escape(keyword)}\b")
+                    phrases.append((frozenset(parts), pattern, (kind, label)))
+    return {word: tuple(labels) for word, labels in words.items()}, phrases
+
+
+_WORD_LABELS, _PHRASES = _keyword_index()
+
+
+@lru_cache(maxsize=65536)
+def _word_labels(word: str) -> tuple:
+    """Keyword and life-theme labels carried by one token (vocabulary-sized cache)."""
+    themes = {("theme", _THEME_BY_KEYWORD[keyword]) for keyword in _THEME_RE.findall(word)}
+    return _WORD_LABELS.get(word, ()) + tuple(themes)
+
+
+_NAME = r"([a-z][a-z'\-]{1,31})\b"
+_CAPTURE_PATTERNS = {
+    "name_my": rf"my name is\s+{_NAME}",
+    "name_i_am": rf"i am\s+{_NAME}",
+    "name_im": rf"i'm\s+{_NAME}",
+    "name_call": rf"call me\s+{_NAME}",
+    "stressor": r"(?:stressed|worried|anxious|overwhelmed)\s+(?:about|by)\s+([^.!?]{4,80})",
+    "win": r"(?:i managed to|i finally|i did|i'm proud that|i am proud that)\s+([^.!?]{4,90})",
+    "coping": r"(?:it helps when i|i feel better when i|i calm down when i|i like to)\s+([^.!?]{4,90})",
+    "boundary": r"(?:please don't|do not|don't|i don't want)\s+([^.!?]{4,90})",
+}
+# One pattern for every extraction: a cheap gate on the words the patterns can
+# start with, then an optional lookahead per pattern so several may match at
+# the same position without consuming each other's text.
+_CAPTURE_RE = re.compile(
+    r"\b(?=my name|i am|i'm|i managed|i finally|i did|i feel better|i calm|i like|i don't want"
+    r"|call me|stressed|worried|anxious|overwhelmed|it helps|please don't|do not|don't)"
+    + "".join(f"(?:(?={pattern}))?" for pattern in _CAPTURE_PATTERNS.values())
+)
+_CAPTURE_GROUPS = {name: index + 1 for index, name in enumerate(_CAPTURE_PATTERNS)}
+
+
+# ---------------- ANALYSIS ---------------- #
+
+
+@dataclass(frozen=True)
+class TextFeatures:
+    """Everything the bot reads from one message, computed in one pass.
+
+    ``self_name`` also accepts "I am X" / "I'm X" (used when registering a
+    user); ``stated_name`` only "my name is" / "call me" (relational memory).
+    """
+
+    text: str
+    lowered: str
+    word_count: int
+    char_count: int
+    question_count: int
+    emotional_state: str
+    response_intent: str
+    asks_short: bool
+    asks_long: bool
+    self_name: str
+    stated_name: str
+    stressor: Optional[str]
+    win: Optional[str]
+    coping_preference: Optional[str]
+    boundary: Optional[str]
+    life_themes: tuple[str, ...]
+
+
+def _labels(lowered: str) -> tuple[set, int]:
+    """Every ``(kind, label)`` the text carries, and its word count."""
+    words = _WORD_RE.findall(lowered)
+    vocabulary = set(words)
+    labels = set()
+    for word in vocabulary:
+        labels.update(_word_labels(word))
+    for parts, pattern, label in _PHRASES:
+        if label not in labels and parts <= vocabulary and pattern.search(lowered):
+            labels.add(label)
+    return labels, len(words)
+
+
+def _captures(lowered: str) -> dict[str, str]:
+    """First (leftmost) match of each extraction pattern, stripped."""
+    found: dict[str, str] = {}
+    for match in _CAPTURE_RE.finditer(lowered):
+        for name, group in _CAPTURE_GROUPS.items():
+            if name not in found and match.group(group) is not None:
+                found[name] = match.group(group).strip(" .,!?")
+        if len(found) == len(_CAPTURE_GROUPS):
+            break
+    return found
+
+
+def _analyze(text: Optional[str]) -> TextFeatures:
+    stripped = (text or "").strip()
+    lowered = stripped.lower()
+    hits, word_count = _labels(lowered)
+
+    emotional_state = next((s for s in EMOTIONAL_STATE_KEYWORDS if ("state", s) in hits), "neutral")
+    response_intent = next((i for i in RESPONSE_INTENT_KEYWORDS if ("intent", i) in hits), None)
+    if response_intent is None:
+        response_intent = "reflective_summary" if "?" in lowered else "gentle_reframe"
+
+    captures = _captures(lowered)
+    self_name = next(
+        (captures[k] for k in ("name_my", "name_i_am", "name_im", "name_call") if k in captures), ""
+    )
+    stated_name = next((captures[k] for k in ("name_my", "name_call") if k in captures), "")
+
+    return TextFeatures(
+        text=stripped,
+        lowered=lowered,
+        word_count=word_count,
+        char_count=len(stripped),
+        question_count=stripped.count("?"),
+        emotional_state=emotional_state,
+        response_intent=response_intent,
+        asks_short=("length", "short") in hits,
+        asks_long=("length", "long") in hits,
+        self_name=self_name.capitalize(),
+        stated_name=stated_name.capitalize(),
+        stressor=captures.get("stressor"),
+        win=captures.get("win"),
+        coping_preference=captures.get("coping"),
+        boundary=captures.get("boundary"),
+        life_themes=tuple(theme for theme in LIFE_THEME_KEYWORDS if ("theme", theme) in hits),
+    )
+
+
+@lru_cache(maxsize=1024)
+def analyze(text: Optional[str]) -> TextFeatures:
+    """Analyze one message (cached, so every caller on the same turn shares one pass)."""
+    return _analyze(text)
+
+
+def analyze_batch(texts: Iterable[Optional[str]]) -> list[TextFeatures]:
+    """Analyze many messages, e.g. history backfills, without churning the live cache.
+
+    Repeated texts are analyzed once; results keep the input order.
+    """
+    done: dict[Optional[str], TextFeatures] = {}
+    results = []
+    for text in texts:
+        features = done.get(text)
+        if features is None:
+            features = done[text] = _analyze(text)
+        results.append(features)
+    return results
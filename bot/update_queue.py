@@ -0,0 +1,240 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from bot.config import UPDATE_QUEUE_SIZE, UPDATE_USER_BACKLOG, UPDATE_WORKERS, logger
+
+
+# ---------------- PER-USER ORDERING ---------------- #
+
+
+def update_user_key(update: Any) -> Optional[int]:
+    """Ordering key of a Telegram update: its user, else its chat (None if neither)."""
+    user = getattr(update, "effective_user", None)
+    if user is not None:
+        return user.id
+    chat = getattr(update, "effective_chat", None)
+    return chat.id if chat is not None else None
+
+
+class KeyedSerialExecutor:
+    """Runs items with the same key strictly in order, different keys in parallel.
+
+    Each active key has a mailbox. The first item for an idle key is processed
+    by its caller, which then keeps draining whatever arrived for that key in
+    the meantime; later callers for a busy key only append to the mailbox and
+    return, so they never hold a worker while waiting their turn. A key's
+    mailbox is dropped as soon as it is empty, so state stays proportional to
+    the number of users with work in flight. Items with a ``None`` key are
+    processed directly.
+
+    Because waiting items hold no worker, the update queue's bound does not
+    limit them. ``admit`` does instead: the webhook calls it before enqueueing,
+    and it refuses a key that already has ``max_pending`` items admitted but
+    not yet processed (queued, waiting in its mailbox or running), so a single
+    chatty user gets backpressure instead of unbounded memory.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[Any], Awaitable[None]],
+        key: Callable[[Any], Optional[Hashable]] = update_user_key,
+        max_pending: int = UPDATE_USER_BACKLOG,
+    ):
+        self.process = process
+        self.key = key
+        self.max_pending = max(1, max_pending)
+        self._mailboxes: dict[Hashable, deque] = {}
+        self._pending: dict[Hashable, int] = {}
+        self.max_active_keys = 0
+        self.max_mailbox = 0
+        self.deferred = 0
+        self.refused = 0
+        self.processed = 0
+        self.errors = 0
+
+    def admit(self, item: Any) -> bool:
+        """Count ``item`` against its key's backlog; False if the backlog is full."""
+        key = self.key(item)
+        if key is None:
+            return True
+        pending = self._pending.get(key, 0)
+        if pending >= self.max_pending:
+            self.refused += 1
+            logger.warning("Backlog full for key %s (%d pending); refusing update", key, pending)
+            return False
+        self._pending[key] = pending + 1
+        return True
+
+    def release(self, item: Any):
+        """Undo ``admit`` for an item that will not be submitted (or has been processed)."""
+        key = self.key(item)
+        pending = self._pending.get(key)
+        if pending is None:
+            return
+        if pending <= 1:
+            del self._pending[key]
+        else:
+            self._pending[key] = pending - 1
+
+    async def submit(self, item: Any):
+        key = self.key(item)
+        if key is None:
+            await self._run(item)
+            return
+        mailbox = self._mailboxes.get(key)
+        if mailbox is not None:
+            # The task already running this key will pick it up, in order.
+            mailbox.append(item)
+            self.deferred += 1
+            self.max_mailbox = max(self.max_mailbox, len(mailbox))
+            return
+
+        mailbox = self._mailboxes[key] = deque()
+        self.max_active_keys = max(self.max_active_keys, len(self._mailboxes))
+        try:
+            while True:
+                await self._run(item)
+                if not mailbox:
+                    break
+                item = mailbox.popleft()
+        finally:
+            del self._mailboxes[key]
+            if mailbox:
+                # Only possible when the drain itself was cancelled.
+                logger.warning("Dropped %d queued updates for key %s after cancellation", len(mailbox), key)
+
+    async def _run(self, item: Any):
+        try:
+            await self.process(item)
+            self.processed += 1
+        except Exception as e:
+            self.errors += 1
+            logger.error("Update processing failed: %s", e)
+        finally:
+            self.release(item)
+
+    def stats(self) -> dict:
+        return {
+            "active_keys": len(self._mailboxes),
+            "max_active_keys": self.max_active_keys,
+            "waiting": sum(len(mailbox) for mailbox in self._mailboxes.values()),
+            "max_mailbox": self.max_mailbox,
+            "deferred": self.deferred,
+            "max_pending": self.max_pending,
+            "refused": self.refused,
+            "processed": self.processed,
+            "errors": self.errors,
+        }
+
+
+# ---------------- UPDATE QUEUE ---------------- #
+
+
+class UpdateQueue:
+    """Bounded in-process queue between the webhook and update handling.
+
+    The webhook only validates and enqueues, so Telegram gets its 200 at once;
+    ``workers`` consumer tasks run ``process`` on queued updates, which caps
+    how many updates are handled concurrently. When the queue is full,
+    ``submit`` refuses the update so the webhook can answer with an error and
+    let Telegram redeliver it later.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[Any], Awaitable[None]],
+        maxsize: int = UPDATE_QUEUE_SIZE,
+        workers: int = UPDATE_WORKERS,
+    ):
+        self.process = process
+        self.maxsize = max(1, maxsize)
+        self.worker_count = max(1, workers)
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list[asyncio.Task] = []
+        self._accepting = False
+        self._busy = 0
+        self.max_depth = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.errors = 0
+        self.wait_ms_total = 0.0
+        self.max_wait_ms = 0.0
+
+    def start(self):
+        """Create the queue and consumer tasks on the running event loop."""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(self.maxsize)
+        self._workers = [
+            asyncio.create_task(self._consume(), name=f"update-worker-{i}") for i in range(self.worker_count)
+        ]
+        self._accepting = True
+        logger.info("Update queue started (%d workers, capacity %d)", self.worker_count, self.maxsize)
+
+    def submit(self, update: Any) -> bool:
+        """Enqueue ``update`` without waiting; False if it was refused."""
+        if not self._accepting or self._queue is None:
+            self.rejected += 1
+            return False
+        try:
+            self._queue.put_nowait((time.monotonic(), update))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            logger.warning("Update queue full (%d); refusing update", self.maxsize)
+            return False
+        self.accepted += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    async def _consume(self):
+        queue = self._queue
+        while True:
+            queued_at, update = await queue.get()
+            wait_ms = (time.monotonic() - queued_at) * 1000
+            self.wait_ms_total += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            self._busy += 1
+            try:
+                await self.process(update)
+                self.processed += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error("Update processing failed: %s", e)
+            finally:
+                self._busy -= 1
+                queue.task_done()
+
+    async def drain(self, timeout: float):
+        """Stop accepting updates, finish queued ones (up to ``timeout`` seconds), stop workers."""
+        self._accepting = False
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Update queue drain timed out with %d updates left", self._queue.qsize())
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        logger.info("Update queue drained")
+
+    def stats(self) -> dict:
+        handled = max(1, self.processed + self.errors)
+        return {
+            "workers": self.worker_count,
+            "capacity": self.maxsize,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_depth": self.max_depth,
+            "busy_workers": self._busy,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "errors": self.errors,
+            "avg_wait_ms": round(self.wait_ms_total / handled, 2),
+            "max_wait_ms": round(self.max_wait_ms, 2),
+        }
@@ -0,0 +1,303 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+import numpy as np
+
+from bot.config import VECTOR_DIM, VECTOR_DIR, logger
+from bot.memory import RECENT_MESSAGE_LIMIT, _connection
+
+# ---------------- HASHING EMBEDDER ---------------- #
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+class HashingEmbedder:
+    """Dependency-free text embedder using signed feature hashing.
+
+    Unigrams and bigrams are hashed (CRC32, stable across processes) into a
+    fixed number of buckets with a hash-derived sign, weighted by sublinear
+    term frequency and L2-normalized, so a dot product is cosine similarity.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = max(16, dim)
+
+    def _features(self, text: str) -> list[str]:
+        tokens = [t.strip("'") for t in _TOKEN_RE.findall((text or "").lower())]
+        tokens = [t for t in tokens if len(t) > 1]
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def embed(self, text: str) -> np.ndarray:
+        counts: dict[int, float] = {}
+        for feature in self._features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            bucket = h % self.dim
+            sign = 1.0 if (h >> 31) & 1 else -1.0
+            counts[bucket] = counts.get(bucket, 0.0) + sign
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for bucket, value in counts.items():
+            vector[bucket] = np.sign(value) * (1.0 + np.log(abs(value))) if value else 0.0
+        norm = float(np.linalg.norm(vector))
+        if norm > 0:
+            vector /= norm
+        return vector
+
+
+# ---------------- MEMORY-MAPPED STORE ---------------- #
+
+
+class VectorStore:
+    """Append-only, memory-mapped embedding files, one pair per user.
+
+    ``<dir>/<shard>/<user_id>.f32`` holds float32 rows of ``dim`` values and
+    ``<user_id>.key`` holds the matching message ``created_at`` (float64), which
+    locates the row in ``messages`` through ``idx_messages_user``. Vectors are
+    written before keys, so a torn append is ignored by readers.
+
+    Open maps are kept in a small LRU and reused until the files grow or are
+    compacted. ``prune`` rewrites a user's files without the rows retention
+    moved out of ``messages``, so archived content is no longer recalled.
+    """
+
+    def __init__(
+        self,
+        root: str = VECTOR_DIR,
+        dim: int = VECTOR_DIM,
+        min_score: float = 0.2,
+        max_open_maps: int = 256,
+    ):
+        self.root = root
+        self.embedder = HashingEmbedder(dim)
+        self.dim = self.embedder.dim
+        self.min_score = min_score
+        self.max_open_maps = max(1, max_open_maps)
+        self._locks: dict[int, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._maps: OrderedDict[int, tuple[int, np.ndarray, np.ndarray]] = OrderedDict()
+        self._maps_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.map_opens = 0
+        self.pruned = 0
+        self.indexed = 0
+        self.queries = 0
+        self.hits = 0
+        self.total_ms = 0.0
+
+    def _paths(self, user_id: int) -> tuple[str, str]:
+        shard = os.path.join(self.root, f"{abs(user_id) % 256:02x}")
+        return os.path.join(shard, f"{user_id}.f32"), os.path.join(shard, f"{user_id}.key")
+
+    def _lock_for(self, user_id: int) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(user_id)
+            if lock is None:
+                lock = self._locks[user_id] = threading.Lock()
+            return lock
+
+    def add(self, user_id: int, created_at: float, content: str):
+        """Embed one message and append it to the user's files."""
+        self.add_many(user_id, [(created_at, content)])
+
+    def add_many(self, user_id: int, items: list[tuple[float, str]]):
+        if not items:
+            return
+        vectors = np.stack([self.embedder.embed(content) for _ts, content in items])
+        keys = np.array([created_at for created_at, _content in items], dtype=np.float64)
+        vec_path, key_path = self._paths(user_id)
+        with self._lock_for(user_id):
+            os.makedirs(os.path.dirname(vec_path), exist_ok=True)
+            with open(vec_path, "ab") as fh:
+                fh.write(vectors.astype(np.float32).tobytes())
+            with open(key_path, "ab") as fh:
+                fh.write(keys.tobytes())
+        with self._stats_lock:
+            self.indexed += len(items)
+
+    def _load(self, user_id: int) -> tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        vec_path, key_path = self._paths(user_id)
+        try:
+            key_rows = os.path.getsize(key_path) // 8
+            vec_rows = os.path.getsize(vec_path) // (4 * self.dim)
+        except OSError:
+            return None, None
+        rows = min(key_rows, vec_rows)
+        if rows == 0:
+            return None, None
+        with self._maps_lock:
+            cached = self._maps.get(user_id)
+            if cached is not None and cached[0] == rows:
+                self._maps.move_to_end(user_id)
+                return cached[1], cached[2]
+        # New or grown files: map the current rows and cache them.
+        vectors = np.memmap(vec_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        keys = np.memmap(key_path, dtype=np.float64, mode="r", shape=(rows,))
+        with self._maps_lock:
+            self._maps[user_id] = (rows, vectors, keys)
+            self._maps.move_to_end(user_id)
+            while len(self._maps) > self.max_open_maps:
+                self._maps.popitem(last=False)
+        with self._stats_lock:
+            self.map_opens += 1
+        return vectors, keys
+
+    def prune(self, user_id: int, created_ats: Iterable[float]) -> int:
+        """Drop the vectors of messages with these ``created_at`` keys; returns rows removed.
+
+        The kept rows are written to new files that replace the old ones, so
+        a user's files shrink along with their hot messages.
+        """
+        removed = np.fromiter(created_ats, dtype=np.float64)
+        if not len(removed):
+            return 0
+        vec_path, key_path = self._paths(user_id)
+        with self._lock_for(user_id):
+            vectors, keys = self._load(user_id)
+            if keys is None:
+                return 0
+            keep = ~np.isin(keys, removed)
+            dropped = int(len(keys) - keep.sum())
+            if not dropped:
+                return 0
+            kept_vectors = np.ascontiguousarray(vectors[keep])
+            kept_keys = np.ascontiguousarray(keys[keep])
+            with self._maps_lock:
+                self._maps.pop(user_id, None)
+            del vectors, keys
+            for path, data in ((vec_path, kept_vectors), (key_path, kept_keys)):
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "wb") as fh:
+                    fh.write(data.tobytes())
+                os.replace(tmp_path, path)
+        with self._stats_lock:
+            self.pruned += dropped
+        return dropped
+
+    def indexed_keys(self, user_id: int) -> set[float]:
+        _vectors, keys = self._load(user_id)
+        return set(keys.tolist()) if keys is not None else set()
+
+    def search(self, user_id: int, query_text: str, limit: int = 5, before: Optional[float] = None) -> list[tuple[float, float]]:
+        """Return ``(created_at, score)`` for the most similar messages older than ``before``."""
+        started = time.perf_counter()
+        vectors, keys = self._load(user_id)
+        results: list[tuple[float, float]] = []
+        if vectors is not None:
+            query = self.embedder.embed(query_text)
+            if query.any():
+                scores = vectors @ query
+                if before is not None:
+                    scores = np.where(keys < before, scores, -1.0)
+                k = min(limit, len(scores))
+                top = np.argpartition(-scores, k - 1)[:k]
+                top = top[np.argsort(-scores[top])]
+                results = [
+                    (float(keys[i]), float(scores[i]))
+                    for i in top
+                    if scores[i] >= self.min_score
+                ]
+        with self._stats_lock:
+            self.queries += 1
+            self.hits += int(bool(results))
+            self.total_ms += (time.perf_counter() - started) * 1000
+        return results
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "dim": self.dim,
+                "indexed": self.indexed,
+                "pruned": self.pruned,
+                "open_maps": len(self._maps),
+                "map_opens": self.map_opens,
+                "queries": self.queries,
+                "hits": self.hits,
+                "avg_ms": round(self.total_ms / self.queries, 3) if self.queries else 0.0,
+            }
+
+
+# ---------------- RECALL ---------------- #
+
+
+def _recent_window_start(user_id: int) -> Optional[float]:
+    with _connection() as conn:
+        row = conn.execute(
+            """
+            SELECT min(created_at) AS start FROM (
+                SELECT created_at FROM messages
+                WHERE user_id = ?
+                ORDER BY created_at DESC
+                LIMIT ?
+            )
+            """,
+            (user_id, RECENT_MESSAGE_LIMIT),
+        ).fetchone()
+        return row["start"] if row else None
+
+
+def vector_recall(store: VectorStore, user_id: int, query_text: str, limit: int = 5) -> list[str]:
+    """Return snippets of the user's older messages most similar to ``query_text``."""
+    before = _recent_window_start(user_id)
+    hits = store.search(user_id, query_text, limit=limit, before=before)
+    if not hits:
+        return []
+    snippets = []
+    with _connection() as conn:
+        for created_at, _score in hits:
+            row = conn.execute(
+                "SELECT role, content FROM messages WHERE user_id = ? AND created_at = ? LIMIT 1",
+                (user_id, created_at),
+            ).fetchone()
+            if row:
+                content = " ".join((row["content"] or "").split())[:240]
+                snippets.append(f"[{row['role']}] {content}")
+    return snippets
+
+
+def backfill(store: VectorStore, batch_size: int = 5000) -> int:
+    """Index existing ``messages`` rows that are not in the store yet; returns rows added."""
+    added = 0
+    last_id = 0
+    known: dict[int, set[float]] = {}
+    while True:
+        with _connection() as conn:
+            rows = conn.execute(
+                "SELECT id, user_id, content, created_at FROM messages WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size),
+            ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1]["id"]
+        pending: dict[int, list[tuple[float, str]]] = {}
+        for row in rows:
+            user_id = row["user_id"]
+            if user_id not in known:
+                known[user_id] = store.indexed_keys(user_id)
+            if row["created_at"] in known[user_id]:
+                continue
+            known[user_id].add(row["created_at"])
+            pending.setdefault(user_id, []).append((row["created_at"], row["content"]))
+        for user_id, items in pending.items():
+            store.add_many(user_id, items)
+            added += len(items)
+    return added
+
+
+vector_store = VectorStore()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] != ["backfill"]:
+        sys.exit("usage: python -m bot.vector_store backfill")
+    try:
+        count = backfill(vector_store)
+    except sqlite3.Error as exc:
+        sys.exit(f"backfill failed: {exc}")
+    logger.info("Vector backfill indexed %d messages into %s", count, vector_store.root)
@@ -1,6 +1,7 @@
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
@@ -8,10 +9,27 @@ from slowapi.middleware import SlowAPIMiddleware
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters
 
-from bot.config import BOT_TOKEN, RATE_LIMIT
+from bot.ai import close_ai_clients, early_stop_stats, llm_governor, model_router, prompt_layout_stats
+from bot.config import BOT_TOKEN, RATE_LIMIT, UPDATE_DRAIN_TIMEOUT_SECONDS
 from bot.handlers import start, handle_message, checkin_command
-from bot.memory import init_db
+from bot.memory import (
+    init_db,
+    close_db,
+    get_db_pool_stats,
+    get_db_executor_stats,
+    get_write_behind_stats,
+    get_context_cache_stats,
+)
+from bot.recall import local_recall
+from bot.vector_store import vector_store
+from bot.similarity import reply_similarity
+from bot.retention import retention
 from bot.scheduler import create_scheduler
+from bot.summarizer import summarizer
+from bot.checkin_pool import checkin_pool
+from bot.update_queue import KeyedSerialExecutor, UpdateQueue
+from bot.coalescer import burst_coalescer
+from bot.dedup import update_dedup
 
 logger = logging.getLogger("calmnest")
 
@@ -24,6 +42,11 @@ telegram_app.add_handler(
     MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message)
 )
 
+# Webhook requests only enqueue; background consumers run the handlers,
+# one user's updates in arrival order and different users in parallel.
+user_executor = KeyedSerialExecutor(telegram_app.process_update)
+update_queue = UpdateQueue(user_executor.submit)
+
 # ---------------- RATE LIMITER ---------------- #
 
 limiter = Limiter(key_func=get_remote_address)
@@ -42,6 +65,7 @@ async def lifespan(app: FastAPI):
     init_db()
     await telegram_app.initialize()
     await telegram_app.start()
+    update_queue.start()
     scheduler = create_scheduler(telegram_app.bot)
     scheduler.start()
     logger.info("CalmNest is alive 🌿")
@@ -52,8 +76,13 @@ async def lifespan(app: FastAPI):
     if scheduler:
         scheduler.shutdown()
         logger.info("Scheduler stopped")
+    # Finish accepted updates while the bot can still send replies.
+    await update_queue.drain(UPDATE_DRAIN_TIMEOUT_SECONDS)
+    await burst_coalescer.drain(UPDATE_DRAIN_TIMEOUT_SECONDS)
     await telegram_app.stop()
     await telegram_app.shutdown()
+    await close_ai_clients()
+    close_db()
 
 
 # ---------------- FASTAPI APP ---------------- #
@@ -73,18 +102,56 @@ async def health():
     return {"status": "CalmNest is alive 🌿"}
 
 
+@app.get("/metrics")
+async def metrics():
+    return {
+        "update_queue": update_queue.stats(),
+        "update_dedup": update_dedup.stats(),
+        "user_ordering": user_executor.stats(),
+        "burst_coalescing": burst_coalescer.stats(),
+        "llm": llm_governor.stats(),
+        "model_router": model_router.stats(),
+        "llm_early_stop": early_stop_stats.stats(),
+        "prompt_layout": prompt_layout_stats.stats(),
+        "reply_similarity": reply_similarity.stats(),
+        "db_pool": get_db_pool_stats(),
+        "db_executor": get_db_executor_stats(),
+        "write_behind": get_write_behind_stats(),
+        "context_cache": get_context_cache_stats(),
+        "retention": retention.stats(),
+        "local_recall": local_recall.stats(),
+        "vector_recall": vector_store.stats(),
+        "summaries": summarizer.stats(),
+        "checkin_pool": checkin_pool.stats(),
+    }
+
+
 @app.post("/webhook")
 @limiter.limit(RATE_LIMIT)
 async def telegram_webhook(request: Request):
     try:
         data = await request.json()
+        if not isinstance(data, dict) or not isinstance(data.get("update_id"), int):
+            logger.warning("Webhook payload is not a Telegram update; ignoring")
+            return {"ok": False}
         update = Update.de_json(data, telegram_app.bot)
-        await telegram_app.process_update(update)
-        return {"ok": True}
     except Exception as e:
         logger.error("Webhook error: %s", e)
         return {"ok": False}
 
+    # Redeliveries of an update already accepted (here or by another worker) stop here.
+    if not await update_dedup.claim(update.update_id):
+        return {"ok": True}
+    # A user with a full backlog, or a full queue, gets backpressure instead of buffering.
+    admitted = user_executor.admit(update)
+    if not admitted or not update_queue.submit(update):
+        if admitted:
+            user_executor.release(update)
+        # Non-2xx makes Telegram redeliver the update later, so let that copy through.
+        await update_dedup.release(update.update_id)
+        return JSONResponse({"ok": False, "error": "busy"}, status_code=503)
+    return {"ok": True}
+
 
 # ---------------- GUNICORN ENTRYPOINT ---------------- #
 
@@ -1,11 +1,14 @@
+import asyncio
 import os
 import pytest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test-token-123")
 os.environ.setdefault("GROQ_API_KEY", "test-groq-key-123")
 
-from bot.ai import get_ai_reply
+from bot.ai import generate_checkin_message_async, generate_checkin_messages_batch_async, parse_checkin_batch
+from bot.ai import get_ai_reply, get_ai_reply_async, stream_ai_reply, early_stop_stats, llm_governor
+from bot.llm import LLMGovernor, ModelRouter, PromptLayoutStats
 from bot.config import SYSTEM_PROMPT
 
 
@@ -98,3 +101,353 @@ class TestGetAiReply:
 
         call_args = mock_client.chat.completions.create.call_args
         assert call_args.kwargs["max_tokens"] == 520
+
+
+class TestPromptPrefix:
+    @patch("bot.ai.client")
+    def test_static_prefix_is_identical_across_users_and_turns(self, mock_client):
+        mock_choice = MagicMock()
+        mock_choice.message.content = "Response"
+        mock_client.chat.completions.create.return_value = MagicMock(choices=[mock_choice])
+
+        get_ai_reply([{"role": "user", "content": "I feel anxious"}], latest_user_text="I feel anxious")
+        first = mock_client.chat.completions.create.call_args.kwargs["messages"]
+        get_ai_reply(
+            [{"role": "system", "content": "Known profile details"}, {"role": "user", "content": "Explain step by step"}],
+            latest_user_text="Can you explain in detail step by step what to do?",
+            generation_metadata={"ritual_hints": ["Offer a weekly reflection."]},
+        )
+        second = mock_client.chat.completions.create.call_args.kwargs["messages"]
+
+        assert first[:2] == second[:2]
+        assert first[2] != second[2]
+        assert second[4]["content"] == "Known profile details"
+
+    def test_layout_stats_aggregate_reported_usage(self):
+        stats = PromptLayoutStats()
+        usage = MagicMock(prompt_tokens=1200, prompt_time=0.05)
+        usage.prompt_tokens_details.cached_tokens = 1000
+        stats.record("stable", 1, 400.0, usage)
+        stats.record("stable", 1, 200.0)
+        stats.record("dynamic_first", 2, 500.0, MagicMock(prompt_tokens=1200, prompt_time=0.09))
+
+        result = stats.stats()
+        assert result["stable"]["requests"] == 2
+        assert result["stable"]["distinct_prefixes"] == 1
+        assert result["stable"]["avg_latency_ms"] == 300.0
+        assert result["stable"]["avg_prompt_time_ms"] == 50.0
+        assert result["stable"]["cached_tokens"] == 1000
+        assert result["dynamic_first"]["avg_prompt_time_ms"] == 90.0
+
+
+class TestAsyncClient:
+    @pytest.mark.asyncio
+    @patch("bot.ai.async_client")
+    async def test_reply_uses_async_client(self, mock_client):
+        mock_choice = MagicMock()
+        mock_choice.message.content = "I'm here for you."
+        mock_client.chat.completions.create = AsyncMock(return_value=MagicMock(choices=[mock_choice]))
+
+        reply = await get_ai_reply_async([{"role": "user", "content": "I feel sad"}])
+
+        assert reply == "I'm here for you."
+        messages = mock_client.chat.completions.create.call_args.kwargs["messages"]
+        assert messages[0]["content"] == SYSTEM_PROMPT
+
+    @pytest.mark.asyncio
+    @patch("bot.ai.async_client")
+    async def test_checkin_uses_async_client(self, mock_client):
+        mock_choice = MagicMock()
+        mock_choice.message.content = "  Thinking of you this evening.  "
+        mock_client.chat.completions.create = AsyncMock(return_value=MagicMock(choices=[mock_choice]))
+
+        message = await generate_checkin_message_async("evening", "Asha")
+
+        assert message == "Thinking of you this evening."
+        assert mock_client.chat.completions.create.call_args.kwargs["max_tokens"] == 120
+
+
+
+class TestCheckinBatch:
+    def test_parse_maps_entries_in_order_and_blanks_empty_messages(self):
+        content = (
+            "Here you go:\n```json\n"
+            '[{"id": 1, "name": "asha", "message": "  Hi Asha.  "}, {"id": 2, "name": "Ravi", "message": ""},'
+            ' {"id": 3, "name": "unknown", "message": "Evening."}]\n```'
+        )
+        assert parse_checkin_batch(content, ["Asha", "Ravi", ""]) == ["Hi Asha.", "", "Evening."]
+
+    def test_parse_returns_blanks_for_unparseable_reply(self):
+        assert parse_checkin_batch("Sorry, I can't do that.", ["A", "B"]) == ["", ""]
+        assert parse_checkin_batch("[{'id': 1}", ["A"]) == [""]
+
+    def test_shuffled_or_short_reply_is_never_cross_assigned(self):
+        names = ["Asha", "Ravi"]
+        shuffled = '[{"id": 2, "name": "Ravi", "message": "For Ravi."}, {"id": 1, "name": "Asha", "message": "For Asha."}]'
+        swapped = '[{"id": 1, "name": "Ravi", "message": "For Ravi."}, {"id": 2, "name": "Asha", "message": "For Asha."}]'
+        short = '[{"id": 1, "name": "Asha", "message": "For Asha."}]'
+        merged = '[{"id": 1, "name": "Asha", "message": "For both."}, {"id": 1, "name": "Asha", "message": "Again."}]'
+
+        for content in (shuffled, swapped, short, merged):
+            assert parse_checkin_batch(content, names) == ["", ""]
+
+    def test_bad_entry_blanks_only_that_user(self):
+        names = ["Asha", "Ravi", "Mei"]
+        wrong_name = (
+            '[{"id": 1, "name": "Asha", "message": "For Asha."}, {"id": 2, "name": "Rani", "message": "For Rani."},'
+            ' {"id": 3, "name": "Mei", "message": "For Mei."}]'
+        )
+        bad_id = (
+            '[{"id": 1, "name": "Asha", "message": "For Asha."}, {"id": "two", "name": "Ravi", "message": "For Ravi."},'
+            ' {"id": 3, "name": "Mei", "message": "For Mei."}]'
+        )
+
+        assert parse_checkin_batch(wrong_name, names) == ["For Asha.", "", "For Mei."]
+        assert parse_checkin_batch(bad_id, names) == ["For Asha.", "", "For Mei."]
+
+    @pytest.mark.asyncio
+    @patch("bot.ai.async_client")
+    async def test_one_call_covers_every_user_by_name_only(self, mock_client):
+        mock_choice = MagicMock()
+        mock_choice.message.content = (
+            '[{"id": 1, "name": "Asha", "message": "Morning, Asha."}, {"id": 2, "name": "unknown", "message": "Hi there."}]'
+        )
+        mock_client.chat.completions.create = AsyncMock(return_value=MagicMock(choices=[mock_choice]))
+
+        messages = await generate_checkin_messages_batch_async("morning", ["Asha", ""])
+
+        assert messages == ["Morning, Asha.", "Hi there."]
+        assert mock_client.chat.completions.create.await_count == 1
+        prompt = mock_client.chat.completions.create.call_args.kwargs["messages"][-1]["content"]
+        assert '"name": "Asha"' in prompt and '"name": "unknown"' in prompt
+        assert "recent" not in prompt
+
+
+class _FakeStream:
+    def __init__(self, deltas):
+        self.deltas = deltas
+        self.consumed = 0
+        self.closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.closed = True
+
+    async def __aiter__(self):
+        for delta in self.deltas:
+            await asyncio.sleep(0)  # a real stream waits on the network between chunks
+            self.consumed += 1
+            chunk = MagicMock()
+            chunk.choices = [MagicMock()]
+            chunk.choices[0].delta.content = delta
+            yield chunk
+
+
+def _stream_of(*deltas):
+    return _FakeStream(list(deltas))
+
+
+class TestStreamingReply:
+    @pytest.mark.asyncio
+    @patch("bot.ai.async_client")
+    async def test_slow_partial_callback_does_not_hold_the_llm_slot(self, mock_client):
+        mock_client.chat.completions.create = AsyncMock(return_value=_stream_of("Breathe", " with me."))
+        in_flight_during_callback = []
+        partials = []
+
+        async def on_partial(text):
+            await asyncio.sleep(0.02)  # e.g. a Telegram flood wait
+            in_flight_during_callback.append(llm_governor.stats()["in_flight"])
+            partials.append(text)
+
+        reply = await stream_ai_reply(
+            [{"role": "user", "content": "I feel on edge"}],
+            latest_user_text="I feel on edge",
+            on_partial=on_partial,
+        )
+
+        assert reply.endswith("Breathe with me.")
+        assert partials[-1] == "Breathe with me."
+        assert in_flight_during_callback[-1] == 0
+
+    @pytest.mark.asyncio
+    @patch("bot.ai.async_client")
+    async def test_reports_partials_and_refines_final_text(self, mock_client):
+        mock_client.chat.completions.create = AsyncMock(return_value=_stream_of("That sounds", None, " heavy.", " Rest well."))
+        partials = []
+
+        async def on_partial(text):
+            partials.append(text)
+
+        reply = await stream_ai_reply(
+            [{"role": "user", "content": "I had a long day at work today"}],
+            latest_user_text="I had a long day at work today",
+            on_partial=on_partial,
+        )
+
+        assert partials == ["That sounds", "That sounds heavy.", "That sounds heavy. Rest well."]
+        assert reply == "That sounds heavy. Rest well."
+        assert mock_client.chat.completions.create.call_args.kwargs["stream"] is True
+
+    @pytest.mark.asyncio
+    @patch("bot.ai.async_client")
+    async def test_slo_sample_is_time_to_first_token(self, mock_client):
+        class _SlowTail(_FakeStream):
+            async def __aiter__(self):
+                async for chunk in super().__aiter__():
+                    yield chunk
+                    await asyncio.sleep(0.2)
+
+        mock_client.chat.completions.create = AsyncMock(return_value=_SlowTail(["Breathe", " with me."]))
+        router = ModelRouter({"chat_short": "fast"}, fallback="fast", min_samples=1)
+
+        with patch("bot.ai.model_router", router):
+            await stream_ai_reply([{"role": "user", "content": "hi"}], latest_user_text="hi")
+
+        (pool,) = router.stats()["latency"].values()
+        assert pool["count"] == 1
+        assert pool["p95_ms"] < 200
+
+    @pytest.mark.asyncio
+    @patch("bot.ai.async_client")
+    async def test_early_stop_cancels_at_sentence_boundary(self, mock_client):
+        sentence = "That sounds like a really heavy week for you. "
+        stream = _stream_of(*(word + " " for word in (sentence * 20).split()))
+        mock_client.chat.completions.create = AsyncMock(return_value=stream)
+        before = early_stop_stats.stats()
+
+        reply = await stream_ai_reply(
+            [{"role": "user", "content": "I feel low"}],
+            latest_user_text="I feel low",
+            early_stop=True,
+        )
+
+        # Short style: 60 words, so the reply ends after the sixth full sentence.
+        assert reply == (sentence * 6).strip()
+        assert stream.closed
+        assert stream.consumed < 70
+        after = early_stop_stats.stats()
+        assert after["early_stops"] == before["early_stops"] + 1
+        assert after["tokens_saved"] > before["tokens_saved"]
+
+    @pytest.mark.asyncio
+    @patch("bot.ai.async_client")
+    async def test_without_early_stop_reads_whole_stream(self, mock_client):
+        stream = _stream_of(*("word " for _ in range(100)))
+        mock_client.chat.completions.create = AsyncMock(return_value=stream)
+
+        reply = await stream_ai_reply([], latest_user_text="hi", early_stop=False)
+
+        assert stream.consumed == 100
+        # Trimmed to 60 words by refinement, which then adds "I hear you."
+        assert len(reply.split()) == 63
+
+
+class TestLLMGovernor:
+    @pytest.mark.asyncio
+    async def test_limits_in_flight_requests_and_tracks_queue(self):
+        governor = LLMGovernor(limit=2)
+        peak = 0
+        release = asyncio.Event()
+
+        async def call():
+            nonlocal peak
+            async with governor.slot():
+                peak = max(peak, governor.stats()["in_flight"])
+                await release.wait()
+
+        tasks = [asyncio.create_task(call()) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        stats = governor.stats()
+        assert stats["in_flight"] == 2
+        assert stats["queue_depth"] == 3
+
+        release.set()
+        await asyncio.gather(*tasks)
+        stats = governor.stats()
+        assert peak == 2
+        assert stats["completed"] == 5
+        assert stats["queue_depth"] == 0
+        assert stats["max_queue_depth"] >= 3
+
+    @pytest.mark.asyncio
+    async def test_counts_errors_and_releases_slot(self):
+        governor = LLMGovernor(limit=1)
+        with pytest.raises(RuntimeError):
+            async with governor.slot():
+                raise RuntimeError("upstream failed")
+        async with governor.slot():
+            pass
+        assert governor.stats()["errors"] == 1
+        assert governor.stats()["in_flight"] == 0
+
+
+class TestModelRouter:
+    def _router(self):
+        return ModelRouter(
+            {"chat_short": "fast", "chat_long": "big", "checkin": "fast"},
+            fallback="fast",
+            slo_p95_ms=1000,
+            cooldown_s=60,
+            window=20,
+            min_samples=5,
+        )
+
+    def test_routes_by_call_type(self):
+        router = self._router()
+        assert router.choose("chat_short") == "fast"
+        assert router.choose("chat_long") == "big"
+        assert router.choose("chat_medium", "default-model") == "default-model"
+        assert router.stats()["decisions"]["chat_long->big"] == 1
+
+    def test_downgrades_on_slo_breach_and_recovers_after_cooldown(self):
+        router = self._router()
+        for _ in range(5):
+            router.record("chat_long", "big", 3000)
+        assert router.choose("chat_long") == "fast"
+        stats = router.stats()
+        assert stats["downgrades"] == 1
+        assert stats["latency"]["chat_long->big"]["degraded"] is True
+        assert stats["latency"]["chat_long->big"]["histogram"]["le_4000"] == 5
+
+        router._pools[("chat_long", "big")].degraded_until = 1.0  # cooldown elapsed
+        assert router.choose("chat_long") == "big"
+        assert router.stats()["latency"]["chat_long->big"]["p95_ms"] == 0.0
+
+    def test_routes_sharing_a_model_have_separate_slos(self):
+        router = ModelRouter(
+            {"chat_medium": "big", "chat_long": "big"},
+            fallback="fast",
+            slo_p95_ms=1000,
+            min_samples=5,
+        )
+        for _ in range(5):
+            router.record("chat_long", "big", 3000)
+            router.record("chat_medium", "big", 400)
+
+        assert router.choose("chat_long") == "fast"
+        assert router.choose("chat_medium") == "big"
+
+    def test_track_records_failures(self):
+        router = self._router()
+        with pytest.raises(RuntimeError):
+            with router.track("chat_long", "big"):
+                raise RuntimeError("timeout")
+        with router.track("chat_long", "big"):
+            pass
+        stats = router.stats()["latency"]["chat_long->big"]
+        assert stats["count"] == 2
+        assert stats["errors"] == 1
+
+    @patch("bot.ai.client")
+    def test_short_replies_use_the_short_route(self, mock_client):
+        mock_choice = MagicMock()
+        mock_choice.message.content = "Short response"
+        mock_client.chat.completions.create.return_value = MagicMock(choices=[mock_choice])
+
+        with patch("bot.ai.model_router", self._router()):
+            get_ai_reply([{"role": "user", "content": "hi"}], latest_user_text="quick question")
+
+        assert mock_client.chat.completions.create.call_args.kwargs["model"] == "fast"
@@ -0,0 +1,99 @@
+import os
+import tempfile
+from datetime import datetime
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+_tmp_db = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+os.environ["CALMNEST_DB_PATH"] = _tmp_db.name
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test-token-123")
+os.environ.setdefault("GROQ_API_KEY", "test-groq-key-123")
+
+from bot.checkin_pool import CheckinPool, next_slot_window
+from bot.memory import (
+    get_pregenerated_user_ids,
+    init_db,
+    purge_expired_checkins,
+    register_user,
+    save_message,
+    save_pregenerated_checkins,
+    set_checkin_enabled,
+    take_pregenerated_checkins,
+)
+
+
+def setup_function():
+    init_db()
+
+
+def teardown_function():
+    from bot.memory import _get_connection, invalidate_recent_messages
+
+    invalidate_recent_messages()
+    conn = _get_connection()
+    try:
+        conn.execute("PRAGMA foreign_keys=OFF")
+        conn.execute("DELETE FROM checkin_pool")
+        conn.execute("DELETE FROM messages")
+        conn.execute("DELETE FROM users")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_next_slot_window_wraps_past_midnight():
+    slot, start, end = next_slot_window(datetime(2025, 1, 1, 19, 30))
+    assert (slot, start, end) == ("night", datetime(2025, 1, 1, 21), datetime(2025, 1, 2, 6))
+    slot, start, _end = next_slot_window(datetime(2025, 1, 1, 23, 0))
+    assert (slot, start) == ("morning", datetime(2025, 1, 2, 6))
+
+
+def test_take_returns_unexpired_entries_for_the_slot_once():
+    for user_id in (1, 2, 3):
+        register_user(user_id=user_id, chat_id=10 + user_id)
+    save_pregenerated_checkins([(1, "night", "hello one", 2000.0), (2, "evening", "wrong slot", 2000.0), (3, "night", "stale", 500.0)])
+
+    assert take_pregenerated_checkins([1, 2, 3], "night", now=1000.0) == {1: "hello one"}
+    assert take_pregenerated_checkins([1], "night", now=1000.0) == {}
+    assert purge_expired_checkins(now=1000.0) == 1
+
+
+@pytest.mark.asyncio
+async def test_fill_pregenerates_next_slot_for_due_users_only():
+    for user_id in (1, 2, 3):
+        register_user(user_id=user_id, chat_id=10 + user_id, first_name=f"U{user_id}")
+    set_checkin_enabled(3, False)
+    save_message(1, "user", "Long day at work")
+    pool = CheckinPool(lead_minutes=90)
+    fake = AsyncMock(return_value=["for one", "for two"])
+    now = datetime(2025, 1, 1, 20, 0)
+
+    with patch("bot.checkin_pool.CHECKIN_LLM_BATCH_SIZE", 20), \
+            patch("bot.checkin_pool.generate_checkin_messages_batch_async", fake):
+        assert await pool.fill(now=datetime(2025, 1, 1, 18, 0)) == 0  # too early
+        assert await pool.fill(now=now) == 2
+        assert await pool.fill(now=now) == 0  # already pooled
+
+    fake.assert_awaited_once()
+    slot, users = fake.await_args.args
+    assert slot == "night"
+    assert users == ["U1", "U2"]
+    expires = datetime(2025, 1, 2, 6).timestamp()
+    assert take_pregenerated_checkins([1], "night", now=expires) == {}
+    assert take_pregenerated_checkins([1, 2, 3], "night", now=expires - 1) == {1: "for one", 2: "for two"}
+    assert pool.stats()["generated"] == 2
+
+
+def test_entry_is_discarded_once_the_user_writes_again():
+    for user_id in (1, 2):
+        register_user(user_id=user_id, chat_id=10 + user_id)
+    expires = datetime(2030, 1, 1).timestamp()
+    save_pregenerated_checkins([(1, "night", "Hope today felt lighter!", expires), (2, "night", "Rest well.", expires)])
+    save_message(1, "user", "Everything just fell apart tonight")
+
+    assert get_pregenerated_user_ids([1, 2], "night", now=expires - 1) == {2}
+    assert take_pregenerated_checkins([1, 2], "night", now=expires - 1) == {2: "Rest well."}
+    # The stale entry is gone too, so nothing sends it later.
+    assert take_pregenerated_checkins([1], "night", now=expires - 1) == {}
@@ -0,0 +1,115 @@
+import asyncio
+import os
+
+import pytest
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test-token-123")
+os.environ.setdefault("GROQ_API_KEY", "test-groq-key-123")
+
+from bot.coalescer import BurstCoalescer
+
+
+@pytest.mark.asyncio
+async def test_burst_gets_one_reply_covering_every_message():
+    replies = []
+
+    async def respond(texts, commit):
+        commit()
+        replies.append(texts)
+
+    coalescer = BurstCoalescer(window_ms=20)
+    for text in ("i can't", "breathe", "everything is too much"):
+        coalescer.add(1, text, respond)
+        await asyncio.sleep(0.005)
+    coalescer.add(2, "hi", respond)
+
+    await asyncio.sleep(0.05)
+    await coalescer.drain(timeout=1)
+
+    assert sorted(replies) == [["hi"], ["i can't", "breathe", "everything is too much"]]
+    stats = coalescer.stats()
+    assert stats["messages"] == 4 and stats["coalesced"] == 2 and stats["replies"] == 2
+    assert stats["active_bursts"] == 0
+
+
+@pytest.mark.asyncio
+async def test_newer_message_cancels_uncommitted_generation():
+    started = []
+    replies = []
+
+    async def respond(texts, commit):
+        started.append(texts)
+        await asyncio.sleep(0.05)
+        commit()
+        replies.append(texts)
+
+    coalescer = BurstCoalescer(window_ms=10)
+    coalescer.add(1, "first", respond)
+    await asyncio.sleep(0.03)  # generation for ["first"] is in flight
+    coalescer.add(1, "second", respond)
+    await asyncio.sleep(0.1)
+    await coalescer.drain(timeout=1)
+
+    assert started == [["first"], ["first", "second"]]
+    assert replies == [["first", "second"]]
+    assert coalescer.stats()["cancelled_generations"] == 1
+
+
+@pytest.mark.asyncio
+async def test_committed_reply_finishes_and_next_reply_follows_it():
+    events = []
+
+    async def respond(texts, commit):
+        commit()
+        events.append(("start", texts))
+        await asyncio.sleep(0.05)
+        events.append(("end", texts))
+
+    coalescer = BurstCoalescer(window_ms=10)
+    coalescer.add(1, "first", respond)
+    await asyncio.sleep(0.03)  # first reply is committed and still sending
+    coalescer.add(1, "second", respond)
+    await asyncio.sleep(0.01)
+    await coalescer.drain(timeout=1)
+
+    assert events == [
+        ("start", ["first"]),
+        ("end", ["first"]),
+        ("start", ["second"]),
+        ("end", ["second"]),
+    ]
+    assert coalescer.stats()["cancelled_generations"] == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_reply_is_counted_and_cleared():
+    async def respond(texts, commit):
+        raise RuntimeError("boom")
+
+    coalescer = BurstCoalescer(window_ms=0)
+    coalescer.add(1, "hello", respond)
+    await coalescer.drain(timeout=1)
+
+    stats = coalescer.stats()
+    assert stats["errors"] == 1 and stats["active_bursts"] == 0
+
+
+@pytest.mark.asyncio
+async def test_drain_cancels_replies_still_running_after_timeout():
+    cancelled = []
+
+    async def respond(texts, commit):
+        commit()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(texts)
+            raise
+
+    coalescer = BurstCoalescer(window_ms=0)
+    coalescer.add(1, "hello", respond)
+    await asyncio.sleep(0.01)
+    await coalescer.drain(timeout=0.05)
+
+    assert cancelled == [["hello"]]
+    assert coalescer.stats()["active_bursts"] == 0
@@ -0,0 +1,51 @@
+from bot.context_builder import estimate_tokens, message_tokens, pack_messages
+
+
+def _turn(role: str, words: int, tag: str = "") -> dict:
+    return {"role": role, "content": " ".join([f"word{tag}"] * words)}
+
+
+def test_estimate_tokens_counts_words_punctuation_and_long_words():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("I feel calm today.") == 5
+    assert estimate_tokens("overwhelmingly") == 4
+    assert estimate_tokens("2024") == 2
+    assert estimate_tokens("こんにちは") > estimate_tokens("hello")
+
+
+def test_pack_keeps_everything_within_budget():
+    messages = [
+        {"role": "system", "content": "Relevant long-term memory"},
+        {"role": "user", "content": "Hi"},
+        {"role": "assistant", "content": "Hello there"},
+    ]
+    packed, summary = pack_messages(messages, budget=1000)
+    assert packed == messages
+    assert summary["kept"] == 2
+    assert summary["dropped"] == 0
+    assert summary["tokens"] == sum(message_tokens(m) for m in messages)
+
+
+def test_pack_keeps_newest_turns_and_collapses_older_ones():
+    messages = [
+        {"role": "system", "content": "Profile hint"},
+        *[_turn("user", 200, str(i)) for i in range(5)],
+        {"role": "assistant", "content": "Latest reply"},
+        {"role": "user", "content": "Latest question"},
+    ]
+    packed, summary = pack_messages(messages, budget=300)
+
+    assert packed[0]["content"] == "Profile hint"
+    assert packed[-2:] == messages[-2:]
+    assert packed[1]["role"] == "system"
+    assert packed[1]["content"].startswith("Earlier in this conversation (condensed):")
+    assert summary["collapsed"] + summary["dropped"] == 5
+    assert summary["collapsed"] >= 1
+    assert summary["tokens"] <= 300
+
+
+def test_pack_truncates_an_oversized_newest_turn():
+    packed, summary = pack_messages([_turn("user", 500)], budget=50)
+    assert len(packed) == 1
+    assert packed[0]["content"].endswith("…")
+    assert summary["tokens"] <= 50
@@ -0,0 +1,97 @@
+import time
+
+from bot.context_cache import RecentMessageCache
+
+
+def _loader(messages, calls):
+    def load():
+        calls.append(1)
+        return list(messages)
+    return load
+
+
+def test_second_read_is_a_hit():
+    cache = RecentMessageCache(window=5)
+    calls = []
+    load = _loader([{"role": "user", "content": "hi"}], calls)
+
+    assert cache.get(1, load) == [{"role": "user", "content": "hi"}]
+    assert cache.get(1, load) == [{"role": "user", "content": "hi"}]
+
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_append_updates_window_in_place():
+    cache = RecentMessageCache(window=2)
+    calls = []
+    cache.get(1, _loader([{"role": "user", "content": "a"}], calls))
+
+    cache.append(1, {"role": "assistant", "content": "b"})
+    cache.append(1, {"role": "user", "content": "c"})
+
+    assert [m["content"] for m in cache.get(1, _loader([], calls))] == ["b", "c"]
+    assert len(calls) == 1
+
+
+def test_evicts_least_recently_used_user():
+    cache = RecentMessageCache(window=5, max_users=2)
+    calls = []
+    for user_id in (1, 2):
+        cache.get(user_id, _loader([], calls))
+    cache.get(1, _loader([], calls))
+    cache.get(3, _loader([], calls))
+
+    assert cache.stats()["evictions"] == 1
+    cache.get(2, _loader([], calls))
+    assert len(calls) == 4
+
+
+def test_expired_entry_is_reloaded():
+    cache = RecentMessageCache(window=5, ttl_seconds=0.01)
+    calls = []
+    cache.get(1, _loader([], calls))
+    time.sleep(0.02)
+    cache.get(1, _loader([], calls))
+
+    assert len(calls) == 2
+    assert cache.stats()["expirations"] == 1
+
+
+def test_fill_racing_with_write_is_not_cached():
+    cache = RecentMessageCache(window=5)
+    calls = []
+
+    def racing_load():
+        calls.append(1)
+        cache.append(1, {"role": "user", "content": "new"})
+        return []
+
+    cache.get(1, racing_load)
+    cache.get(1, _loader([{"role": "user", "content": "new"}], calls))
+
+    assert len(calls) == 2
+
+
+def test_rejected_window_is_reloaded():
+    cache = RecentMessageCache(window=5)
+    calls = []
+    current = {1}
+
+    def load():
+        calls.append(1)
+        return [{"role": "user", "content": "hi"}], "marker"
+
+    def validate(seen):
+        assert seen == {1: ("marker", 1)}
+        return current & set(seen)
+
+    cache.get(1, load, validate)
+    cache.append(1, {"role": "assistant", "content": "hello"})
+    assert len(cache.get(1, load, validate)) == 2
+    current.clear()
+    assert len(cache.get(1, load, validate)) == 1
+
+    assert len(calls) == 2
+    assert cache.stats()["stale"] == 1
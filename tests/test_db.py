@@ -0,0 +1,160 @@
+import sqlite3
+import threading
+
+import pytest
+
+from bot.db import ConnectionPool, DBExecutor, WriteBehindQueue
+
+
+def _factory():
+    return sqlite3.connect(":memory:", check_same_thread=False)
+
+
+def test_reuses_released_connection():
+    pool = ConnectionPool(_factory, size=2)
+
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+
+    assert first is second
+    stats = pool.stats()
+    assert stats["opened"] == 1
+    assert stats["hits"] == 1
+    assert stats["open"] == 1
+    assert stats["in_use"] == 0
+
+
+def test_nested_checkout_shares_thread_connection():
+    pool = ConnectionPool(_factory, size=1)
+
+    with pool.connection() as outer:
+        with pool.connection() as inner:
+            assert inner is outer
+
+    assert pool.stats()["opened"] == 1
+
+
+def test_waits_when_pool_exhausted():
+    pool = ConnectionPool(_factory, size=1, timeout=5)
+    checked_out = threading.Event()
+    release = threading.Event()
+
+    def holder():
+        with pool.connection():
+            checked_out.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=holder)
+    thread.start()
+    checked_out.wait(5)
+    threading.Timer(0.05, release.set).start()
+
+    with pool.connection():
+        pass
+    thread.join()
+
+    stats = pool.stats()
+    assert stats["waits"] == 1
+    assert stats["open"] == 1
+
+
+def test_close_drops_idle_connections():
+    pool = ConnectionPool(_factory, size=2)
+    with pool.connection():
+        pass
+
+    pool.close()
+
+    assert pool.stats()["open"] == 0
+    with pool.connection():
+        pass
+    assert pool.stats()["opened"] == 2
+
+
+@pytest.mark.asyncio
+async def test_executor_runs_off_event_loop_thread():
+    executor = DBExecutor(workers=2)
+    caller = threading.get_ident()
+
+    worker = await executor.run(threading.get_ident)
+
+    assert worker != caller
+    stats = executor.stats()
+    assert stats["completed"] == 1
+    assert stats["queue_depth"] == 0
+    assert stats["running"] == 0
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_executor_counts_errors():
+    executor = DBExecutor(workers=1)
+
+    def fail():
+        raise sqlite3.OperationalError("database is locked")
+
+    with pytest.raises(sqlite3.OperationalError):
+        await executor.run(fail)
+
+    assert executor.stats()["errors"] == 1
+    executor.shutdown()
+
+
+def test_write_behind_flushes_in_batches():
+    written = []
+
+    def write_batch(rows, publishing):
+        with publishing():
+            written.append(list(rows))
+
+    queue = WriteBehindQueue(write_batch, batch_size=3, interval_ms=10_000, max_pending=10)
+    for i in range(7):
+        queue.put(i)
+    queue.stop()
+
+    assert [row for batch in written for row in batch] == list(range(7))
+    assert all(len(batch) <= 3 for batch in written)
+    assert queue.stats()["pending"] == 0
+    assert queue.stats()["flushed_rows"] == 7
+
+
+def test_write_behind_applies_backpressure_when_full():
+    written = []
+
+    def write_batch(rows, publishing):
+        with publishing():
+            written.extend(rows)
+
+    queue = WriteBehindQueue(write_batch, batch_size=2, interval_ms=10_000, max_pending=2)
+    queue.stop()
+    for i in range(5):
+        queue.put(i)
+
+    assert queue.stats()["pending"] <= 2
+    assert queue.stats()["backpressure_flushes"] >= 1
+    queue.stop()
+    assert written == list(range(5))
+
+
+def test_read_consistent_sees_pending_rows_once():
+    stored = []
+
+    def write_batch(rows, publishing):
+        with publishing():
+            stored.extend(rows)
+
+    queue = WriteBehindQueue(write_batch, batch_size=100, interval_ms=10_000)
+    queue.put(("a", 1))
+    queue.put(("b", 2))
+
+    result, pending = queue.read_consistent(lambda: list(stored), lambda row: row[0] == "a")
+    assert result == []
+    assert pending == [("a", 1)]
+
+    queue.flush()
+    result, pending = queue.read_consistent(lambda: list(stored), lambda row: row[0] == "a")
+    assert ("a", 1) in result
+    assert pending == []
+    queue.stop()
@@ -0,0 +1,81 @@
+import os
+import tempfile
+
+import pytest
+
+_tmp_db = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+os.environ["CALMNEST_DB_PATH"] = _tmp_db.name
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test-token-123")
+os.environ.setdefault("GROQ_API_KEY", "test-groq-key-123")
+
+from bot.dedup import UpdateDeduplicator
+from bot.memory import claim_update_id, init_db, purge_processed_updates
+
+
+def setup_function():
+    init_db()
+
+
+def teardown_function():
+    from bot.memory import _get_connection
+
+    conn = _get_connection()
+    try:
+        conn.execute("DELETE FROM processed_updates")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+@pytest.mark.asyncio
+async def test_redelivered_update_is_dropped_from_memory():
+    dedup = UpdateDeduplicator(ttl_seconds=60)
+
+    assert await dedup.claim(101)
+    assert not await dedup.claim(101)
+    assert await dedup.claim(102)
+
+    stats = dedup.stats()
+    assert stats["checked"] == 3 and stats["memory_hits"] == 1 and stats["duplicates"] == 1
+
+
+@pytest.mark.asyncio
+async def test_table_catches_duplicates_across_workers_and_restarts():
+    first = UpdateDeduplicator(ttl_seconds=60)
+    second = UpdateDeduplicator(ttl_seconds=60)  # another worker, or after a restart
+
+    assert await first.claim(201)
+    assert not await second.claim(201)
+    assert second.stats()["db_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_released_update_is_processed_on_redelivery():
+    dedup = UpdateDeduplicator(ttl_seconds=60)
+
+    assert await dedup.claim(301)
+    await dedup.release(301)
+
+    assert await dedup.claim(301)
+    assert await UpdateDeduplicator(ttl_seconds=60).claim(302)
+
+
+@pytest.mark.asyncio
+async def test_memory_is_bounded():
+    dedup = UpdateDeduplicator(ttl_seconds=60, max_size=2)
+    for update_id in (401, 402, 403):
+        assert await dedup.claim(update_id)
+
+    assert dedup.stats()["tracked"] == 2
+    # Evicted from memory, still refused by the table.
+    assert not await dedup.claim(401)
+    assert dedup.stats()["db_hits"] == 1
+
+
+def test_expired_ids_are_reclaimed_and_purged():
+    assert claim_update_id(501, now=1000.0, seen_after=0.0)
+    assert not claim_update_id(501, now=1010.0, seen_after=950.0)
+    assert claim_update_id(501, now=2000.0, seen_after=1500.0)
+
+    assert claim_update_id(502, now=100.0, seen_after=0.0)
+    assert purge_processed_updates(before=1500.0) == 1
@@ -0,0 +1,173 @@
+import os
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test-token-123")
+os.environ.setdefault("GROQ_API_KEY", "test-groq-key-123")
+
+from bot.coalescer import BurstCoalescer
+from bot.handlers import _StreamingReply, handle_message
+from bot.memory import get_recent_messages, init_db, register_user, save_message
+from telegram.error import NetworkError, RetryAfter
+
+
+def setup_function():
+    init_db()
+
+
+def teardown_function():
+    from bot.memory import _get_connection, invalidate_recent_messages
+
+    invalidate_recent_messages()
+    conn = _get_connection()
+    try:
+        conn.execute("PRAGMA foreign_keys=OFF")
+        conn.execute("DELETE FROM relational_memory")
+        conn.execute("DELETE FROM user_ritual_state")
+        conn.execute("DELETE FROM messages")
+        conn.execute("DELETE FROM users")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _make_streaming():
+    update = MagicMock()
+    sent = MagicMock(chat_id=10, message_id=99)
+    update.message.reply_text = AsyncMock(return_value=sent)
+    context = MagicMock()
+    context.bot.edit_message_text = AsyncMock()
+    return _StreamingReply(update, context), update, context
+
+
+class TestStreamingReply:
+    @pytest.mark.asyncio
+    @patch("bot.handlers.STREAM_FIRST_CHUNK_CHARS", 10)
+    async def test_sends_first_chunk_then_throttles_edits(self):
+        streaming, update, context = _make_streaming()
+        streaming.interval = 60
+
+        await streaming.update_text("Hi")
+        update.message.reply_text.assert_not_called()
+
+        await streaming.update_text("Hi there, I hear")
+        await streaming.update_text("Hi there, I hear you")
+        update.message.reply_text.assert_awaited_once_with("Hi there, I hear")
+        context.bot.edit_message_text.assert_not_called()
+        assert streaming.first_visible_ms is not None
+
+        await streaming.finish("I hear you. Hi there, I hear you.")
+        context.bot.edit_message_text.assert_awaited_once_with(
+            text="I hear you. Hi there, I hear you.",
+            chat_id=10,
+            message_id=99,
+        )
+
+    @pytest.mark.asyncio
+    @patch("bot.handlers.STREAM_FIRST_CHUNK_CHARS", 5)
+    async def test_failed_first_send_is_retried_by_finish(self):
+        streaming, update, context = _make_streaming()
+        sent = update.message.reply_text.return_value
+        update.message.reply_text.side_effect = [RetryAfter(1), sent]
+
+        await streaming.update_text("Hi there")
+        await streaming.finish("Hi there, I hear you.")
+
+        assert update.message.reply_text.await_count == 2
+        update.message.reply_text.assert_awaited_with("Hi there, I hear you.")
+        context.bot.edit_message_text.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_finish_without_partials_sends_one_message(self):
+        streaming, update, context = _make_streaming()
+
+        await streaming.finish("Short reply.")
+
+        update.message.reply_text.assert_awaited_once_with("Short reply.")
+        context.bot.edit_message_text.assert_not_called()
+
+
+def _text_update(user_id: int, text: str):
+    update = MagicMock()
+    update.message.from_user = MagicMock(id=user_id, first_name="Ana", username="")
+    update.message.chat_id = user_id
+    update.message.text = text
+    update.message.reply_text = AsyncMock()
+    return update
+
+
+class TestBurstReply:
+    @pytest.mark.asyncio
+    @patch("bot.handlers.STREAM_REPLIES", False)
+    async def test_burst_gets_one_reply_without_quoting_itself(self):
+        register_user(7100, 7100, first_name="Ana")
+        save_message(7100, "user", "My sister visited last week")
+        coalescer = BurstCoalescer(window_ms=20)
+        reply = AsyncMock(return_value="I'm here with you.")
+        first = _text_update(7100, "I can't sleep again")
+        second = _text_update(7100, "my mind keeps racing")
+
+        with patch("bot.handlers.burst_coalescer", coalescer), \
+                patch("bot.handlers.get_ai_reply_async", reply), \
+                patch("bot.handlers.memory_provider.super_enabled", False):
+            await handle_message(first, MagicMock())
+            await handle_message(second, MagicMock())
+            await coalescer.drain(timeout=2)
+
+        reply.assert_awaited_once()
+        kwargs = reply.await_args.kwargs
+        assert kwargs["latest_user_text"] == "I can't sleep again\nmy mind keeps racing"
+        hints = "\n".join(kwargs["generation_metadata"]["ritual_hints"])
+        assert "Last time you said My sister visited last week" in hints
+        assert "I can't sleep again" not in hints and "my mind keeps racing" not in hints
+        second.message.reply_text.assert_awaited_once_with("I'm here with you.")
+        first.message.reply_text.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch("bot.handlers.STREAM_REPLIES", True)
+    @patch("bot.handlers.STREAM_FIRST_CHUNK_CHARS", 5)
+    async def test_failed_stream_replaces_partial_with_fallback(self):
+        from bot.handlers import FALLBACK_REPLY, _reply
+
+        register_user(7200, 7200, first_name="Ana")
+        update = _text_update(7200, "rough night")
+        update.message.reply_text = AsyncMock(return_value=MagicMock(chat_id=7200, message_id=5))
+        context = MagicMock()
+        context.bot.edit_message_text = AsyncMock()
+
+        async def broken_stream(*args, on_partial, **kwargs):
+            await on_partial("That sounds really hard and")
+            raise RuntimeError("connection reset")
+
+        with patch("bot.handlers.stream_ai_reply", broken_stream), \
+                patch("bot.handlers.memory_provider.super_enabled", False):
+            await _reply(update, context, ["rough night"], lambda: None)
+
+        update.message.reply_text.assert_awaited_once_with("That sounds really hard and")
+        context.bot.edit_message_text.assert_awaited_once_with(text=FALLBACK_REPLY, chat_id=7200, message_id=5)
+
+    @pytest.mark.asyncio
+    @patch("bot.handlers.STREAM_REPLIES", True)
+    @patch("bot.handlers.STREAM_FIRST_CHUNK_CHARS", 5)
+    async def test_failed_final_edit_keeps_reply_and_skips_save(self):
+        from bot.handlers import FALLBACK_REPLY, _reply
+
+        register_user(7300, 7300, first_name="Ana")
+        update = _text_update(7300, "rough night")
+        update.message.reply_text = AsyncMock(return_value=MagicMock(chat_id=7300, message_id=6))
+        context = MagicMock()
+        context.bot.edit_message_text = AsyncMock(side_effect=NetworkError("timed out"))
+
+        async def stream(*args, on_partial, **kwargs):
+            await on_partial("That sounds really hard and")
+            return "That sounds really hard and I'm here."
+
+        with patch("bot.handlers.stream_ai_reply", stream), \
+                patch("bot.handlers.memory_provider.super_enabled", False):
+            await _reply(update, context, ["rough night"], lambda: None)
+
+        update.message.reply_text.assert_awaited_once_with("That sounds really hard and")
+        context.bot.edit_message_text.assert_awaited_once()
+        assert context.bot.edit_message_text.await_args.kwargs["text"] != FALLBACK_REPLY
+        assert get_recent_messages(7300) == []
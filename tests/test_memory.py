@@ -1,4 +1,5 @@
 import os
+import sqlite3
 import tempfile
 import pytest
 
@@ -17,7 +18,8 @@ def fresh_db():
     init_db()
     yield
     # Clean up messages & users between tests
-    from bot.memory import _get_connection
+    from bot.memory import _get_connection, invalidate_recent_messages
+    invalidate_recent_messages()
     conn = _get_connection()
     try:
         conn.execute("PRAGMA foreign_keys=OFF")
@@ -134,3 +136,197 @@ class TestCheckinSlot:
         user = next(u for u in users if u["user_id"] == 1)
         # Should NOT match afternoon
         assert user["last_checkin_slot"] != "afternoon"
+
+    def test_iter_due_checkin_users_skips_current_slot(self):
+        from bot.memory import iter_due_checkin_users
+
+        for user_id in range(1, 8):
+            register_user(user_id, 1000 + user_id)
+        update_last_checkin_slot(2, "morning")
+        update_last_checkin_slot(3, "night")
+        set_checkin_enabled(4, False)
+
+        chunks = list(iter_due_checkin_users("morning", chunk_size=2))
+
+        assert all(len(chunk) <= 2 for chunk in chunks)
+        assert sorted(u["user_id"] for chunk in chunks for u in chunk) == [1, 3, 5, 6, 7]
+
+    def test_iter_due_checkin_users_includes_null_slot(self):
+        from bot.memory import _connection, iter_due_checkin_users
+
+        for user_id in range(1, 4):
+            register_user(user_id, 1000 + user_id)
+        update_last_checkin_slot(2, "night")
+        with _connection() as conn:
+            conn.execute("UPDATE users SET last_checkin_slot = NULL WHERE user_id = 1")
+            conn.commit()
+
+        chunks = list(iter_due_checkin_users("morning", chunk_size=2))
+
+        assert sorted(u["user_id"] for chunk in chunks for u in chunk) == [1, 2, 3]
+
+    def test_due_query_uses_partial_index(self):
+        from bot.memory import _connection
+
+        with _connection() as conn:
+            plan = conn.execute(
+                """
+                EXPLAIN QUERY PLAN
+                SELECT user_id FROM users
+                WHERE checkin_enabled = 1 AND coalesce(last_checkin_slot, '') = ? AND user_id > ?
+                ORDER BY user_id LIMIT 10
+                """,
+                ("", 0),
+            ).fetchall()
+        assert any("idx_users_checkin_due" in row["detail"] for row in plan)
+
+
+class TestUnitOfWork:
+    def test_groups_writes_into_one_commit(self):
+        from bot.memory import unit_of_work
+
+        with unit_of_work():
+            register_user(1, 1001)
+            save_message(1, "user", "Hello")
+            save_message(1, "assistant", "Hi there")
+
+        assert len(get_recent_messages(1)) == 2
+
+    def test_rolls_back_all_writes_on_error(self):
+        from bot.memory import unit_of_work
+
+        with pytest.raises(RuntimeError):
+            with unit_of_work():
+                register_user(1, 1001)
+                save_message(1, "user", "Never stored")
+                raise RuntimeError("boom")
+
+        assert get_recent_messages(1) == []
+        assert get_all_checkin_users() == []
+
+    def test_on_commit_runs_after_commit_only(self):
+        from bot.memory import unit_of_work, on_commit
+
+        calls = []
+        with unit_of_work():
+            register_user(1, 1001)
+            on_commit(lambda: calls.append(len(get_recent_messages(1))))
+            save_message(1, "user", "Hello")
+            assert calls == []
+
+        assert calls == [1]
+
+        with pytest.raises(RuntimeError):
+            with unit_of_work():
+                on_commit(lambda: calls.append("rolled back"))
+                raise RuntimeError("boom")
+        assert calls == [1]
+
+
+class TestWriteBehind:
+    def test_failed_put_raises_and_skips_cache(self, monkeypatch):
+        import bot.memory as memory
+        from bot.memory import unit_of_work
+
+        def full_and_failing(row):
+            raise sqlite3.OperationalError("disk I/O error")
+
+        monkeypatch.setattr(memory, "MESSAGE_WRITE_BEHIND", True)
+        monkeypatch.setattr(memory._message_writer, "put", full_and_failing)
+        register_user(1, 1001)
+        get_recent_messages(1)
+
+        with pytest.raises(sqlite3.OperationalError):
+            save_message(1, "user", "Lost")
+        with pytest.raises(sqlite3.OperationalError):
+            with unit_of_work():
+                save_message(1, "user", "Also lost")
+
+        assert get_recent_messages(1) == []
+
+    def test_buffered_messages_are_readable_before_flush(self, monkeypatch):
+        import bot.memory as memory
+
+        monkeypatch.setattr(memory, "MESSAGE_WRITE_BEHIND", True)
+        register_user(1, 1001)
+        save_message(1, "user", "First")
+        save_message(1, "assistant", "Reply")
+
+        messages = get_recent_messages(1)
+        assert [m["content"] for m in messages] == ["First", "Reply"]
+        assert memory.get_ritual_state(1)["user_message_count"] == 1
+
+        memory.flush_pending_messages()
+        assert memory.get_write_behind_stats()["pending"] == 0
+        assert [m["content"] for m in get_recent_messages(1)] == ["First", "Reply"]
+        assert memory.get_ritual_state(1)["user_message_count"] == 1
+
+
+class TestRecentMessageCache:
+    def test_saves_are_served_from_cache(self):
+        from bot.memory import get_context_cache_stats
+
+        register_user(1, 1001)
+        get_recent_messages(1)
+        misses = get_context_cache_stats()["misses"]
+
+        save_message(1, "user", "Hello")
+        save_message(1, "assistant", "Hi")
+        messages = get_recent_messages(1)
+
+        assert [m["content"] for m in messages] == ["Hello", "Hi"]
+        assert get_context_cache_stats()["misses"] == misses
+
+    def test_rows_written_by_another_process_are_seen(self):
+        from bot.memory import _connection, get_recent_messages_bulk
+        import time
+
+        register_user(1, 1001)
+        save_message(1, "user", "Hello")
+        get_recent_messages(1)
+        # Simulates another worker writing to the shared database.
+        with _connection() as conn:
+            conn.execute(
+                "INSERT INTO messages (user_id, role, content, created_at) VALUES (1, 'assistant', 'Elsewhere', ?)",
+                (time.time(),),
+            )
+            conn.commit()
+
+        assert [m["content"] for m in get_recent_messages(1)] == ["Hello", "Elsewhere"]
+        save_message(1, "user", "Again")
+        with _connection() as conn:
+            conn.execute(
+                "INSERT INTO messages (user_id, role, content, created_at) VALUES (1, 'assistant', 'Later', ?)",
+                (time.time(),),
+            )
+            conn.commit()
+        bulk = get_recent_messages_bulk([1])
+        assert [m["content"] for m in bulk[1]] == ["Hello", "Elsewhere", "Again", "Later"]
+
+
+class TestBulkRecentMessages:
+    def test_returns_tail_per_user_in_order(self):
+        from bot.memory import get_recent_messages_bulk
+
+        for user_id in (1, 2, 3):
+            register_user(user_id, 1000 + user_id)
+        for i in range(12):
+            save_message(1, "user", f"u1-{i}")
+        save_message(2, "user", "u2-only")
+
+        result = get_recent_messages_bulk([1, 2, 3], limit=8)
+
+        assert [m["content"] for m in result[1]] == [f"u1-{i}" for i in range(4, 12)]
+        assert [m["content"] for m in result[2]] == ["u2-only"]
+        assert result[3] == []
+
+    def test_uses_cached_windows(self):
+        from bot.memory import get_recent_messages_bulk, invalidate_recent_messages
+
+        register_user(1, 1001)
+        save_message(1, "user", "stored")
+        invalidate_recent_messages()
+        get_recent_messages(1)
+
+        result = get_recent_messages_bulk([1], limit=8)
+        assert [m["content"] for m in result[1]] == ["stored"]
@@ -2,6 +2,8 @@ import os
 import tempfile
 from unittest.mock import MagicMock
 
+import pytest
+
 # Configure env before importing project modules.
 _tmp_db = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
 os.environ["CALMNEST_DB_PATH"] = _tmp_db.name
@@ -18,8 +20,9 @@ def setup_function():
 
 
 def teardown_function():
-    from bot.memory import _get_connection
+    from bot.memory import _get_connection, invalidate_recent_messages
 
+    invalidate_recent_messages()
     conn = _get_connection()
     try:
         conn.execute("PRAGMA foreign_keys=OFF")
@@ -102,3 +105,35 @@ def test_build_generation_metadata_includes_relational_hints():
     assert "relational_hints" in metadata
     joined = "\n".join(metadata["relational_hints"])
     assert "work" in joined.lower()
+
+
+@pytest.mark.asyncio
+async def test_async_save_and_context_match_sync_behaviour():
+    register_user(6, 6006, first_name="Mira", username="")
+    provider = MemoryProvider()
+    provider.super_enabled = False
+
+    await provider.save_async(6, "user", "I am stressed about exams", chat_id=6006)
+    context = await provider.get_context_async(6, latest_user_text="exams")
+    metadata = await provider.build_generation_metadata_async(6, latest_user_text="exams")
+
+    assert context[0]["role"] == "system"
+    assert context[-1]["content"] == "I am stressed about exams"
+    assert any("exams" in hint for hint in metadata["relational_hints"])
+
+
+def test_get_context_uses_local_recall_when_supermemory_disabled():
+    from bot.memory import RECENT_MESSAGE_LIMIT
+
+    register_user(7, 7007)
+    provider = MemoryProvider()
+    provider.super_enabled = False
+    provider.recall_mode = "fallback"
+
+    provider.save(7, "user", "Journaling before bed calms my mind", chat_id=7007)
+    for i in range(RECENT_MESSAGE_LIMIT):
+        provider.save(7, "assistant", f"noted {i}", chat_id=7007)
+    context = provider.get_context(7, latest_user_text="should I try journaling again?")
+
+    assert context[0]["role"] == "system"
+    assert "Journaling before bed" in context[0]["content"]
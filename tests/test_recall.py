@@ -0,0 +1,83 @@
+import os
+import tempfile
+
+_tmp_db = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+os.environ["CALMNEST_DB_PATH"] = _tmp_db.name
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test-token-123")
+os.environ.setdefault("GROQ_API_KEY", "test-groq-key-123")
+
+from bot.memory import RECENT_MESSAGE_LIMIT, init_db, register_user, save_message
+from bot.recall import LocalRecall, build_match_query
+
+
+def setup_function():
+    init_db()
+
+
+def teardown_function():
+    from bot.memory import _get_connection, invalidate_recent_messages
+
+    invalidate_recent_messages()
+    conn = _get_connection()
+    try:
+        conn.execute("PRAGMA foreign_keys=OFF")
+        conn.execute("DELETE FROM relational_memory")
+        conn.execute("DELETE FROM user_ritual_state")
+        conn.execute("DELETE FROM messages")
+        conn.execute("DELETE FROM users")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _fill_recent_window(user_id: int):
+    for i in range(RECENT_MESSAGE_LIMIT):
+        save_message(user_id, "user", f"filler message {i}")
+
+
+def test_build_match_query_scopes_to_user_and_drops_stopwords():
+    query = build_match_query(42, "I am so worried about my exams")
+
+    assert query.startswith("user_key:u42 AND ")
+    assert '"worried"' in query and '"exams"' in query
+    assert '"about"' not in query
+    assert build_match_query(42, "ok and the") == ""
+
+
+def test_finds_older_messages_ranked_by_relevance():
+    register_user(1, 1001)
+    save_message(1, "user", "Evening walks by the river help me sleep")
+    save_message(1, "user", "Work was busy today")
+    _fill_recent_window(1)
+
+    results = LocalRecall().search(1, "I could not sleep last night")
+
+    assert results == ["[user] Evening walks by the river help me sleep"]
+
+
+def test_does_not_return_other_users_or_recent_window():
+    register_user(1, 1001)
+    register_user(2, 1002)
+    save_message(2, "user", "My sleep has been terrible")
+    _fill_recent_window(2)
+    save_message(1, "user", "Sleep is fine lately")
+
+    assert LocalRecall().search(1, "sleep") == []
+
+
+def test_index_follows_deletes():
+    from bot.memory import _connection
+
+    register_user(1, 1001)
+    save_message(1, "user", "Panic attacks on the train")
+    _fill_recent_window(1)
+    recall = LocalRecall()
+    assert recall.search(1, "train panic")
+
+    with _connection() as conn:
+        conn.execute("DELETE FROM messages WHERE content LIKE 'Panic%'")
+        conn.commit()
+
+    assert recall.search(1, "train panic") == []
+    assert recall.stats()["queries"] == 2
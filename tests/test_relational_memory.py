@@ -23,8 +23,9 @@ def setup_function():
 
 
 def teardown_function():
-    from bot.memory import _get_connection
+    from bot.memory import _get_connection, invalidate_recent_messages
 
+    invalidate_recent_messages()
     conn = _get_connection()
     try:
         conn.execute("PRAGMA foreign_keys=OFF")
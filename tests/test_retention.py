@@ -0,0 +1,103 @@
+import os
+import tempfile
+import time
+
+_tmp_db = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+os.environ["CALMNEST_DB_PATH"] = _tmp_db.name
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test-token-123")
+os.environ.setdefault("GROQ_API_KEY", "test-groq-key-123")
+
+from bot.memory import (
+    RECENT_MESSAGE_LIMIT,
+    init_db,
+    register_user,
+    save_message,
+    get_recent_messages,
+)
+from bot.retention import RetentionEngine, read_archived_messages
+
+
+def setup_function():
+    init_db()
+
+
+def teardown_function():
+    from bot.memory import _get_connection, invalidate_recent_messages
+
+    invalidate_recent_messages()
+    conn = _get_connection()
+    try:
+        conn.execute("PRAGMA foreign_keys=OFF")
+        conn.execute("DELETE FROM messages_archive")
+        conn.execute("DELETE FROM relational_memory")
+        conn.execute("DELETE FROM user_ritual_state")
+        conn.execute("DELETE FROM messages")
+        conn.execute("DELETE FROM users")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _hot_count(user_id: int) -> int:
+    from bot.memory import _connection
+
+    with _connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM messages WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+
+def test_archives_rows_beyond_per_user_cap():
+    register_user(901, 9901)
+    total = RECENT_MESSAGE_LIMIT + 15
+    for i in range(total):
+        save_message(901, "user", f"m{i}")
+
+    archived = RetentionEngine(keep_messages=RECENT_MESSAGE_LIMIT, max_age_days=0, batch_rows=4).run()
+
+    assert archived == 15
+    assert _hot_count(901) == RECENT_MESSAGE_LIMIT
+    assert [m["content"] for m in read_archived_messages(901)] == [f"m{i}" for i in range(15)]
+    assert get_recent_messages(901)[0]["content"] == "m15"
+
+
+def test_age_limit_never_touches_recent_window():
+    from bot.memory import _connection
+
+    register_user(902, 9902)
+    for i in range(RECENT_MESSAGE_LIMIT + 5):
+        save_message(902, "user", f"m{i}")
+    old = time.time() - 400 * 24 * 60 * 60
+    with _connection() as conn:
+        conn.execute("UPDATE messages SET created_at = created_at - ? WHERE user_id = 902", (time.time() - old,))
+        conn.commit()
+
+    archived = RetentionEngine(keep_messages=10_000, max_age_days=30).run()
+
+    assert archived == 5
+    assert _hot_count(902) == RECENT_MESSAGE_LIMIT
+
+
+def test_noop_when_under_limits():
+    register_user(903, 9903)
+    save_message(903, "user", "hello")
+
+    engine = RetentionEngine(keep_messages=100, max_age_days=30)
+    assert engine.run() == 0
+    assert engine.stats()["runs"] == 1
+    assert read_archived_messages(903) == []
+
+
+def test_archived_messages_are_pruned_from_vector_store():
+    from bot.vector_store import VectorStore
+
+    register_user(905, 9905)
+    created = [save_message(905, "user", f"m{i}") for i in range(RECENT_MESSAGE_LIMIT + 3)]
+    with tempfile.TemporaryDirectory() as root:
+        store = VectorStore(root=root, dim=64)
+        store.add_many(905, [(ts, f"m{i}") for i, ts in enumerate(created)])
+
+        engine = RetentionEngine(keep_messages=RECENT_MESSAGE_LIMIT, max_age_days=0, vectors=store)
+        assert engine.run() == 3
+
+        assert store.indexed_keys(905) == set(created[3:])
+        assert engine.stats()["pruned_vectors"] == 3
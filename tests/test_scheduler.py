@@ -54,3 +54,101 @@ class TestGetCurrentSlot:
     def test_boundary_night_start(self, mock_dt):
         mock_dt.now.return_value = datetime(2025, 1, 1, 21, 0)
         assert get_current_slot() == "night"
+
+
+class TestSendCheckins:
+    @pytest.mark.asyncio
+    @patch("bot.scheduler.get_current_slot", return_value="morning")
+    async def test_fetches_history_once_per_batch(self, _mock_slot):
+        from unittest.mock import AsyncMock, MagicMock
+        from bot import scheduler
+
+        users = [
+            {"user_id": i, "chat_id": 100 + i, "first_name": "", "username": "", "last_checkin_slot": ""}
+            for i in (0, 2, 3, 4)
+        ]
+        batches = [users[:2], users[2:]]
+        due = MagicMock(return_value=iter(batches))
+        bulk = MagicMock(side_effect=lambda ids, limit: {i: [] for i in ids})
+        mark = MagicMock()
+        bot = MagicMock()
+        bot.send_message = AsyncMock()
+
+        with patch.object(scheduler, "iter_due_checkin_users", due), \
+                patch.object(scheduler, "get_recent_messages_bulk", bulk), \
+                patch.object(scheduler, "update_last_checkin_slot_bulk", mark), \
+                patch.object(scheduler, "CHECKIN_LLM_BATCH_SIZE", 1), \
+                patch.object(scheduler, "CHECKIN_PREGEN_ENABLED", False), \
+                patch.object(scheduler, "generate_checkin_message_async", AsyncMock(return_value="hi")):
+            await scheduler.send_checkins(bot)
+
+        due.assert_called_once_with("morning", scheduler.CHECKIN_BATCH_SIZE)
+        assert bulk.call_count == 2
+        assert bot.send_message.await_count == 4
+        marked = [uid for call in mark.call_args_list for uid in call.args[0]]
+        assert marked == [0, 2, 3, 4]
+
+    @pytest.mark.asyncio
+    @patch("bot.scheduler.get_current_slot", return_value="night")
+    async def test_batches_generation_and_falls_back_per_user(self, _mock_slot):
+        from unittest.mock import AsyncMock, MagicMock
+        from bot import checkin_pool, scheduler
+
+        users = [
+            {"user_id": i, "chat_id": 100 + i, "first_name": f"U{i}", "username": "", "last_checkin_slot": ""}
+            for i in range(5)
+        ]
+        bulk = MagicMock(side_effect=lambda ids, limit: {i: [] for i in ids})
+        batch_gen = AsyncMock(side_effect=[["one", "", "three"], RuntimeError("upstream down")])
+        single_gen = AsyncMock(return_value="single")
+        bot = MagicMock()
+        bot.send_message = AsyncMock()
+
+        with patch.object(scheduler, "iter_due_checkin_users", MagicMock(return_value=iter([users]))), \
+                patch.object(scheduler, "get_recent_messages_bulk", bulk), \
+                patch.object(scheduler, "update_last_checkin_slot_bulk", MagicMock()), \
+                patch.object(scheduler, "CHECKIN_LLM_BATCH_SIZE", 3), \
+                patch.object(checkin_pool, "CHECKIN_LLM_BATCH_SIZE", 3), \
+                patch.object(scheduler, "CHECKIN_PREGEN_ENABLED", False), \
+                patch.object(checkin_pool, "generate_checkin_messages_batch_async", batch_gen), \
+                patch.object(scheduler, "generate_checkin_message_async", single_gen):
+            await scheduler.send_checkins(bot)
+
+        assert batch_gen.await_count == 2
+        assert [len(call.args[1]) for call in batch_gen.await_args_list] == [3, 2]
+        single_gen.assert_not_awaited()
+        fallback = scheduler.FALLBACK_BY_SLOT["night"]
+        sent = [call.kwargs["text"] for call in bot.send_message.await_args_list]
+        assert sent == ["one", fallback, "three", fallback, fallback]
+
+    @pytest.mark.asyncio
+    @patch("bot.scheduler.get_current_slot", return_value="evening")
+    async def test_pooled_messages_skip_generation(self, _mock_slot):
+        from unittest.mock import AsyncMock, MagicMock
+        from bot import scheduler
+
+        users = [
+            {"user_id": i, "chat_id": 100 + i, "first_name": "", "username": "", "last_checkin_slot": ""}
+            for i in range(3)
+        ]
+        pool = MagicMock()
+        pool.take = AsyncMock(return_value={0: "pooled zero", 2: "pooled two"})
+        bulk = MagicMock(side_effect=lambda ids, limit: {i: [] for i in ids})
+        single_gen = AsyncMock(return_value="inline")
+        bot = MagicMock()
+        bot.send_message = AsyncMock()
+
+        with patch.object(scheduler, "iter_due_checkin_users", MagicMock(return_value=iter([users]))), \
+                patch.object(scheduler, "get_recent_messages_bulk", bulk), \
+                patch.object(scheduler, "update_last_checkin_slot_bulk", MagicMock()), \
+                patch.object(scheduler, "CHECKIN_LLM_BATCH_SIZE", 1), \
+                patch.object(scheduler, "CHECKIN_PREGEN_ENABLED", True), \
+                patch.object(scheduler, "checkin_pool", pool), \
+                patch.object(scheduler, "generate_checkin_message_async", single_gen):
+            await scheduler.send_checkins(bot)
+
+        pool.take.assert_awaited_once_with([0, 1, 2], "evening")
+        assert bulk.call_args.args[0] == [1]
+        single_gen.assert_awaited_once()
+        sent = [call.kwargs["text"] for call in bot.send_message.await_args_list]
+        assert sent == ["pooled zero", "inline", "pooled two"]
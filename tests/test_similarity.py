@@ -0,0 +1,39 @@
+import os
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test-token-123")
+os.environ.setdefault("GROQ_API_KEY", "test-groq-key-123")
+
+from bot.ai import _apply_quality_refinement
+from bot.similarity import ReplySimilarity, minhash
+
+REPLY = "I hear you. It sounds like work has been really heavy this week. Maybe try one small break today."
+
+
+def test_minhash_is_deterministic_and_ignores_case_and_spacing():
+    assert minhash("") is None
+    assert (minhash(REPLY) == minhash("  " + REPLY.upper().replace(" ", "   "))).all()
+
+
+def test_similarity_separates_near_duplicates_from_different_replies():
+    similarity = ReplySimilarity()
+    assert similarity.similarity(REPLY, REPLY) == 1.0
+    assert similarity.similarity(REPLY, REPLY.replace("this week", "lately")) > 0.82
+    assert similarity.similarity(REPLY, "Sleep has been hard lately. What helps you wind down at night?") < 0.4
+    assert similarity.similarity(REPLY, "") == 0.0
+
+
+def test_signatures_are_cached_per_reply_text():
+    similarity = ReplySimilarity(cache_size=2)
+    similarity.max_similarity(REPLY, ["first older reply", "second older reply"])
+    similarity.max_similarity(REPLY, ["second older reply"])
+    stats = similarity.stats()
+    assert stats["cached_signatures"] == 2
+    assert stats["hit_rate"] > 0
+    assert stats["comparisons"] == 3
+
+
+def test_refinement_checks_older_replies_not_just_the_last_one():
+    previous = ["Want to talk about your weekend plans?", REPLY]
+    refined, scores = _apply_quality_refinement(REPLY, "long", "work again", previous_replies=previous)
+    assert refined.startswith("Thank you for sharing that.")
+    assert scores["repetition_penalty"] > 0
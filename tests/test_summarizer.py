@@ -0,0 +1,139 @@
+import os
+import tempfile
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+_tmp_db = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+os.environ["CALMNEST_DB_PATH"] = _tmp_db.name
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test-token-123")
+os.environ.setdefault("GROQ_API_KEY", "test-groq-key-123")
+
+from bot.memory import (
+    get_conversation_summary,
+    get_summary_candidates,
+    init_db,
+    register_user,
+    save_message,
+)
+from bot.memory_provider import MemoryProvider
+from bot.summarizer import RollingSummarizer
+
+
+def setup_function():
+    init_db()
+
+
+def teardown_function():
+    from bot.memory import _get_connection, invalidate_recent_messages
+
+    invalidate_recent_messages()
+    conn = _get_connection()
+    try:
+        conn.execute("PRAGMA foreign_keys=OFF")
+        conn.execute("DELETE FROM conversation_summaries")
+        conn.execute("DELETE FROM relational_memory")
+        conn.execute("DELETE FROM user_ritual_state")
+        conn.execute("DELETE FROM messages")
+        conn.execute("DELETE FROM users")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _add_turns(user_id: int, count: int):
+    for i in range(count):
+        save_message(user_id, "user" if i % 2 == 0 else "assistant", f"turn {i}")
+
+
+@pytest.mark.asyncio
+async def test_fold_summarizes_oldest_turns_and_keeps_raw_tail():
+    register_user(user_id=1, chat_id=10)
+    _add_turns(1, 30)
+    summarizer = RollingSummarizer(raw_turns=5, fold_turns=10)
+
+    with patch("bot.summarizer.summarize_conversation_async", new=AsyncMock(return_value="User talked about work.")) as fake:
+        assert await summarizer.run() == 1
+        folded = fake.call_args.args[1]
+
+    # 25 foldable turns, capped at 2 * fold_turns per call.
+    assert [t["content"] for t in folded] == [f"turn {i}" for i in range(20)]
+    summary = get_conversation_summary(1)
+    assert summary["summary"] == "User talked about work."
+    assert summary["folded_count"] == 20
+    assert summary["covered_until"] == folded[-1]["created_at"]
+
+    # Only 10 unsummarized turns remain: below raw + fold, so nothing is due.
+    assert get_summary_candidates(15) == []
+    assert await summarizer.fold(1) == 0
+
+
+@pytest.mark.asyncio
+async def test_fold_passes_previous_summary_forward():
+    register_user(user_id=2, chat_id=20)
+    _add_turns(2, 16)
+    summarizer = RollingSummarizer(raw_turns=2, fold_turns=4)
+    fake = AsyncMock(side_effect=["first summary", "second summary"])
+
+    with patch("bot.summarizer.summarize_conversation_async", new=fake):
+        await summarizer.fold(2)
+        await summarizer.fold(2)
+
+    assert fake.call_args_list[1].args[0] == "first summary"
+    assert get_conversation_summary(2)["summary"] == "second summary"
+    assert summarizer.stats()["folded_turns"] == 14
+
+
+@pytest.mark.asyncio
+async def test_later_runs_only_look_at_active_users_and_unfinished_backlogs():
+    import time
+
+    for user_id in (3, 4):
+        register_user(user_id=user_id, chat_id=10 * user_id)
+        _add_turns(user_id, 20)
+    assert get_summary_candidates(6, active_since=time.time() + 60) == []
+    summarizer = RollingSummarizer(raw_turns=2, fold_turns=4)
+    fake = AsyncMock(return_value="summary")
+
+    with patch("bot.summarizer.summarize_conversation_async", new=fake):
+        assert await summarizer.run() == 2  # 18 foldable: 8 folded, 10 left over
+        assert summarizer.stats()["backlog"] == 2
+        assert await summarizer.run() == 2  # nobody wrote, but both backlogs continue
+        assert await summarizer.run() == 0  # 2 left each: below fold_turns
+
+    assert fake.await_count == 4
+    assert summarizer.stats()["backlog"] == 0
+
+
+def test_context_uses_summary_plus_recent_turns():
+    register_user(user_id=3, chat_id=30)
+    _add_turns(3, 40)
+    from bot.memory import get_messages_after, save_conversation_summary
+
+    turns = get_messages_after(3, 0, 30)
+    save_conversation_summary(3, "Earlier they discussed exams.", turns[-1]["created_at"], len(turns))
+
+    provider = MemoryProvider()
+    provider.summaries_enabled = True
+    context = provider.get_context(3, latest_user_text="turn 39")
+
+    assert context[0]["role"] == "system"
+    assert context[0]["content"].endswith("Earlier they discussed exams.")
+    assert [m["content"] for m in context[1:]] == [f"turn {i}" for i in range(28, 40)]
+
+
+@pytest.mark.asyncio
+async def test_failed_fold_is_retried_on_the_next_run():
+    register_user(user_id=5, chat_id=50)
+    _add_turns(5, 8)
+    summarizer = RollingSummarizer(raw_turns=2, fold_turns=4)
+    fake = AsyncMock(side_effect=[RuntimeError("rate limited"), "summary"])
+
+    with patch("bot.summarizer.summarize_conversation_async", new=fake):
+        assert await summarizer.run() == 0
+        assert summarizer.stats()["backlog"] == 1
+        assert await summarizer.run() == 1  # nobody wrote since, but the failed user is retried
+
+    assert summarizer.stats()["errors"] == 1
+    assert get_conversation_summary(5)["summary"] == "summary"
@@ -0,0 +1,47 @@
+from bot.text_analysis import analyze, analyze_batch
+
+
+def test_emotional_state_follows_priority_order():
+    assert analyze("I feel exhausted and lonely").emotional_state == "overwhelmed"
+    assert analyze("I can't handle this").emotional_state == "overwhelmed"
+    assert analyze("No one called, I'm sad").emotional_state == "lonely"
+    assert analyze("Feeling downright okay").emotional_state == "neutral"
+    assert analyze("").emotional_state == "neutral"
+
+
+def test_response_intent_and_length_keywords_match_whole_words_only():
+    assert analyze("What should I do next?").response_intent == "concrete_next_step"
+    assert analyze("I've been thinking").response_intent == "validation_first"
+    assert analyze("Why though?").response_intent == "reflective_summary"
+    assert analyze("Nice weather").response_intent == "gentle_reframe"
+    assert analyze("tl;dr please").asks_short
+    assert not analyze("tl ; dr please").asks_short
+    assert analyze("walk me through it step by step").asks_long
+    assert not analyze("the details matter").asks_long
+
+
+def test_names_facts_and_themes_are_extracted_in_one_pass():
+    features = analyze(
+        "Hi, I'm Sam but call me Sammy. I'm stressed about exams. I finally rested all weekend. "
+        "It helps when I go for walks. Please don't rush me"
+    )
+    assert features.self_name == "Sam"
+    assert features.stated_name == "Sammy"
+    assert features.stressor == "exams"
+    assert features.win == "rested all weekend"
+    assert features.coping_preference == "go for walks"
+    assert features.boundary == "rush me"
+    assert features.life_themes == ("sleep", "studies")
+
+
+def test_life_themes_match_inside_words():
+    assert analyze("My parents visited").life_themes == ("family", "finances")
+    assert analyze("Homework again").life_themes == ("work", "family")
+
+
+def test_analyze_batch_keeps_order_and_matches_analyze():
+    texts = ["I am so anxious", None, "help me plan", "I am so anxious"]
+    results = analyze_batch(texts)
+    assert [r.emotional_state for r in results] == ["anxious", "neutral", "neutral", "anxious"]
+    assert results[2] == analyze("help me plan")
+    assert results[0] is results[3]
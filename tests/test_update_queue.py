@@ -0,0 +1,152 @@
+import asyncio
+import os
+
+import pytest
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test-token-123")
+os.environ.setdefault("GROQ_API_KEY", "test-groq-key-123")
+
+from bot.update_queue import KeyedSerialExecutor, UpdateQueue
+
+
+@pytest.mark.asyncio
+async def test_workers_cap_concurrency_and_drain_finishes_queued_updates():
+    running = 0
+    peak = 0
+    done = []
+
+    async def process(update):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        done.append(update)
+
+    queue = UpdateQueue(process, maxsize=10, workers=2)
+    queue.start()
+    assert all(queue.submit(i) for i in range(6))
+    assert queue.stats()["queue_depth"] == 6
+
+    await queue.drain(timeout=5)
+
+    assert sorted(done) == list(range(6))
+    assert peak == 2
+    stats = queue.stats()
+    assert stats["processed"] == 6 and stats["queue_depth"] == 0
+    assert not queue.submit(99)
+
+
+@pytest.mark.asyncio
+async def test_full_queue_refuses_updates_and_errors_do_not_stop_workers():
+    release = asyncio.Event()
+    seen = []
+
+    async def process(update):
+        await release.wait()
+        seen.append(update)
+        if update == 0:
+            raise RuntimeError("boom")
+
+    queue = UpdateQueue(process, maxsize=2, workers=1)
+    queue.start()
+    assert queue.submit(0)
+    await asyncio.sleep(0)  # the worker picks up update 0 and blocks
+    assert queue.submit(1) and queue.submit(2)
+    assert not queue.submit(3)
+
+    release.set()
+    await queue.drain(timeout=5)
+
+    assert seen == [0, 1, 2]
+    stats = queue.stats()
+    assert (stats["rejected"], stats["errors"], stats["processed"]) == (1, 1, 2)
+
+
+class _User:
+    def __init__(self, user_id):
+        self.id = user_id
+
+
+class _Update:
+    def __init__(self, user_id, n):
+        self.effective_user = _User(user_id)
+        self.n = n
+
+
+@pytest.mark.asyncio
+async def test_same_user_runs_in_order_while_users_run_in_parallel():
+    log = []
+    running = set()
+    overlap = []
+
+    async def process(update):
+        uid = update.effective_user.id
+        assert uid not in running, "same user ran concurrently"
+        running.add(uid)
+        overlap.append(len(running))
+        await asyncio.sleep(0.01 if update.n == 0 else 0)
+        log.append((uid, update.n))
+        running.discard(uid)
+
+    executor = KeyedSerialExecutor(process)
+    queue = UpdateQueue(executor.submit, maxsize=20, workers=4)
+    queue.start()
+    for n in range(3):
+        queue.submit(_Update(1, n))
+        queue.submit(_Update(2, n))
+    await queue.drain(timeout=5)
+
+    assert [n for uid, n in log if uid == 1] == [0, 1, 2]
+    assert [n for uid, n in log if uid == 2] == [0, 1, 2]
+    assert max(overlap) == 2
+    stats = executor.stats()
+    assert stats["processed"] == 6
+    assert stats["deferred"] == 4
+    assert stats["active_keys"] == 0  # idle users are evicted
+    assert queue.stats()["busy_workers"] == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_update_does_not_block_the_users_later_updates():
+    done = []
+
+    async def process(update):
+        await asyncio.sleep(0)
+        if update.n == 0:
+            raise RuntimeError("boom")
+        done.append(update.n)
+
+    executor = KeyedSerialExecutor(process)
+    await asyncio.gather(*(executor.submit(_Update(7, n)) for n in range(3)))
+
+    assert done == [1, 2]
+    assert executor.stats()["errors"] == 1
+    assert executor.stats()["active_keys"] == 0
+
+
+@pytest.mark.asyncio
+async def test_chatty_user_is_refused_once_their_backlog_is_full():
+    release = asyncio.Event()
+
+    async def process(update):
+        await release.wait()
+
+    executor = KeyedSerialExecutor(process, max_pending=2)
+    queue = UpdateQueue(executor.submit, maxsize=20, workers=4)
+    queue.start()
+    accepted = []
+    for update in (_Update(1, 0), _Update(1, 1), _Update(1, 2), _Update(2, 0)):
+        if executor.admit(update):
+            assert queue.submit(update)
+            accepted.append((update.effective_user.id, update.n))
+
+    assert accepted == [(1, 0), (1, 1), (2, 0)]
+    await asyncio.sleep(0)
+    release.set()
+    await queue.drain(timeout=5)
+
+    stats = executor.stats()
+    assert stats["refused"] == 1 and stats["processed"] == 3
+    # Once handled, the user's backlog is free again.
+    assert executor.admit(_Update(1, 3))
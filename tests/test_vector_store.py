@@ -0,0 +1,107 @@
+import os
+import tempfile
+
+_tmp_db = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+os.environ["CALMNEST_DB_PATH"] = _tmp_db.name
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test-token-123")
+os.environ.setdefault("GROQ_API_KEY", "test-groq-key-123")
+
+import numpy as np
+
+from bot.memory import RECENT_MESSAGE_LIMIT, init_db, register_user, save_message
+from bot.vector_store import HashingEmbedder, VectorStore, backfill, vector_recall
+
+
+def setup_function():
+    init_db()
+
+
+def teardown_function():
+    from bot.memory import _get_connection, invalidate_recent_messages
+
+    invalidate_recent_messages()
+    conn = _get_connection()
+    try:
+        conn.execute("PRAGMA foreign_keys=OFF")
+        conn.execute("DELETE FROM relational_memory")
+        conn.execute("DELETE FROM user_ritual_state")
+        conn.execute("DELETE FROM messages")
+        conn.execute("DELETE FROM users")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_embedder_is_normalized_and_deterministic():
+    embedder = HashingEmbedder(dim=128)
+    first = embedder.embed("Trouble sleeping before my exams")
+    second = embedder.embed("Trouble sleeping before my exams")
+    assert first.dtype == np.float32
+    assert np.allclose(first, second)
+    assert abs(float(np.linalg.norm(first)) - 1.0) < 1e-5
+    assert not embedder.embed("").any()
+
+
+def test_search_ranks_similar_messages_first():
+    with tempfile.TemporaryDirectory() as root:
+        store = VectorStore(root=root, dim=256)
+        store.add(1, 1.0, "my sister visited and we cooked dinner together")
+        store.add(1, 2.0, "I could not sleep because of the exam tomorrow")
+        store.add(1, 3.0, "the weather was nice on my walk")
+        store.add(2, 4.0, "I could not sleep because of the exam tomorrow")
+
+        hits = store.search(1, "exam stress, could not sleep", limit=2)
+        assert hits[0][0] == 2.0
+        assert all(score >= store.min_score for _key, score in hits)
+        assert store.search(1, "exam", before=2.0) == []
+        assert store.indexed_keys(2) == {4.0}
+        assert store.stats()["queries"] == 2
+
+
+def test_search_ignores_torn_append():
+    with tempfile.TemporaryDirectory() as root:
+        store = VectorStore(root=root, dim=64)
+        store.add(5, 1.0, "missing my family at home")
+        vec_path, _key_path = store._paths(5)
+        with open(vec_path, "ab") as fh:
+            fh.write(b"\x00" * (4 * store.dim))
+        assert store.indexed_keys(5) == {1.0}
+        assert store.search(5, "family home")[0][0] == 1.0
+
+
+def test_maps_are_reused_until_files_change_and_prune_drops_rows():
+    with tempfile.TemporaryDirectory() as root:
+        store = VectorStore(root=root, dim=64)
+        store.add(3, 1.0, "long shifts at the hospital")
+        store.add(3, 2.0, "my dog is finally home from the vet")
+
+        store.search(3, "hospital shifts")
+        store.search(3, "dog vet")
+        assert store.stats()["map_opens"] == 1
+
+        store.add(3, 3.0, "hospital shifts again tonight")
+        assert store.search(3, "hospital shifts", limit=3)[0][0] in (1.0, 3.0)
+        assert store.stats()["map_opens"] == 2
+
+        assert store.prune(3, [1.0, 3.0, 99.0]) == 2
+        assert store.indexed_keys(3) == {2.0}
+        assert store.search(3, "hospital shifts") == []
+        assert store.search(3, "dog vet")[0][0] == 2.0
+        assert store.prune(3, [1.0]) == 0
+        assert store.stats()["pruned"] == 2
+
+
+def test_vector_recall_skips_recent_window_and_backfill_is_idempotent():
+    register_user(user_id=7, chat_id=70)
+    save_message(7, "user", "Last winter my grandmother taught me to bake bread")
+    for i in range(RECENT_MESSAGE_LIMIT):
+        save_message(7, "user", f"baking bread again {i}")
+
+    with tempfile.TemporaryDirectory() as root:
+        store = VectorStore(root=root, dim=256)
+        assert backfill(store) == RECENT_MESSAGE_LIMIT + 1
+        assert backfill(store) == 0
+
+        snippets = vector_recall(store, 7, "grandmother bread baking")
+        assert snippets == ["[user] Last winter my grandmother taught me to bake bread"]